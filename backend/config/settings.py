@@ -29,12 +29,40 @@ class Settings:
     # Security
     SECRET_KEY = os.getenv("SECRET_KEY", "kalpana-super-secret-key-change-in-prod")
     ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "") # Should be set in .env
+    SECURITY_WORKERS = int(os.getenv("SECURITY_WORKERS", 4))  # File event workers
+    SECURITY_DEBOUNCE = float(os.getenv("SECURITY_DEBOUNCE", 0.5))  # Seconds repeated events for one file are merged
     
     # AI / LLM
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
     LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-r1:1.5b")
     LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "http://localhost:11434") # Ollama default
     
+    # Email (outbound SMTP; leave SMTP_HOST empty for local-only demo mode)
+    SMTP_HOST = os.getenv("SMTP_HOST", "")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+    SMTP_USER = os.getenv("SMTP_USER", "")
+    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+    SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "True").lower() == "true"
+    SMTP_FROM = os.getenv("SMTP_FROM", "kalpana@local")
+    MAIL_IMPORT_ROOT = Path(os.getenv("MAIL_IMPORT_ROOT", "~/Mail")).expanduser().resolve()  # /api/email/import only reads below this
+    
+    # Smart home (MQTT broker; leave MQTT_HOST empty for the in-memory simulation)
+    MQTT_HOST = os.getenv("MQTT_HOST", "")
+    MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+    MQTT_USER = os.getenv("MQTT_USER", "")
+    MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "")
+    MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "kalpana")
+    MQTT_QOS = int(os.getenv("MQTT_QOS", 1))
+    
+    # LAN port scanner (public addresses are refused unless SCAN_ALLOW_PUBLIC is set)
+    SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", 256))
+    SCAN_RATE = float(os.getenv("SCAN_RATE", 0))  # Connects per second, 0 = unlimited
+    SCAN_ALLOW_PUBLIC = os.getenv("SCAN_ALLOW_PUBLIC", "").lower() in ("1", "true", "yes")
+    
+    # Per-process bandwidth estimate: seconds between samples (0 = off) and samples kept
+    BANDWIDTH_INTERVAL = float(os.getenv("BANDWIDTH_INTERVAL", 2))
+    BANDWIDTH_HISTORY = int(os.getenv("BANDWIDTH_HISTORY", 300))
+    
     # Voice
     WAKE_WORD = "kalpana"
     VOICE_ID = os.getenv("VOICE_ID", "com.apple.speech.synthesis.voice.Alex")
@@ -7,13 +7,20 @@ Dependencies: openai, requests
 import logging
 import json
 import asyncio
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 from backend.config.settings import settings
+from backend.modules.openmetrics import metrics
 from backend.kalpana_core.memory import memory
 from backend.kalpana_core.context import context_retriever
+from backend.plugins.loader import plugin_loader
 
 logger = logging.getLogger("Kalpana.Brain")
 
+LLM_LATENCY = metrics.histogram("kalpana_llm_request_seconds", "Time to get a response from the LLM provider")
+LLM_REQUESTS = metrics.counter("kalpana_llm_requests", "LLM requests by outcome", ["outcome"])
+LLM_INFLIGHT = metrics.gauge("kalpana_llm_inflight_requests", "LLM requests waiting for a response")
+
 class Brain:
     def __init__(self):
         self.model = settings.LLM_MODEL
@@ -26,7 +33,7 @@ class Brain:
         Always prioritize security and user consent for sensitive actions.
         """
         logger.info(f"Brain initialized with model: {self.model}")
-
+    
     async def process_input(self, user_input: str, context_data: Dict[str, Any] = None) -> str:
         """
         Process user input and generate a response or action plan.
@@ -51,20 +58,66 @@ class Brain:
                 context_message += f"{conversation_history}\n\n"
             messages.append({"role": "system", "content": f"Context from memory:\n{context_message}"})
         
+        plugin_prompt = self._plugin_prompt()
+        if plugin_prompt:
+            messages.append({"role": "system", "content": plugin_prompt})
+        
         messages.append({"role": "user", "content": user_input})
         
-        # Call LLM
+        # Call LLM; a plugin call in the reply is run and its result becomes the response
         response = await self._call_llm(messages)
+        routed = await self._route_to_plugin(response)
+        if routed is not None:
+            response = routed
         
         # Save conversation to memory
         memory.save_conversation(user_input, response)
         
         return response
-
+    
+    def _plugin_prompt(self) -> str:
+        """Describe the loaded plugin commands (from their dispatch tables) for the model."""
+        commands = plugin_loader.list_commands()
+        lines = [
+            f"- {plugin}.{spec['name']}({', '.join(spec['params'])}): {spec['description']}"
+            for plugin, specs in commands.items() for spec in specs
+        ]
+        if not lines:
+            return ""
+        return ("To use a plugin, reply with only a JSON object: "
+                '{"plugin": "<plugin>", "command": "<command>", "args": {...}}\n'
+                "Available plugin commands:\n" + "\n".join(lines))
+    
+    async def _route_to_plugin(self, response: str) -> Optional[str]:
+        """Run the plugin command if the model replied with a plugin call; None otherwise."""
+        text = response.split("</think>")[-1].strip()  # Reasoning models prefix their answer with <think>...</think>
+        if not (text.startswith("{") and text.endswith("}")):
+            return None
+        try:
+            call = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(call, dict) or "plugin" not in call or "command" not in call:
+            return None
+        args = call.get("args") or {}
+        if not isinstance(args, dict):
+            return None
+        
+        logger.info(f"Routing to plugin: {call['plugin']}.{call['command']}")
+        try:
+            result = (await asyncio.to_thread(plugin_loader.execute_batch, [call]))[0]
+        except Exception as e:
+            logger.error(f"Plugin routing error: {e}")
+            return f"Error: {e}"
+        return result.get("message") or json.dumps(result)
+    
     async def _call_llm(self, messages: List[Dict[str, str]]) -> str:
         """
         Internal method to call the LLM provider (Ollama).
         """
+        LLM_INFLIGHT.inc()
+        started = time.perf_counter()
+        outcome = "error"
         try:
             import requests
             
@@ -87,6 +140,7 @@ class Brain:
                 data = response.json()
                 content = data.get("message", {}).get("content", "")
                 logger.info(f"Ollama Response: {content[:50]}...")
+                outcome = "success"
                 return content
             else:
                 logger.error(f"Ollama Error {response.status_code}: {response.text}")
@@ -95,7 +149,11 @@ class Brain:
         except Exception as e:
             logger.error(f"LLM Call Failed: {e}")
             return "Error: My connection to the local model is unstable."
-
+        finally:
+            LLM_INFLIGHT.dec()
+            LLM_LATENCY.observe(time.perf_counter() - started)
+            LLM_REQUESTS.inc(outcome)
+    
     async def plan_task(self, goal: str):
         """
         Create a multi-step plan for a complex goal (Section L).
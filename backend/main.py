@@ -8,10 +8,12 @@ Permissions: Network Access
 import os
 import asyncio
 import logging
+from datetime import datetime
+from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 import socketio
 import uvicorn
 from backend.modules.system_monitor import system_monitor
@@ -23,6 +25,14 @@ from backend.security.security_core import security_core
 from backend.security.firewall_manager import firewall_manager
 from backend.web.scraper import web_scraper
 from backend.kalpana_core.memory import memory
+from backend.plugins.loader import plugin_loader
+from backend.plugins.cache import command_cache
+from backend.plugins.reminders import reminder_manager
+from backend.plugins.calendar import calendar_manager
+from backend.plugins.email import email_manager
+from backend.plugins.home_automation import mqtt_bridge
+from backend.modules.openmetrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from backend.config.settings import settings
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -44,6 +54,29 @@ app.add_middleware(
 sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
 socket_app = socketio.ASGIApp(sio, app)
 
+# Connected HUD clients (for /metrics)
+connected_clients = set()
+
+# Running port scans by client, cancelled when the client disconnects
+scan_tasks = {}
+
+# Gauges read at scrape time; counters/histograms are recorded where the work happens
+HOST_FIELDS = ["cpu", "ram", "disk", "battery", "net_sent_rate", "net_recv_rate", "disk_read_rate", "disk_write_rate"]
+metrics.gauge("kalpana_host", "Latest system monitor sample (percent, or bytes/s for *_rate)", ["metric"],
+              lambda: [((field,), system_monitor.get_stats().get(field)) for field in HOST_FIELDS])
+metrics.gauge("kalpana_host_core_percent", "Per-core CPU usage", ["core"],
+              lambda: [((str(i),), percent) for i, percent in enumerate(system_monitor.get_stats().get("cores", []))])
+metrics.gauge("kalpana_memory_items", "Items in the memory store", ["kind"],
+              lambda: [((kind,), count) for kind, count in memory.get_stats().items()])
+metrics.gauge("kalpana_security_threat_score", "Security core threat score (0-100)", callback=lambda: security_core.metrics.threat_score)
+metrics.gauge("kalpana_security_queue_depth", "File events waiting for the security workers",
+              callback=lambda: security_core.event_handler.queue.get_stats()["depth"])
+metrics.gauge("kalpana_security_queue_lag_ms", "Wait from first file event to processing (last batch)",
+              callback=lambda: security_core.event_handler.queue.stats["lag_ms"])
+metrics.gauge("kalpana_socketio_clients", "Connected Socket.IO clients", callback=lambda: len(connected_clients))
+metrics.gauge("kalpana_stats_subscribers", "Clients subscribed to system_stats rooms",
+              callback=lambda: system_monitor.channels.subscriber_count)
+
 # Mount Frontend (Static Files)
 # We assume the frontend build or raw files are in ../frontend
 FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../frontend"))
@@ -59,6 +92,13 @@ app.mount("/js", StaticFiles(directory=os.path.join(FRONTEND_DIR, "js")), name="
 async def read_root():
     return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    OpenMetrics exposition for Prometheus-compatible scrapers.
+    """
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {"status": "online", "system": "Kalpana AGI"}
@@ -80,14 +120,14 @@ async def run_diagnostics():
     
     # 2. Test Network Scan
     await sio.emit('system_event', {'type': 'action', 'message': 'Scanning Network...'})
-    connections = network_scanner.get_active_connections()
+    connections = await asyncio.to_thread(network_scanner.get_active_connections)
     local_ip = network_scanner.get_local_ip()
     
     # 3. Report Results
     report = {
         "local_ip": local_ip,
-        "active_connections": len(connections),
-        "top_connections": connections
+        "active_connections": connections.get("total", 0),
+        "top_connections": connections.get("connections", [])
     }
     await sio.emit('diagnostics_result', report)
     await sio.emit('system_event', {'type': 'success', 'message': 'Diagnostics Complete.'})
@@ -306,20 +346,330 @@ async def disable_firewall():
         logger.error(f"Disable firewall error: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/system/probes")
+async def get_probe_timings():
+    """
+    Per-probe collection cost of the system monitor's sampler thread.
+    """
+    return {"status": "success", **system_monitor.get_probe_timings()}
+
+@app.get("/api/system/processes")
+async def get_processes(limit: int = 10, sort: str = "cpu", name: str = None):
+    """
+    Top processes by cpu or memory from the sampler's last refresh (every 5s).
+    """
+    return system_monitor.get_processes(limit, sort, name)
+
+@app.get("/api/metrics/history")
+async def get_metrics_history(metrics: str = None, window: float = 3600, resolution: float = None):
+    """
+    System metric history for the last `window` seconds.
+    metrics is a comma-separated list (cpu,ram,disk,battery,net_sent_rate,net_recv_rate,
+    disk_read_rate,disk_write_rate,cores);
+    resolution (seconds) aggregates samples into min/max/avg buckets.
+    """
+    names = [name.strip() for name in metrics.split(",") if name.strip()] if metrics else None
+    return await asyncio.to_thread(system_monitor.get_history, names, window, resolution)
+
+@app.get("/api/metrics/anomalies")
+async def get_metric_anomalies():
+    """
+    Metrics currently flagged as anomalous, recent alerts, and the detector's CPU cost.
+    """
+    return {"status": "success", **system_monitor.get_anomalies()}
+
+@app.get("/api/metrics/rooms")
+async def get_stats_rooms():
+    """
+    system_stats subscription rooms with subscriber counts, emits and bytes/sec.
+    """
+    return {"status": "success", **system_monitor.channels.get_stats()}
+
+@app.get("/api/network/connections")
+async def get_connections(status: str = None, process: str = None, pid: int = None, remote: str = None,
+                          port: int = None, proto: str = None, offset: int = 0, limit: int = 50):
+    """
+    Tracked connections, newest first, filtered and paginated.
+    """
+    return await asyncio.to_thread(
+        network_scanner.tracker.query, offset=offset, limit=limit, status=status, process=process,
+        pid=pid, remote=remote, port=port, proto=proto
+    )
+
+@app.get("/api/network/connections/summary")
+async def get_connection_summary(by: str = "process", limit: int = 20, status: str = None):
+    """
+    Connection counts grouped by process or remote host.
+    """
+    return await asyncio.to_thread(network_scanner.tracker.summarize, by, limit, status=status)
+
+@app.get("/api/network/bandwidth")
+async def get_process_bandwidth(window: float = 10.0, limit: int = 10, sort: str = "total"):
+    """
+    Estimated upload/download bytes/sec per process, averaged over the last `window` seconds.
+    """
+    return await asyncio.to_thread(network_scanner.bandwidth.top, window, limit, sort)
+
+@app.post("/api/network/scan")
+async def scan_network_ports(request: Request):
+    """
+    TCP connect scan of LAN hosts and return the open ports.
+    Accepts JSON: {"targets": "192.168.1.0/24", "ports": "22,80,443,8000-8100", "banners": true}
+    """
+    try:
+        data = await request.json()
+        return await network_scanner.port_scanner.scan(
+            data.get("targets", ""), data.get("ports"), data.get("banners", True), data.get("resolve", True)
+        )
+    except Exception as e:
+        logger.error(f"Network scan error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/plugins")
+async def list_plugins():
+    """
+    List loaded plugins and the command schemas they expose.
+    """
+    try:
+        return {
+            "status": "success",
+            "plugins": plugin_loader.list_plugins(),
+            "commands": plugin_loader.list_commands(),
+            "cache": command_cache.get_stats()
+        }
+    except Exception as e:
+        logger.error(f"List plugins error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.post("/api/plugins/execute")
+async def execute_plugin_command(request: Request):
+    """
+    Execute a single plugin command.
+    Accepts JSON: {"plugin": "weather", "command": "get_weather", "args": {"location": "Paris"}}
+    """
+    try:
+        data = await request.json()
+        result = (await asyncio.to_thread(plugin_loader.execute_batch, [data]))[0]
+        return result
+    except Exception as e:
+        logger.error(f"Plugin execute error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.post("/api/plugins/batch")
+async def execute_plugin_batch(request: Request):
+    """
+    Execute several plugin commands in one round-trip.
+    Accepts JSON: {"calls": [{"plugin": ..., "command": ..., "args": {...}}, ...]}
+    """
+    try:
+        data = await request.json()
+        calls = data.get("calls", [])
+        results = await asyncio.to_thread(plugin_loader.execute_batch, calls)
+        return {"status": "success", "results": results}
+    except Exception as e:
+        logger.error(f"Plugin batch error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/calendar/freebusy")
+async def get_free_busy(start: str, end: str):
+    """
+    Get busy blocks and free gaps between two ISO timestamps.
+    """
+    try:
+        return calendar_manager.get_free_busy(datetime.fromisoformat(start), datetime.fromisoformat(end))
+    except Exception as e:
+        logger.error(f"Free/busy error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/calendar/free-slots")
+async def get_free_slots(start: str, end: str, duration: int = 60, limit: int = 5):
+    """
+    Find free slots of `duration` minutes between two ISO timestamps.
+    """
+    try:
+        slots = calendar_manager.find_free_slots(
+            datetime.fromisoformat(start), datetime.fromisoformat(end), duration_minutes=duration, max_results=limit
+        )
+        return {"status": "success", "slots": slots}
+    except Exception as e:
+        logger.error(f"Free slots error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/email")
+async def list_emails(limit: int = 20, folder: str = None, cursor: str = None):
+    """
+    Page through emails newest-first. Pass the returned next_cursor to get the next page.
+    """
+    return await asyncio.to_thread(email_manager.list_emails, limit, folder, cursor)
+
+@app.get("/api/email/search")
+async def search_emails(q: str, limit: int = 20, folder: str = None, cursor: str = None):
+    """
+    Full-text search over email subjects and bodies.
+    """
+    return await asyncio.to_thread(email_manager.search_emails, q, limit, folder, cursor)
+
+@app.get("/api/email/outbox")
+async def get_outbox_stats():
+    """
+    Outbound queue depth by status and SMTP connection reuse.
+    """
+    if email_manager.outbox is None:
+        return {"status": "error", "message": "Email store is not available"}
+    return await asyncio.to_thread(email_manager.outbox.get_stats)
+
+@app.post("/api/email/import")
+async def import_mailbox(request: Request):
+    """
+    Import a local mbox file or Maildir directory; progress is pushed as system_event updates.
+    Accepts JSON: {"path": "~/Mail/inbox.mbox", "folder": "inbox"}
+    """
+    try:
+        data = await request.json()
+        # Only mailboxes under MAIL_IMPORT_ROOT: the path comes from the request body
+        path = Path(data["path"]).expanduser().resolve()
+        if not path.is_relative_to(settings.MAIL_IMPORT_ROOT):
+            return {"status": "error", "message": f"Mailbox must be under {settings.MAIL_IMPORT_ROOT}"}
+        loop = asyncio.get_running_loop()
+        
+        def progress(stats):
+            message = f"Mail import: {stats['imported']} messages ({stats['messages_per_second']:.0f} msg/s)"
+            asyncio.run_coroutine_threadsafe(sio.emit('system_event', {'type': 'email_import', 'message': message, **stats}), loop)
+        
+        return await asyncio.to_thread(
+            email_manager.import_mailbox, str(path), data.get("folder", "inbox"), progress
+        )
+    except Exception as e:
+        logger.error(f"Mail import error: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/home/telemetry")
+async def list_telemetry():
+    """
+    Recorded device telemetry series with sample counts and memory use.
+    """
+    return {"status": "success", "series": mqtt_bridge.telemetry.list_series()}
+
+@app.get("/api/home/telemetry/{series}")
+async def get_telemetry(series: str, start: str = None, end: str = None, max_points: int = 500, resolution: str = None):
+    """
+    History of one series (e.g. thermostat.temperature) between two ISO timestamps (default: last hour).
+    Long ranges are answered from 1s/1m/1h rollups; pass resolution=raw|1s|1m|1h to force a tier.
+    """
+    try:
+        return await asyncio.to_thread(
+            mqtt_bridge.get_telemetry, series,
+            datetime.fromisoformat(start).timestamp() if start else None,
+            datetime.fromisoformat(end).timestamp() if end else None,
+            max_points, resolution
+        )
+    except Exception as e:
+        logger.error(f"Telemetry error: {e}")
+        return {"status": "error", "message": str(e)}
+
 # Socket.IO Events
 @sio.event
 async def connect(sid, environ):
     logger.info(f"Client connected: {sid}")
+    connected_clients.add(sid)
     await sio.emit('system_event', {'type': 'connection', 'status': 'connected', 'message': 'Kalpana Core Online'}, room=sid)
 
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    connected_clients.discard(sid)
+    system_monitor.unsubscribe(sid)
+    task = scan_tasks.pop(sid, None)
+    if task is not None:
+        task.cancel()
+
+@sio.event
+async def subscribe_stats(sid, data=None):
+    """
+    Join system_stats rooms, e.g. {"groups": ["cpu", "memory"], "interval": 2}.
+    The client gets each group in full once, then only fields that changed.
+    """
+    data = data or {}
+    try:
+        initial = system_monitor.subscribe(sid, data.get("groups", ["cpu", "memory"]), data.get("interval"))
+    except ValueError as e:
+        await sio.emit('system_event', {'type': 'error', 'message': str(e)}, room=sid)
+        return
+    for room, snapshot in initial.items():
+        await sio.enter_room(sid, room)
+        await sio.emit('system_stats', snapshot, room=sid)
+
+@sio.event
+async def unsubscribe_stats(sid, data=None):
+    for room in system_monitor.unsubscribe(sid, (data or {}).get("groups")):
+        await sio.leave_room(sid, room)
+
+@sio.event
+async def subscribe_network(sid, data=None):
+    """Join the 'network' room to receive opened/closed connection deltas."""
+    await sio.enter_room(sid, 'network')
+
+@sio.event
+async def scan_network(sid, data=None):
+    """
+    Port scan streamed to the requesting client, e.g. {"targets": "192.168.1.0/24", "ports": "22,80,443"}.
+    Each open port is sent as 'scan_result' when found, then 'scan_complete' with the probe stats.
+    """
+    data = data or {}
+    if sid in scan_tasks:
+        await sio.emit('system_event', {'type': 'error', 'message': 'A scan is already running'}, room=sid)
+        return
+    
+    async def run():
+        stats = {}
+        try:
+            async for result in network_scanner.port_scanner.scan_iter(
+                data.get("targets", ""), data.get("ports"), data.get("banners", True), data.get("resolve", True), stats
+            ):
+                await sio.emit('scan_result', result, room=sid)
+            await sio.emit('scan_complete', {'status': 'success', **stats}, room=sid)
+        except ValueError as e:
+            await sio.emit('scan_complete', {'status': 'error', 'message': str(e)}, room=sid)
+        except Exception as e:
+            logger.error(f"Network scan error: {e}")
+            await sio.emit('scan_complete', {'status': 'error', 'message': str(e)}, room=sid)
+        finally:
+            scan_tasks.pop(sid, None)
+    
+    scan_tasks[sid] = asyncio.create_task(run())
+
+@sio.event
+async def subscribe_devices(sid, data=None):
+    """Join the device-state room: one snapshot now, then only change diffs."""
+    await sio.enter_room(sid, 'devices')
+    await sio.emit('device_snapshot', mqtt_bridge.get_all_devices(), room=sid)
+
+def emit_threadsafe(loop, event, data, room=None):
+    """Emit a Socket.IO event from the event loop or from a worker thread."""
+    coroutine = sio.emit(event, data, room=room)
+    try:
+        if asyncio.get_running_loop() is loop:
+            loop.create_task(coroutine)
+            return
+    except RuntimeError:
+        pass
+    asyncio.run_coroutine_threadsafe(coroutine, loop)
 
 @sio.event
 async def user_command(sid, data):
     """Handle incoming user commands from the HUD"""
     logger.info(f"Received command: {data}")
+    # Plugin commands are dispatched directly; a list under "calls" is run as one batch
+    if isinstance(data, dict) and ("calls" in data or ("plugin" in data and "command" in data)):
+        calls = data["calls"] if "calls" in data else [data]
+        try:
+            results = await asyncio.to_thread(plugin_loader.execute_batch, calls)
+        except Exception as e:
+            logger.error(f"Plugin batch error: {e}")
+            await sio.emit('response', {'status': 'error', 'message': str(e)}, room=sid)
+            return
+        await sio.emit('response', {'status': 'completed', 'results': results}, room=sid)
+        return
     # TODO: Route to Brain/Planner
     await sio.emit('response', {'status': 'processing', 'data': data}, room=sid)
 
@@ -329,13 +679,38 @@ async def startup_event():
     logger.info("Kalpana System Startup Initiated...")
     # Start System Monitor
     asyncio.create_task(system_monitor.start_monitoring(sio))
+    # Start Reminder Scheduler
+    asyncio.create_task(reminder_manager.start_monitoring(sio))
+    # Start Outbound Mail Worker (demo mode without SMTP_HOST; absent if the email store failed to open)
+    if email_manager.outbox is not None:
+        asyncio.create_task(email_manager.outbox.run(lambda status: sio.emit('email_status', status)))
+    # Connect Smart Home Bridge (simulation mode without MQTT_HOST); device changes go to the 'devices' room
+    loop = asyncio.get_running_loop()
+    mqtt_bridge.state.subscribe(lambda diff: emit_threadsafe(loop, 'device_state', diff, room='devices'))
+    asyncio.create_task(mqtt_bridge.start())
+    # Track connections in the background; only changes are pushed to the 'network' room
+    network_scanner.tracker.subscribe(lambda delta: emit_threadsafe(loop, 'network_connections', delta, room='network'))
+    network_scanner.tracker.start()
+    if settings.BANDWIDTH_INTERVAL > 0:
+        network_scanner.bandwidth.start()
     # Start Security Core
     security_core.start_protection()
+    # Load Plugins (reloaded in place when their files change)
+    plugin_loader.load_all_plugins()
+    plugin_loader.start_hot_reload()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Kalpana System Shutdown...")
     # Cleanup resources
+    plugin_loader.stop_hot_reload()
+    system_monitor.stop()
+    network_scanner.tracker.stop()
+    network_scanner.bandwidth.stop()
+    security_core.stop_protection()
+    if email_manager.outbox is not None:
+        email_manager.outbox.stop()
+    await mqtt_bridge.stop()
 
 if __name__ == "__main__":
     # Dev mode run
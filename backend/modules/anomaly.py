@@ -0,0 +1,165 @@
+"""
+Kalpana AGI - Metric Anomaly Detector
+Purpose: Streaming anomaly detection over the system metric stream. Each sample is scored
+         against an EWMA baseline and an hour-of-day seasonal baseline, for all metrics at
+         once with NumPy, in O(1) per sample. Alerts use hysteresis so a noisy metric
+         raises one warning and one recovery instead of a stream of events.
+Dependencies: numpy
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("Kalpana.Anomaly")
+
+# Smallest standard deviation assumed per metric, so flat series do not alert on tiny wiggles
+STD_FLOORS = {
+    "net_sent_rate": 64 * 1024,
+    "net_recv_rate": 64 * 1024,
+    "disk_read_rate": 1024 * 1024,
+    "disk_write_rate": 1024 * 1024,
+}
+DEFAULT_STD_FLOOR = 2.0  # Percent metrics
+
+LABELS = {
+    "cpu": "CPU usage",
+    "ram": "Memory usage",
+    "disk": "Disk usage",
+    "battery": "Battery level",
+    "net_sent_rate": "Network upload",
+    "net_recv_rate": "Network download",
+    "disk_read_rate": "Disk reads",
+    "disk_write_rate": "Disk writes",
+}
+
+class AnomalyDetector:
+    def __init__(self, metrics: List[str], alpha: float = 0.05, seasonal_alpha: float = 0.02,
+                 z_enter: float = 4.0, z_exit: float = 2.0, enter_samples: int = 3, exit_samples: int = 5,
+                 warmup: int = 30, season_slots: int = 24):
+        self.metrics = list(metrics)
+        size = len(self.metrics)
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.z_enter = z_enter
+        self.z_exit = z_exit
+        self.enter_samples = enter_samples
+        self.exit_samples = exit_samples
+        self.warmup = warmup
+        self.season_slots = season_slots
+        self.std_floor = np.array([STD_FLOORS.get(metric, DEFAULT_STD_FLOOR) for metric in self.metrics])
+        
+        self.mean = np.zeros(size)
+        self.var = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.int64)
+        # One baseline per hour of day, so the nightly backup is not an anomaly every night
+        self.seasonal_mean = np.zeros((season_slots, size))
+        self.seasonal_var = np.zeros((season_slots, size))
+        self.seasonal_count = np.zeros((season_slots, size), dtype=np.int64)
+        
+        self.active = np.zeros(size, dtype=bool)
+        self._above = np.zeros(size, dtype=np.int64)  # Consecutive samples over z_enter
+        self._below = np.zeros(size, dtype=np.int64)  # Consecutive samples under z_exit while active
+        self.events: deque = deque(maxlen=50)
+        self.stats = {"samples": 0, "cpu_seconds": 0.0, "alerts": 0}
+    
+    def _slot(self, timestamp: float) -> int:
+        return datetime.fromtimestamp(timestamp).hour * self.season_slots // 24
+    
+    def update(self, values: np.ndarray, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Score one sample (aligned with self.metrics; NaN = missing) and return alert transitions."""
+        started = time.thread_time()
+        timestamp = time.time() if timestamp is None else timestamp
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        slot = self._slot(timestamp)
+        
+        # Score against the baselines as they were before this sample
+        std = np.maximum(np.sqrt(self.var), self.std_floor)
+        z = np.where(present, (values - self.mean) / std, 0.0)
+        seasonal_ready = self.seasonal_count[slot] >= self.warmup
+        seasonal_std = np.maximum(np.sqrt(self.seasonal_var[slot]), self.std_floor)
+        z_seasonal = np.where(present, (values - self.seasonal_mean[slot]) / seasonal_std, 0.0)
+        # Deviating from the recent trend only counts if it is also unusual for this time of day
+        score = np.where(seasonal_ready, np.minimum(np.abs(z), np.abs(z_seasonal)), np.abs(z))
+        score = np.where(present & (self.count >= self.warmup), score, 0.0)
+        
+        # Hysteresis: enter after enter_samples over z_enter, leave after exit_samples under z_exit
+        self._above = np.where(score >= self.z_enter, self._above + 1, 0)
+        self._below = np.where(self.active & (score < self.z_exit), self._below + 1, 0)
+        started_alerts = ~self.active & (self._above >= self.enter_samples)
+        ended_alerts = self.active & (self._below >= self.exit_samples)
+        expected = self.mean.copy()
+        self.active = (self.active | started_alerts) & ~ended_alerts
+        
+        # EWMA mean/variance updates (only where a value is present). Outliers are learned at a
+        # tenth of the rate: full weight would inflate the variance and hide the anomaly within
+        # a few samples, while zero weight would never accept a lasting level shift as normal.
+        damping = np.where((score >= self.z_enter) | self.active, 0.1, 1.0)
+        alpha = self.alpha * damping
+        delta = np.where(present, values - self.mean, 0.0)
+        first = present & (self.count == 0)
+        self.mean = np.where(first, np.nan_to_num(values), self.mean + alpha * delta)
+        self.var = np.where(first, 0.0, (1 - alpha) * (self.var + alpha * delta * delta))
+        self.count += present
+        
+        seasonal_alpha = self.seasonal_alpha * damping
+        seasonal_delta = np.where(present, values - self.seasonal_mean[slot], 0.0)
+        seasonal_first = present & (self.seasonal_count[slot] == 0)
+        self.seasonal_mean[slot] = np.where(
+            seasonal_first, np.nan_to_num(values), self.seasonal_mean[slot] + seasonal_alpha * seasonal_delta
+        )
+        self.seasonal_var[slot] = np.where(
+            seasonal_first, 0.0,
+            (1 - seasonal_alpha) * (self.seasonal_var[slot] + seasonal_alpha * seasonal_delta * seasonal_delta)
+        )
+        self.seasonal_count[slot] += present
+        
+        events = []
+        if started_alerts.any() or ended_alerts.any():
+            events = self._events(values, expected, z, started_alerts, ended_alerts, timestamp)
+        self.stats["samples"] += 1
+        self.stats["cpu_seconds"] += time.thread_time() - started
+        return events
+    
+    def _events(self, values, expected, z, started_alerts, ended_alerts, timestamp) -> List[Dict[str, Any]]:
+        events = []
+        for i in np.flatnonzero(started_alerts | ended_alerts):
+            metric = self.metrics[i]
+            label = LABELS.get(metric, f"Core {metric[4:]} usage" if metric.startswith("core") else metric)
+            if started_alerts[i]:
+                direction = "high" if z[i] > 0 else "low"
+                message = f"{label} unusually {direction}: {values[i]:.1f} (expected ~{expected[i]:.1f})"
+                self.stats["alerts"] += 1
+            else:
+                message = f"{label} back to normal: {values[i]:.1f}"
+            event = {
+                "type": "anomaly",
+                "level": "warning" if started_alerts[i] else "info",
+                "metric": metric,
+                "state": "start" if started_alerts[i] else "end",
+                "value": round(float(values[i]), 2),
+                "expected": round(float(expected[i]), 2),
+                "z": round(float(z[i]), 2),
+                "message": message,
+                "timestamp": datetime.fromtimestamp(timestamp).isoformat()
+            }
+            self.events.append(event)
+            events.append(event)
+        return events
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Active anomalies, recent transitions, and what the detector costs."""
+        samples = self.stats["samples"]
+        return {
+            "active": [self.metrics[i] for i in np.flatnonzero(self.active)],
+            "recent": list(self.events),
+            "samples": samples,
+            "alerts": self.stats["alerts"],
+            "cpu_seconds": round(self.stats["cpu_seconds"], 4),
+            "cpu_us_per_sample": round(self.stats["cpu_seconds"] / samples * 1e6, 1) if samples else 0.0
+        }
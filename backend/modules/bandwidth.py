@@ -0,0 +1,271 @@
+"""
+Kalpana AGI - Per-Process Bandwidth Accounting
+Purpose: Estimates which processes are using the network. Each tick the interface byte
+         counters give the host's real upload/download rate, and that rate is split
+         between the processes that own the active non-loopback sockets. The results
+         are kept in a bounded history for "what is saturating my uplink" queries.
+Dependencies: psutil
+Notes: The kernel has no per-process byte counters, so attribution is an estimate: a
+       process's share is its sockets' queued bytes (tx_queue/rx_queue) when any data
+       is queued, otherwise its number of active sockets. On Linux the socket tables are
+       read from /proc/net and socket inodes are mapped to pids through /proc/<pid>/fd
+       only for inodes not seen before, instead of psutil's full scan on every tick.
+"""
+
+import ipaddress
+import logging
+import os
+import threading
+import time
+import psutil
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("Kalpana.Bandwidth")
+
+PROC_NET_FILES = ("tcp", "tcp6", "udp", "udp6")
+TCP_ESTABLISHED = "01"
+UNOWNED_RETRY = 30.0  # Seconds before retrying inodes whose owner could not be found (other users)
+LOOPBACK_CACHE = 4096  # Remote hosts remembered as loopback or not before the cache is reset
+
+def _is_loopback(host: str) -> bool:
+    """Hex host from /proc/net ('0100007F') -> loopback?"""
+    raw = bytes.fromhex(host)
+    # The kernel prints each 32-bit word in host byte order
+    raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    ip = ipaddress.ip_address(raw)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_loopback or ip.is_unspecified
+
+class BandwidthAccountant:
+    def __init__(self, interval: float = 2.0, history: int = 300, use_proc: Optional[bool] = None):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=history)
+        self.use_proc = os.path.exists("/proc/net/tcp") if use_proc is None else use_proc
+        self._owners: Dict[int, int] = {}  # Socket inode -> pid
+        self._unowned: Dict[int, float] = {}  # Socket inode -> when the owner lookup failed
+        self._loopback: Dict[str, bool] = {}
+        self._names: Dict[int, str] = {}
+        self._names_lock = threading.Lock()  # top() fills it from the API thread, sample() prunes it
+        self._last_counters: Optional[Dict[str, Tuple[int, int]]] = None
+        self._last_time = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"samples": 0, "owner_scans": 0, "last_ms": 0.0, "source": "proc" if self.use_proc else "psutil"}
+    
+    def _proc_sockets(self) -> List[Tuple[int, int, int]]:
+        """(inode, tx_queue, rx_queue) of active non-loopback sockets from /proc/net."""
+        sockets = []
+        for name in PROC_NET_FILES:
+            try:
+                with open(f"/proc/net/{name}") as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        remote = fields[2]
+                        # TCP: established only; UDP: connected sockets (a remote port is set)
+                        if name.startswith("tcp"):
+                            if fields[3] != TCP_ESTABLISHED:
+                                continue
+                        elif remote.endswith(":0000"):
+                            continue
+                        host = remote.rsplit(":", 1)[0]
+                        loopback = self._loopback.get(host)
+                        if loopback is None:
+                            if len(self._loopback) >= LOOPBACK_CACHE:
+                                self._loopback.clear()
+                            loopback = self._loopback[host] = _is_loopback(host)
+                        if loopback:
+                            continue
+                        tx_queue, rx_queue = fields[4].split(":")
+                        sockets.append((int(fields[9]), int(tx_queue, 16), int(rx_queue, 16)))
+            except FileNotFoundError:
+                continue  # IPv6 disabled
+        return sockets
+    
+    def _scan_owners(self, wanted: Set[int]):
+        """Map new socket inodes to pids, checking processes that already own sockets first."""
+        self.stats["owner_scans"] += 1
+        known = set(self._owners.values())
+        pids = sorted(psutil.pids(), key=lambda pid: pid not in known)
+        for pid in pids:
+            fd_dir = f"/proc/{pid}/fd"
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(f"{fd_dir}/{fd}")
+                except OSError:
+                    continue
+                if link.startswith("socket:["):
+                    inode = int(link[8:-1])
+                    if inode in wanted:
+                        self._owners[inode] = pid
+                        wanted.discard(inode)
+            if not wanted:
+                return
+        now = time.monotonic()
+        for inode in wanted:
+            self._unowned[inode] = now
+    
+    def _sockets_by_pid(self) -> Dict[Optional[int], List[int]]:
+        """pid -> [active sockets, queued send bytes, queued receive bytes]; None = owner unknown."""
+        owners: Dict[Optional[int], List[int]] = {}
+        if self.use_proc:
+            sockets = self._proc_sockets()
+            live = {inode for inode, _, _ in sockets}
+            now = time.monotonic()
+            wanted = {inode for inode in live if inode not in self._owners
+                      and now - self._unowned.get(inode, -UNOWNED_RETRY) >= UNOWNED_RETRY}
+            if wanted:
+                self._scan_owners(wanted)
+            # Closed sockets' inodes can be reused: forget them
+            self._owners = {inode: pid for inode, pid in self._owners.items() if inode in live}
+            self._unowned = {inode: failed for inode, failed in self._unowned.items() if inode in live}
+            for inode, tx_queue, rx_queue in sockets:
+                row = owners.setdefault(self._owners.get(inode), [0, 0, 0])
+                row[0] += 1
+                row[1] += tx_queue
+                row[2] += rx_queue
+        else:
+            for conn in psutil.net_connections(kind="inet"):
+                if not conn.raddr or ipaddress.ip_address(conn.raddr.ip).is_loopback:
+                    continue
+                if conn.status not in (psutil.CONN_ESTABLISHED, psutil.CONN_NONE):
+                    continue
+                owners.setdefault(conn.pid, [0, 0, 0])[0] += 1
+        return owners
+    
+    def _process_name(self, pid: Optional[int]) -> str:
+        if pid is None:
+            return "unknown"
+        with self._names_lock:
+            name = self._names.get(pid)
+        if name is None:
+            try:
+                name = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                name = ""
+            with self._names_lock:
+                self._names[pid] = name
+        return name
+    
+    def sample(self) -> Optional[Dict[str, Any]]:
+        """Take one accounting tick. The first call only primes the interface counters."""
+        started = time.perf_counter()
+        now = time.monotonic()
+        counters = {nic: (io.bytes_sent, io.bytes_recv)
+                    for nic, io in psutil.net_io_counters(pernic=True).items() if not nic.startswith("lo")}
+        previous, elapsed = self._last_counters, now - self._last_time
+        self._last_counters, self._last_time = counters, now
+        if previous is None or elapsed <= 0:
+            return None
+        
+        interfaces = {}
+        for nic, (sent, recv) in counters.items():
+            if nic in previous:
+                # Counters reset when an interface goes down and up
+                interfaces[nic] = (max(0, sent - previous[nic][0]) / elapsed, max(0, recv - previous[nic][1]) / elapsed)
+        sent_rate = sum(rates[0] for rates in interfaces.values())
+        recv_rate = sum(rates[1] for rates in interfaces.values())
+        
+        owners = self._sockets_by_pid()
+        sockets = sum(row[0] for row in owners.values()) or 1
+        tx_total = sum(row[1] for row in owners.values())
+        rx_total = sum(row[2] for row in owners.values())
+        processes = {}
+        for pid, (count, tx_queue, rx_queue) in owners.items():
+            sent_share = tx_queue / tx_total if tx_total else count / sockets
+            recv_share = rx_queue / rx_total if rx_total else count / sockets
+            processes[pid] = (sent_rate * sent_share, recv_rate * recv_share, count)
+        with self._names_lock:
+            self._names = {pid: name for pid, name in self._names.items() if pid in processes}
+        
+        entry = {
+            "time": time.time(),
+            "interval": elapsed,
+            "sent_rate": sent_rate,
+            "recv_rate": recv_rate,
+            "interfaces": interfaces,
+            "processes": processes
+        }
+        self.samples.append(entry)
+        self.stats["samples"] += 1
+        self.stats["last_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return entry
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Bandwidth sampling error: {e}")
+            self._stop.wait(self.interval)
+    
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="bandwidth-accounting", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+    
+    def top(self, window: float = 10.0, limit: int = 10, sort: str = "total") -> Dict[str, Any]:
+        """
+        Average estimated bytes/s per process over the last `window` seconds of history,
+        highest first by sent, recv or total.
+        """
+        try:
+            if sort not in ("sent", "recv", "total"):
+                return {"status": "error", "message": f"Unknown sort: {sort}"}
+            samples = list(self.samples)
+            cutoff = time.time() - window
+            recent = [entry for entry in samples if entry["time"] >= cutoff] or samples[-1:]
+            covered = sum(entry["interval"] for entry in recent)
+            
+            totals: Dict[Optional[int], List[float]] = {}
+            for entry in recent:
+                for pid, (sent, recv, count) in entry["processes"].items():
+                    row = totals.setdefault(pid, [0.0, 0.0, 0])
+                    row[0] += sent * entry["interval"]
+                    row[1] += recv * entry["interval"]
+                    row[2] = count
+            sent_rate = sum(entry["sent_rate"] * entry["interval"] for entry in recent) / covered if covered else 0.0
+            recv_rate = sum(entry["recv_rate"] * entry["interval"] for entry in recent) / covered if covered else 0.0
+            
+            rows = []
+            for pid, (sent, recv, count) in totals.items():
+                rows.append({
+                    "pid": pid,
+                    "name": self._process_name(pid),
+                    "sent_rate": round(sent / covered, 1),
+                    "recv_rate": round(recv / covered, 1),
+                    "sockets": count,
+                    "uplink_share": round(sent / covered / sent_rate * 100, 1) if sent_rate else 0.0
+                })
+            key = {"sent": lambda row: row["sent_rate"], "recv": lambda row: row["recv_rate"],
+                   "total": lambda row: row["sent_rate"] + row["recv_rate"]}[sort]
+            rows.sort(key=key, reverse=True)
+            return {
+                "status": "success",
+                "estimate": True,
+                "window": round(covered, 1),
+                "sent_rate": round(sent_rate, 1),
+                "recv_rate": round(recv_rate, 1),
+                "processes": rows[:limit],
+                "sampled_at": datetime.fromtimestamp(recent[-1]["time"]).isoformat() if recent else None,
+                **self.stats
+            }
+            
+        except Exception as e:
+            logger.error(f"Bandwidth query error: {e}")
+            return {"status": "error", "message": str(e)}
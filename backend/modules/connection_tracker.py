@@ -0,0 +1,193 @@
+"""
+Kalpana AGI - Connection Tracker
+Purpose: Background tracking of the host's inet connections. Keeps a keyed table,
+         reports only connections opened/closed since the previous poll, aggregates
+         by process and remote host, and serves filtered, paginated queries.
+Dependencies: psutil
+"""
+
+import logging
+import threading
+import time
+import psutil
+from collections import Counter
+from datetime import datetime
+from socket import SOCK_DGRAM
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("Kalpana.ConnectionTracker")
+
+def _address(addr) -> str:
+    if not addr:
+        return ""
+    # IPv6 addresses are bracketed so host:port stays unambiguous
+    return f"[{addr.ip}]:{addr.port}" if ":" in addr.ip else f"{addr.ip}:{addr.port}"
+
+class ConnectionTracker:
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        # Replaced wholesale on each poll, never mutated, so readers need no lock
+        self.table: Dict[tuple, Dict[str, Any]] = {}
+        self._names: Dict[int, str] = {}
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.polled_at: Optional[str] = None
+        self.stats = {"polls": 0, "opened": 0, "closed": 0, "name_lookups": 0, "last_ms": 0.0, "error": None}
+    
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        """Call callback({"opened": [...], "closed": [...]}) whenever connections change."""
+        self._subscribers.append(callback)
+    
+    def _process_name(self, pid: Optional[int]) -> str:
+        if not pid:
+            return ""
+        name = self._names.get(pid)
+        if name is None:
+            self.stats["name_lookups"] += 1
+            try:
+                name = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                name = ""
+            self._names[pid] = name
+        return name
+    
+    def refresh(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Poll the kernel's connection table and return what changed since the last poll."""
+        started = time.perf_counter()
+        try:
+            connections = psutil.net_connections(kind='inet')
+            self.stats["error"] = None
+        except psutil.AccessDenied as e:
+            # macOS needs root for other users' sockets
+            self.stats["error"] = f"Access denied: {e}"
+            logger.error(f"Connection tracking error: {self.stats['error']}")
+            return {"opened": [], "closed": []}
+        
+        previous = self.table
+        now = datetime.now().isoformat()
+        table = {}
+        for conn in connections:
+            key = (conn.family, conn.type, conn.laddr, conn.raddr or None, conn.pid)
+            row = previous.get(key)
+            if row is None or row["status"] != conn.status:
+                row = {
+                    "proto": "udp" if conn.type == SOCK_DGRAM else "tcp",
+                    "local": _address(conn.laddr),
+                    "remote": _address(conn.raddr),
+                    "remote_host": conn.raddr.ip if conn.raddr else "",
+                    "status": conn.status,
+                    "pid": conn.pid,
+                    "process": self._process_name(conn.pid),
+                    "opened_at": row["opened_at"] if row else now
+                }
+            table[key] = row
+        
+        opened = [row for key, row in table.items() if key not in previous]
+        closed = [row for key, row in previous.items() if key not in table]
+        first_poll = self.stats["polls"] == 0
+        self.table = table
+        self.polled_at = now
+        
+        # Forget names of pids that no longer own a socket (pids get reused)
+        live_pids = {key[4] for key in table}
+        for pid in [pid for pid in self._names if pid not in live_pids]:
+            del self._names[pid]
+        
+        self.stats["polls"] += 1
+        self.stats["last_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if first_poll:
+            # The initial table is a baseline, not a burst of "opened" events
+            return {"opened": [], "closed": []}
+        self.stats["opened"] += len(opened)
+        self.stats["closed"] += len(closed)
+        delta = {"opened": opened, "closed": closed}
+        if opened or closed:
+            for callback in list(self._subscribers):
+                try:
+                    callback(delta)
+                except Exception as e:
+                    logger.error(f"Connection delta subscriber error: {e}")
+        return delta
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Connection tracking error: {e}")
+            self._stop.wait(self.interval)
+    
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="connection-tracker", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+    
+    def _rows(self, status: Optional[str] = None, process: Optional[str] = None, pid: Optional[int] = None,
+              remote: Optional[str] = None, port: Optional[int] = None, proto: Optional[str] = None) -> List[Dict[str, Any]]:
+        if self.stats["polls"] == 0:
+            self.refresh()
+        rows = self.table.values()
+        if status:
+            wanted = status.upper()
+            rows = [row for row in rows if row["status"] == wanted]
+        if proto:
+            rows = [row for row in rows if row["proto"] == proto.lower()]
+        if pid is not None:
+            rows = [row for row in rows if row["pid"] == pid]
+        if process:
+            needle = process.lower()
+            rows = [row for row in rows if needle in row["process"].lower()]
+        if remote:
+            rows = [row for row in rows if row["remote_host"].startswith(remote)]
+        if port is not None:
+            suffix = f":{port}"
+            rows = [row for row in rows if row["local"].endswith(suffix) or row["remote"].endswith(suffix)]
+        return list(rows)
+    
+    def query(self, offset: int = 0, limit: int = 50, **filters) -> Dict[str, Any]:
+        """
+        Tracked connections, newest first. Filters: status, process (name substring),
+        pid, remote (address prefix), port (local or remote), proto.
+        """
+        try:
+            rows = self._rows(**filters)
+            rows.sort(key=lambda row: row["opened_at"], reverse=True)
+            return {
+                "status": "success",
+                "total": len(rows),
+                "offset": offset,
+                "limit": limit,
+                "polled_at": self.polled_at,
+                "connections": rows[offset:offset + limit]
+            }
+            
+        except Exception as e:
+            logger.error(f"Connection query error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def summarize(self, by: str = "process", limit: int = 20, **filters) -> Dict[str, Any]:
+        """Connection counts grouped by process or remote host."""
+        try:
+            if by not in ("process", "remote"):
+                return {"status": "error", "message": f"Cannot group by: {by}"}
+            rows = self._rows(**filters)
+            if by == "process":
+                counts = Counter((row["pid"], row["process"]) for row in rows)
+                groups = [{"pid": pid, "process": name, "connections": count} for (pid, name), count in counts.most_common(limit)]
+            else:
+                counts = Counter(row["remote_host"] for row in rows if row["remote_host"])
+                groups = [{"remote_host": host, "connections": count} for host, count in counts.most_common(limit)]
+            return {"status": "success", "by": by, "total": len(rows), "groups": groups}
+            
+        except Exception as e:
+            logger.error(f"Connection summary error: {e}")
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,121 @@
+"""
+Kalpana AGI - Metrics History
+Purpose: Fixed-size ring buffer of system metric samples with min/max/avg downsampling,
+         so late-joining HUD clients and the history API can see the last hour.
+Dependencies: numpy
+Notes: Storage is preallocated once (capacity x metrics); queries slice the window out of
+       the ring and aggregate it with reduceat, without touching samples outside it.
+"""
+
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("Kalpana.MetricsHistory")
+
+class MetricsHistory:
+    def __init__(self, columns: List[str], capacity: int = 3600):
+        self.columns = list(columns)
+        self.index = {column: i for i, column in enumerate(self.columns)}
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(self.columns)), np.nan, dtype=np.float32)
+        self._next = 0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+    
+    def append(self, row: Dict[str, float], timestamp: Optional[float] = None) -> np.ndarray:
+        """Store one sample (metrics missing from row are recorded as gaps); returns the stored vector."""
+        values = np.array([row.get(column, np.nan) for column in self.columns], dtype=np.float32)
+        with self._lock:
+            slot = self._next
+            self.timestamps[slot] = time.time() if timestamp is None else timestamp
+            self.values[slot] = values
+            self._next = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        return values
+    
+    def _window(self, start: float, end: float, columns: List[int]):
+        """Samples with start <= t < end, oldest first (copies only the window)."""
+        with self._lock:
+            if self.count < self.capacity:
+                parts = [slice(0, self.count)]
+            else:
+                # Both halves of a full ring are individually sorted by time
+                parts = [slice(self._next, self.capacity), slice(0, self._next)]
+            stamps, values = [], []
+            for part in parts:
+                times = self.timestamps[part]
+                lo, hi = np.searchsorted(times, [start, end])
+                if hi > lo:
+                    stamps.append(times[lo:hi])
+                    values.append(self.values[part][lo:hi, columns])
+        if not stamps:
+            return np.empty(0), np.empty((0, len(columns)), dtype=np.float32)
+        return np.concatenate(stamps), np.concatenate(values)
+    
+    def query(self, metrics: Optional[List[str]] = None, window: float = 3600,
+              resolution: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Metric history for the last `window` seconds. With a resolution (seconds per
+        bucket) samples are aggregated into min/max/avg per bucket.
+        """
+        try:
+            names = []
+            for metric in metrics or self.columns:
+                if metric == "cores":
+                    names.extend(column for column in self.columns if column.startswith("core"))
+                elif metric in self.index:
+                    names.append(metric)
+                else:
+                    return {"status": "error", "message": f"Unknown metric: {metric}"}
+            
+            end = time.time() if end is None else end
+            stamps, values = self._window(end - window, end, [self.index[name] for name in names])
+            
+            if resolution and len(stamps):
+                buckets = np.floor(stamps / resolution)
+                starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+                present = ~np.isnan(values)
+                counts = np.add.reduceat(present, starts, axis=0)
+                sums = np.add.reduceat(np.where(present, values, 0), starts, axis=0)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    avg = np.where(counts > 0, sums / counts, np.nan)
+                # fmin/fmax skip gaps unless a whole bucket is missing
+                low = np.fmin.reduceat(values, starts, axis=0)
+                high = np.fmax.reduceat(values, starts, axis=0)
+                stamps = buckets[starts] * resolution
+            else:
+                avg = low = high = values
+            
+            return {
+                "status": "success",
+                "resolution": resolution or "raw",
+                "points": len(stamps),
+                "timestamps": stamps.tolist(),
+                "series": {
+                    name: {
+                        "avg": self._to_list(avg[:, i]),
+                        "min": self._to_list(low[:, i]),
+                        "max": self._to_list(high[:, i])
+                    }
+                    for i, name in enumerate(names)
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"Metrics history error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    @staticmethod
+    def _to_list(values: np.ndarray) -> List[Optional[float]]:
+        # JSON has no NaN: gaps become null
+        rounded = np.round(values.astype(np.float64), 2)
+        return [None if value != value else value for value in rounded.tolist()]
@@ -1,36 +1,31 @@
 """
 Kalpana AGI - Network Scanner Module
 Purpose: Scan local network for devices and active connections.
-Dependencies: psutil, socket
+Dependencies: psutil, socket, asyncio
 """
 
-import psutil
 import socket
 import logging
-from typing import List, Dict
+from typing import Any, Dict
+from backend.config.settings import settings
+from backend.modules.bandwidth import BandwidthAccountant
+from backend.modules.connection_tracker import ConnectionTracker
+from backend.modules.port_scanner import PortScanner
 
 logger = logging.getLogger("Kalpana.NetworkScanner")
 
 class NetworkScanner:
-    def get_active_connections(self) -> List[Dict[str, str]]:
+    def __init__(self):
+        self.tracker = ConnectionTracker()
+        self.port_scanner = PortScanner(concurrency=settings.SCAN_CONCURRENCY, rate=settings.SCAN_RATE)
+        self.bandwidth = BandwidthAccountant(interval=settings.BANDWIDTH_INTERVAL or 2.0, history=settings.BANDWIDTH_HISTORY)
+    
+    def get_active_connections(self, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
         """
-        Get list of active network connections on the host.
+        Established connections on the host from the background tracker (newest first).
         """
-        connections = []
-        try:
-            # Get network connections (requires privileges for some details, but basic is fine)
-            for conn in psutil.net_connections(kind='inet'):
-                if conn.status == 'ESTABLISHED':
-                    connections.append({
-                        "local": f"{conn.laddr.ip}:{conn.laddr.port}",
-                        "remote": f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "N/A",
-                        "status": conn.status,
-                        "pid": conn.pid
-                    })
-        except Exception as e:
-            logger.error(f"Error scanning connections: {e}")
-        return connections[:10] # Return top 10 for display
-
+        return self.tracker.query(offset=offset, limit=limit, status="ESTABLISHED")
+    
     def get_local_ip(self):
         try:
             return socket.gethostbyname(socket.gethostname())
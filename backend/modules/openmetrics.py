@@ -0,0 +1,236 @@
+"""
+Kalpana AGI - OpenMetrics Exposition
+Purpose: Counters, histograms and gauges for Kalpana internals, rendered in the
+         OpenMetrics text format for Prometheus-compatible scrapers (/metrics).
+Dependencies: None
+Notes: Counters and histograms are sharded per thread: each thread only ever writes its
+       own shard, so recording takes no lock; a scrape sums the shards. Gauges are read
+       from callbacks at scrape time. Label strings and HELP/TYPE headers are encoded
+       once, and the rendered text is reused for max_age seconds.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("Kalpana.Metrics")
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    kind = "unknown"
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.labelnames = tuple(labelnames)
+        self.header = f"# HELP {name} {_escape(help_text)}\n# TYPE {name} {self.kind}\n"
+        self._label_cache: Dict[Tuple, str] = {}
+    
+    def _labels(self, values: Tuple, extra: str = "") -> str:
+        """Encoded {a="x",b="y"} for a label tuple, cached per distinct tuple."""
+        key = (values, extra)
+        text = self._label_cache.get(key)
+        if text is None:
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+            if extra:
+                pairs.append(extra)
+            text = self._label_cache[key] = "{" + ",".join(pairs) + "}" if pairs else ""
+        return text
+
+class _Sharded(_Metric):
+    """Per-thread storage: writers touch only their own shard, readers merge all shards."""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple, list]] = []
+        self._shards_lock = threading.Lock()
+    
+    def _shard(self) -> Dict[Tuple, list]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # The only lock on the write path: once per thread, on its first record
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+    
+    def _merged(self) -> Dict[Tuple, list]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[Tuple, list] = {}
+        for shard in shards:
+            for labels, cells in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(cells)
+                else:
+                    for i, value in enumerate(cells):
+                        total[i] += value
+        return merged
+
+class Counter(_Sharded):
+    kind = "counter"
+    
+    def inc(self, *labels: str, amount: float = 1):
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            shard[labels] = [amount]
+        else:
+            cell[0] += amount
+    
+    def value(self, *labels: str) -> float:
+        return self._merged().get(labels, [0])[0]
+    
+    def render(self) -> str:
+        lines = [f"{self.name}_total{self._labels(labels)} {_format(cells[0])}\n" for labels, cells in self._merged().items()]
+        return self.header + "".join(lines)
+
+class Histogram(_Sharded):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._bucket_labels = [f'le="{_format(bound)}"' for bound in self.buckets]
+    
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            # One count per bucket, then sum and count
+            cells = shard[labels] = [0] * (len(self.buckets) + 2)
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+    
+    def time(self, *labels: str) -> "_Timer":
+        """with histogram.time("label"): ... records the block's duration."""
+        return _Timer(self, labels)
+    
+    def render(self) -> str:
+        lines = []
+        for labels, cells in self._merged().items():
+            cumulative = 0
+            for i, bucket_label in enumerate(self._bucket_labels):
+                cumulative += cells[i]
+                lines.append(f"{self.name}_bucket{self._labels(labels, bucket_label)} {cumulative}\n")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format(float(cells[-2]))}\n")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cells[-1]}\n")
+        return self.header + "".join(lines)
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+    
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class Gauge(_Metric):
+    """
+    Read at scrape time from a callback returning a number, or a list of
+    (label values tuple, number) for labelled gauges. Gauges without a callback
+    hold a value set with set()/inc()/dec().
+    """
+    kind = "gauge"
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Any]] = None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+        self._value = 0.0
+    
+    def set(self, value: float):
+        self._value = value
+    
+    def inc(self, amount: float = 1):
+        self._value += amount
+    
+    def dec(self, amount: float = 1):
+        self._value -= amount
+    
+    def render(self) -> str:
+        value = self.callback() if self.callback else self._value
+        if value is None:
+            return ""
+        if isinstance(value, (int, float)):
+            samples: Iterable = [((), value)]
+        else:
+            samples = value
+        lines = [f"{self.name}{self._labels(tuple(labels))} {_format(float(number))}\n"
+                 for labels, number in samples if number is not None]
+        return self.header + "".join(lines)
+
+class Registry:
+    def __init__(self, max_age: float = 0.5):
+        self.max_age = max_age
+        self.metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._cached: Optional[str] = None
+        self._cached_at = 0.0
+        self.stats = {"renders": 0, "cache_hits": 0, "render_ms": 0.0}
+    
+    def _register(self, metric: _Metric) -> Any:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing  # Re-imported module (plugin hot reload): keep accumulated values
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+    
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+    
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, callback))
+    
+    def render(self) -> str:
+        """The exposition text, re-rendered at most every max_age seconds."""
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is not None and now - self._cached_at < self.max_age:
+                self.stats["cache_hits"] += 1
+                return self._cached
+            started = time.perf_counter()
+            parts = []
+            for metric in list(self.metrics.values()):
+                try:
+                    parts.append(metric.render())
+                except Exception as e:
+                    # One failing callback must not break the whole scrape
+                    logger.error(f"Metric {metric.name} render error: {e}")
+            parts.append("# EOF\n")
+            self._cached = "".join(parts)
+            self._cached_at = now
+            self.stats["renders"] += 1
+            self.stats["render_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            return self._cached
+
+metrics = Registry()
@@ -0,0 +1,299 @@
+"""
+Kalpana AGI - LAN Port Scanner
+Purpose: asyncio TCP connect scanner for host lists and CIDR ranges. A fixed pool of
+         workers bounds concurrency, a token bucket limits the connect rate, timeouts
+         adapt to each host's measured round-trip time, and open ports are yielded as
+         they are found. Reverse DNS names and service banners are cached.
+Dependencies: asyncio, ipaddress
+Notes: Only private, loopback and link-local targets are accepted unless
+       SCAN_ALLOW_PUBLIC is set; this is a LAN discovery tool.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from backend.config.settings import settings
+
+logger = logging.getLogger("Kalpana.PortScanner")
+
+# Ports that only answer after a request; everything else is read passively (SSH, SMTP, FTP...)
+HTTP_PORTS = {80, 8000, 8008, 8080, 8081, 8888}
+
+COMMON_PORTS = [21, 22, 23, 25, 53, 80, 110, 139, 143, 443, 445, 548, 554, 631, 993, 995,
+                1883, 3306, 3389, 5000, 5432, 5900, 6379, 8000, 8008, 8080, 8443, 8883, 9100]
+
+def parse_ports(spec: Union[str, Iterable[int], None]) -> List[int]:
+    """'22,80,8000-8010' (or a list of ints) -> sorted unique ports; None -> COMMON_PORTS."""
+    if spec is None:
+        return list(COMMON_PORTS)
+    if isinstance(spec, str):
+        ports = set()
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                low, high = (int(value) for value in part.split("-", 1))
+                # Checked before expanding, so a huge range cannot allocate a huge set
+                if not 1 <= low <= high <= 65535:
+                    raise ValueError(f"Invalid port range: {part}")
+                ports.update(range(low, high + 1))
+            else:
+                ports.add(int(part))
+    else:
+        ports = {int(port) for port in spec}
+    if not ports or min(ports) < 1 or max(ports) > 65535:
+        raise ValueError("Ports must be between 1 and 65535")
+    return sorted(ports)
+
+def _is_lan(address) -> bool:
+    """True for a private, loopback or link-local address or network."""
+    return address.is_private or address.is_loopback or address.is_link_local
+
+def parse_targets(targets: Union[str, Iterable[str]], allow_public: bool = False,
+                  max_hosts: Optional[int] = None) -> List[str]:
+    """
+    Host names, addresses and CIDR ranges ('192.168.1.0/24, nas.local') -> addresses.
+    Range sizes are checked against max_hosts before any address is generated.
+    """
+    if isinstance(targets, str):
+        targets = [part.strip() for part in targets.replace(",", " ").split()]
+    addresses = []
+    for target in targets:
+        if "/" in target:
+            network = ipaddress.ip_network(target, strict=False)
+            if not allow_public and not _is_lan(network):
+                raise ValueError(f"{network} is not a LAN range (set SCAN_ALLOW_PUBLIC to scan it)")
+            # hosts() leaves out at most two addresses; the loop below enforces the exact limit
+            if max_hosts is not None and network.num_addresses - 2 > max_hosts - len(addresses):
+                raise ValueError(f"{network} has {network.num_addresses} addresses, over the limit of {max_hosts} hosts")
+            hosts = network.hosts() if network.num_addresses > 2 else iter(network)
+        else:
+            try:
+                hosts = [ipaddress.ip_address(target)]
+            except ValueError:
+                hosts = [ipaddress.ip_address(socket.gethostbyname(target))]
+        for host in hosts:
+            if not allow_public and not _is_lan(host):
+                raise ValueError(f"{host} is not a LAN address (set SCAN_ALLOW_PUBLIC to scan it)")
+            if max_hosts is not None and len(addresses) >= max_hosts:
+                raise ValueError(f"More than {max_hosts} hosts requested")
+            addresses.append(str(host))
+    return addresses
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `burst`."""
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RTTEstimator:
+    """Per-host connect timeout from smoothed RTT and its variance (TCP's RTO rule)."""
+    
+    def __init__(self, initial: float, minimum: float, maximum: float):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.hosts: Dict[str, Tuple[float, float]] = {}  # host -> (srtt, rttvar)
+    
+    def timeout(self, host: str) -> float:
+        estimate = self.hosts.get(host)
+        if estimate is None:
+            return self.initial
+        srtt, rttvar = estimate
+        return min(self.maximum, max(self.minimum, srtt + 4 * rttvar))
+    
+    def observe(self, host: str, rtt: float):
+        estimate = self.hosts.get(host)
+        if estimate is None:
+            self.hosts[host] = (rtt, rtt / 2)
+        else:
+            srtt, rttvar = estimate
+            rttvar = 0.75 * rttvar + 0.25 * abs(srtt - rtt)
+            self.hosts[host] = (0.875 * srtt + 0.125 * rtt, rttvar)
+
+class _TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: Dict[Any, Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Any) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() < entry[0]:
+            self.hits += 1
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+    
+    def put(self, key: Any, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+
+class PortScanner:
+    def __init__(self, concurrency: int = 256, timeout: float = 1.0, min_timeout: float = 0.05,
+                 max_timeout: float = 3.0, rate: float = 0.0, banner_timeout: float = 0.5,
+                 cache_ttl: float = 3600.0, max_probes: int = 262144):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.rate = rate
+        self.banner_timeout = banner_timeout
+        self.max_probes = max_probes
+        self.dns_cache = _TTLCache(cache_ttl)
+        self.banner_cache = _TTLCache(cache_ttl)
+    
+    async def _reverse_dns(self, host: str) -> Optional[str]:
+        found, name = self.dns_cache.get(host)
+        if found:
+            return name
+        loop = asyncio.get_running_loop()
+        try:
+            name = (await asyncio.wait_for(loop.run_in_executor(None, socket.gethostbyaddr, host), timeout=2.0))[0]
+        except (OSError, asyncio.TimeoutError):
+            name = None  # Negative answers are cached too
+        self.dns_cache.put(host, name)
+        return name
+    
+    async def _banner(self, host: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
+        found, banner = self.banner_cache.get((host, port))
+        if found:
+            return banner
+        try:
+            if port in HTTP_PORTS:
+                writer.write(f"HEAD / HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+                await writer.drain()
+            data = await asyncio.wait_for(reader.read(256), timeout=self.banner_timeout)
+            banner = data.decode("utf-8", errors="replace").split("\r\n", 1)[0].split("\n", 1)[0].strip()
+        except (OSError, asyncio.TimeoutError):
+            banner = ""
+        self.banner_cache.put((host, port), banner)
+        return banner
+    
+    async def _probe(self, host: str, port: int, rtt: RTTEstimator, stats: Dict[str, int],
+                     grab_banners: bool) -> Optional[Dict[str, Any]]:
+        timeout = rtt.timeout(host)
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        except asyncio.TimeoutError:
+            stats["filtered"] += 1
+            return None
+        except ConnectionRefusedError:
+            # An RST is still a round trip: it trains the timeout for this host
+            rtt.observe(host, time.perf_counter() - started)
+            stats["closed"] += 1
+            return None
+        except OSError:
+            stats["unreachable"] += 1
+            return None
+        
+        elapsed = time.perf_counter() - started
+        rtt.observe(host, elapsed)
+        stats["open"] += 1
+        try:
+            banner = await self._banner(host, port, reader, writer) if grab_banners else ""
+        finally:
+            writer.close()
+        try:
+            service = socket.getservbyport(port, "tcp")
+        except OSError:
+            service = ""
+        return {
+            "host": host,
+            "port": port,
+            "state": "open",
+            "service": service,
+            "banner": banner,
+            "rtt_ms": round(elapsed * 1000, 2)
+        }
+    
+    async def scan_iter(self, targets: Union[str, Iterable[str]], ports: Union[str, Iterable[int], None] = None,
+                        grab_banners: bool = True, resolve_names: bool = True,
+                        stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield open ports as they are found. Pass a dict as stats to read probe counts
+        (open/closed/filtered/unreachable, probes per second) while and after scanning.
+        """
+        port_list = parse_ports(ports)
+        # The host limit follows from the probe limit, so oversized ranges fail before they are expanded.
+        # Host names are resolved with blocking calls, so parsing runs off the event loop.
+        hosts = await asyncio.get_running_loop().run_in_executor(
+            None, parse_targets, targets, settings.SCAN_ALLOW_PUBLIC, self.max_probes // len(port_list)
+        )
+        total = len(hosts) * len(port_list)
+        
+        stats = {} if stats is None else stats
+        stats.update({"hosts": len(hosts), "ports": len(port_list), "probes": total, "done": 0,
+                      "open": 0, "closed": 0, "filtered": 0, "unreachable": 0})
+        rtt = RTTEstimator(self.timeout, self.min_timeout, self.max_timeout)
+        bucket = TokenBucket(self.rate)
+        # Port-major order spreads consecutive probes across hosts
+        probes: Iterator[Tuple[str, int]] = ((host, port) for port in port_list for host in hosts)
+        results: asyncio.Queue = asyncio.Queue()
+        started = time.perf_counter()
+        
+        async def worker():
+            for host, port in probes:
+                await bucket.acquire()
+                try:
+                    result = await self._probe(host, port, rtt, stats, grab_banners)
+                except Exception as e:
+                    logger.error(f"Probe {host}:{port} error: {e}")
+                    result = None
+                stats["done"] += 1
+                if result is not None:
+                    await results.put(result)
+        
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, total) or 1)]
+        finished = asyncio.gather(*workers)
+        try:
+            while not (finished.done() and results.empty()):
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                result = getter.result()
+                if resolve_names:
+                    result["hostname"] = await self._reverse_dns(result["host"])
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            elapsed = time.perf_counter() - started
+            stats["seconds"] = round(elapsed, 3)
+            stats["probes_per_second"] = round(stats["done"] / elapsed, 1) if elapsed > 0 else 0.0
+    
+    async def scan(self, targets: Union[str, Iterable[str]], ports: Union[str, Iterable[int], None] = None,
+                   grab_banners: bool = True, resolve_names: bool = True) -> Dict[str, Any]:
+        """Run a scan to completion and return every open port."""
+        try:
+            stats: Dict[str, Any] = {}
+            results = [result async for result in self.scan_iter(targets, ports, grab_banners, resolve_names, stats)]
+            results.sort(key=lambda result: (ipaddress.ip_address(result["host"]), result["port"]))
+            return {"status": "success", "results": results, **stats}
+            
+        except Exception as e:
+            logger.error(f"Port scan error: {e}")
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,106 @@
+"""
+Kalpana AGI - Process Table
+Purpose: Top-N processes by CPU and memory, refreshed incrementally from cached
+         psutil.Process objects.
+Dependencies: psutil
+Notes: Keeping one Process per pid lets cpu_percent() measure against the previous
+       refresh, and oneshot() reads each process's /proc stat files once per tick
+       instead of once per attribute. Names are read only when a pid first appears.
+"""
+
+import heapq
+import logging
+import threading
+import time
+import psutil
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("Kalpana.ProcessTable")
+
+class ProcessTable:
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self._processes: Dict[int, psutil.Process] = {}
+        self._names: Dict[int, str] = {}
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"refreshes": 0, "created": 0, "exited": 0, "last_ms": 0.0}
+    
+    def refresh(self) -> Dict[str, Any]:
+        """Update every process row; returns the top-N summary for the snapshot."""
+        started = time.perf_counter()
+        pids = set(psutil.pids())
+        
+        for pid in list(self._processes):
+            if pid not in pids:
+                self._forget(pid)
+        for pid in pids:
+            if pid not in self._processes:
+                try:
+                    process = psutil.Process(pid)
+                    self._names[pid] = process.name()
+                    # First call primes the CPU counters; the next refresh reports a real percentage
+                    process.cpu_percent(None)
+                    self._processes[pid] = process
+                    self.stats["created"] += 1
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    continue
+        
+        rows = {}
+        for pid, process in list(self._processes.items()):
+            try:
+                with process.oneshot():
+                    rows[pid] = {
+                        "pid": pid,
+                        "name": self._names[pid],
+                        "cpu": round(process.cpu_percent(None), 1),
+                        "rss": process.memory_info().rss,
+                        "threads": process.num_threads()
+                    }
+            except psutil.NoSuchProcess:
+                self._forget(pid)
+            except (psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        
+        with self._lock:
+            self.rows = rows
+        self.stats["refreshes"] += 1
+        self.stats["last_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return {
+            "count": len(rows),
+            "top_cpu": self.top(self.top_n, "cpu"),
+            "top_memory": self.top(self.top_n, "rss")
+        }
+    
+    def _forget(self, pid: int):
+        self._processes.pop(pid, None)
+        self._names.pop(pid, None)
+        self.stats["exited"] += 1
+    
+    def top(self, limit: int = 10, key: str = "cpu") -> List[Dict[str, Any]]:
+        """The `limit` processes with the highest cpu or rss from the last refresh."""
+        with self._lock:
+            rows = self.rows
+        return heapq.nlargest(limit, rows.values(), key=lambda row: row[key])
+    
+    def get_processes(self, limit: int = 10, sort: str = "cpu", name: Optional[str] = None) -> Dict[str, Any]:
+        """Process listing for the API, optionally filtered by a name substring."""
+        try:
+            key = {"cpu": "cpu", "memory": "rss", "rss": "rss"}.get(sort)
+            if key is None:
+                return {"status": "error", "message": f"Unknown sort: {sort}"}
+            with self._lock:
+                rows = self.rows
+            if name:
+                needle = name.lower()
+                rows = {pid: row for pid, row in rows.items() if needle in row["name"].lower()}
+            return {
+                "status": "success",
+                "count": len(rows),
+                "processes": heapq.nlargest(limit, rows.values(), key=lambda row: row[key]),
+                **self.stats
+            }
+            
+        except Exception as e:
+            logger.error(f"Process listing error: {e}")
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,179 @@
+"""
+Kalpana AGI - System Stats Channels
+Purpose: Socket.IO subscription rooms for system_stats. Clients pick metric groups and an
+         update interval; each room is sent only the fields that moved beyond a threshold
+         since its last emit, and per-room emit counts and bytes/sec are tracked.
+Dependencies: None
+"""
+
+import json
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Metric group -> snapshot fields
+GROUPS = {
+    "cpu": ("cpu", "cores"),
+    "memory": ("ram",),
+    "disk": ("disk", "disk_read_rate", "disk_write_rate"),
+    "power": ("battery", "power_plugged"),
+    "network": ("net_sent_rate", "net_recv_rate"),
+    "processes": ("processes",),
+}
+
+# Smallest change worth sending (percent points, or bytes/s for rates); other fields send on any change
+THRESHOLDS = {
+    "cpu": 1.0,
+    "cores": 2.0,
+    "ram": 0.5,
+    "disk": 0.1,
+    "battery": 1.0,
+    "net_sent_rate": 1024.0,
+    "net_recv_rate": 1024.0,
+    "disk_read_rate": 1024.0,
+    "disk_write_rate": 1024.0,
+}
+
+INTERVALS = (1, 2, 5, 10)
+
+def _changed(field: str, old: Any, new: Any) -> bool:
+    threshold = THRESHOLDS.get(field)
+    if threshold is None or old is None or new is None:
+        return old != new
+    if isinstance(new, (list, tuple)):
+        return len(old) != len(new) or any(abs(a - b) >= threshold for a, b in zip(old, new))
+    return abs(new - old) >= threshold
+
+class Room:
+    __slots__ = ("name", "group", "interval", "members", "last_sent", "next_due", "emits", "bytes", "recent")
+    
+    def __init__(self, group: str, interval: int):
+        self.name = f"stats:{group}:{interval}"
+        self.group = group
+        self.interval = interval
+        self.members: Set[str] = set()
+        self.last_sent: Dict[str, Any] = {}
+        self.next_due = 0.0
+        self.emits = 0
+        self.bytes = 0
+        self.recent: deque = deque()  # (time, bytes) over the last minute, for bytes/sec
+    
+    def delta(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Fields that moved beyond their threshold since the last emit (compared to what was sent, so drift accumulates)."""
+        changes = {}
+        for field in GROUPS[self.group]:
+            if field not in snapshot:
+                continue
+            value = snapshot[field]
+            if field not in self.last_sent or _changed(field, self.last_sent[field], value):
+                changes[field] = value
+        return changes
+    
+    def record(self, size: int, now: float):
+        self.emits += 1
+        self.bytes += size
+        self.recent.append((now, size))
+        while self.recent and self.recent[0][0] < now - 60:
+            self.recent.popleft()
+    
+    def stats(self, now: float) -> Dict[str, Any]:
+        while self.recent and self.recent[0][0] < now - 60:
+            self.recent.popleft()
+        return {
+            "room": self.name,
+            "group": self.group,
+            "interval": self.interval,
+            "subscribers": len(self.members),
+            "emits": self.emits,
+            "bytes": self.bytes,
+            "bytes_per_second": round(sum(size for _, size in self.recent) / 60, 1)
+        }
+
+class StatsChannels:
+    """Room bookkeeping; called from the event loop only."""
+    
+    def __init__(self):
+        self.rooms: Dict[str, Room] = {}
+        self.members: Dict[str, Set[str]] = {}  # sid -> room names
+        self.skipped = 0  # Due emits suppressed because nothing changed
+    
+    @property
+    def subscriber_count(self) -> int:
+        return len(self.members)
+    
+    @staticmethod
+    def normalize_interval(interval: Optional[float]) -> int:
+        """Round a requested interval up to a supported one."""
+        if not interval:
+            return 2
+        return next((choice for choice in INTERVALS if choice >= interval), INTERVALS[-1])
+    
+    def subscribe(self, sid: str, groups: Iterable[str], interval: Optional[float] = None) -> List[str]:
+        """Add sid to the rooms for groups at interval; returns the room names joined."""
+        interval = self.normalize_interval(interval)
+        joined = []
+        for group in groups:
+            if group not in GROUPS:
+                raise ValueError(f"Unknown metric group: {group}")
+            # One interval per group and client: moving to a new rate leaves the old room
+            self.unsubscribe(sid, [group])
+            name = f"stats:{group}:{interval}"
+            room = self.rooms.get(name)
+            if room is None:
+                room = self.rooms[name] = Room(group, interval)
+            room.members.add(sid)
+            self.members.setdefault(sid, set()).add(name)
+            joined.append(name)
+        return joined
+    
+    def unsubscribe(self, sid: str, groups: Optional[Iterable[str]] = None) -> List[str]:
+        """Remove sid from its rooms (only those for groups, if given); returns the room names left."""
+        names = self.members.get(sid, set())
+        wanted = None if groups is None else set(groups)
+        left = [name for name in names if wanted is None or self.rooms[name].group in wanted]
+        for name in left:
+            room = self.rooms[name]
+            room.members.discard(sid)
+            names.discard(name)
+            if not room.members:
+                del self.rooms[name]
+        if not names:
+            self.members.pop(sid, None)
+        return left
+    
+    def snapshot_for(self, room_name: str, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Full group payload for a client that just joined."""
+        room = self.rooms[room_name]
+        payload = {field: snapshot[field] for field in GROUPS[room.group] if field in snapshot}
+        if not room.last_sent:
+            # A new room starts from what its first member was just sent
+            room.last_sent.update(payload)
+            room.next_due = time.monotonic() + room.interval
+        return payload
+    
+    def due(self, snapshot: Dict[str, Any], now: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """(room, delta payload) for rooms whose interval elapsed and whose fields changed."""
+        now = time.monotonic() if now is None else now
+        payloads = []
+        for room in list(self.rooms.values()):
+            if now < room.next_due:
+                continue
+            room.next_due = now + room.interval
+            changes = room.delta(snapshot)
+            if not changes:
+                self.skipped += 1
+                continue
+            room.last_sent.update(changes)
+            room.record(len(json.dumps(changes, separators=(",", ":"))), now)
+            payloads.append((room.name, changes))
+        return payloads
+    
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        rooms = [room.stats(now) for room in self.rooms.values()]
+        return {
+            "subscribers": self.subscriber_count,
+            "skipped_unchanged": self.skipped,
+            "bytes_per_second": round(sum(room["bytes_per_second"] for room in rooms), 1),
+            "rooms": sorted(rooms, key=lambda room: room["room"])
+        }
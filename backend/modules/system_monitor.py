@@ -1,54 +1,251 @@
 """
 Kalpana AGI - System Monitor Module
-Purpose: Collect real-time system statistics (CPU, RAM, Disk, Network).
-Dependencies: psutil
+Purpose: Collect real-time system statistics (CPU, per-core, RAM, Disk, disk I/O and
+         network rates, top processes).
+Dependencies: psutil, numpy
+Notes: Probes run on a dedicated sampler thread, each at its own cadence, and publish
+       an immutable snapshot. The async emitter only reads that snapshot, so slow
+       syscalls (sensors_battery can take tens of ms) never block the event loop.
+       Clients subscribe to metric groups (see stats_channels); with no subscribers the
+       sampler backs off to idle_interval (None pauses it until someone subscribes).
 """
 
 import asyncio
+import threading
+from collections import deque
+import time
 import psutil
 import logging
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional
+from backend.modules.metrics_history import MetricsHistory
+from backend.modules.stats_channels import StatsChannels
+from backend.modules.process_table import ProcessTable
+from backend.modules.anomaly import AnomalyDetector
 
 logger = logging.getLogger("Kalpana.SystemMonitor")
 
 class SystemMonitor:
-    def __init__(self):
+    def __init__(self, sample_interval: float = 1.0, history_seconds: float = 3600,
+                 idle_interval: Optional[float] = 10.0):
         self.running = False
-
+        self.sample_interval = sample_interval
+        self.idle_interval = idle_interval
+        self.channels = StatsChannels()
+        # (name, probe, minimum seconds between runs); each probe returns fields for the snapshot
+        self.probes: List[tuple] = [
+            ("cpu", self._probe_cpu, 0),
+            ("cores", self._probe_cores, 0),
+            ("net", self._probe_net, 0),
+            ("ram", self._probe_ram, 0),
+            ("disk_io", self._probe_disk_io, 0),
+            ("disk", self._probe_disk, 10),
+            ("battery", self._probe_battery, 30),
+            ("processes", self._probe_processes, 5),
+        ]
+        self.probe_timings: Dict[str, Dict[str, float]] = {
+            name: {"calls": 0, "errors": 0, "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0} for name, _, _ in self.probes
+        }
+        self._last_run: Dict[str, float] = {}
+        self._fields: Dict[str, Any] = {}
+        # Latest snapshot: replaced wholesale by the sampler, never mutated, so readers need no lock
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._counters: Dict[str, tuple] = {}  # Last raw counters per probe, for rates
+        self.process_table = ProcessTable(top_n=10)
+        self.core_count = psutil.cpu_count() or 1
+        self.history = MetricsHistory(
+            ["cpu", "ram", "disk", "battery", "net_sent_rate", "net_recv_rate", "disk_read_rate", "disk_write_rate"]
+            + [f"core{i}" for i in range(self.core_count)],
+            capacity=max(1, int(history_seconds / sample_interval))
+        )
+        self.anomalies = AnomalyDetector(self.history.columns)
+        self._pending_events: deque = deque(maxlen=100)  # Filled by the sampler, drained by the emitter
+    
+    def _probe_cpu(self) -> Dict[str, Any]:
+        return {"cpu": psutil.cpu_percent(interval=None)}
+    
+    def _probe_cores(self) -> Dict[str, Any]:
+        return {"cores": psutil.cpu_percent(interval=None, percpu=True)}
+    
+    def _counter_rates(self, key: str, counters: Dict[str, int]) -> Dict[str, float]:
+        """Per-second rates of monotonically increasing counters since the previous call."""
+        now = time.monotonic()
+        previous = self._counters.get(key)
+        self._counters[key] = (counters, now)
+        if previous is None or now <= previous[1]:
+            return {field: 0.0 for field in counters}
+        elapsed = now - previous[1]
+        # Counters can wrap or reset (interface down/up, disk hot-plug); never report negative rates
+        return {field: round(max(0, value - previous[0][field]) / elapsed, 1) for field, value in counters.items()}
+    
+    def _probe_net(self) -> Dict[str, Any]:
+        """Bytes per second sent/received since the previous sample."""
+        counters = psutil.net_io_counters()
+        return self._counter_rates("net", {"net_sent_rate": counters.bytes_sent, "net_recv_rate": counters.bytes_recv})
+    
+    def _probe_disk_io(self) -> Dict[str, Any]:
+        """Bytes per second read/written across all disks."""
+        counters = psutil.disk_io_counters()
+        if counters is None:
+            return {}  # No block devices visible (some containers)
+        return self._counter_rates("disk_io", {"disk_read_rate": counters.read_bytes, "disk_write_rate": counters.write_bytes})
+    
+    def _probe_processes(self) -> Dict[str, Any]:
+        return {"processes": self.process_table.refresh()}
+    
+    def _probe_ram(self) -> Dict[str, Any]:
+        return {"ram": psutil.virtual_memory().percent}
+    
+    def _probe_disk(self) -> Dict[str, Any]:
+        return {"disk": psutil.disk_usage('/').percent}
+    
+    def _probe_battery(self) -> Dict[str, Any]:
+        battery = psutil.sensors_battery()
+        return {
+            "battery": battery.percent if battery else 100,
+            "power_plugged": battery.power_plugged if battery else True
+        }
+    
+    def _run_probe(self, name: str, probe: Callable[[], Dict[str, Any]]):
+        timing = self.probe_timings[name]
+        started = time.perf_counter()
+        try:
+            self._fields.update(probe())
+        except Exception as e:
+            timing["errors"] += 1
+            logger.error(f"Error collecting {name} stats: {e}")
+        elapsed = (time.perf_counter() - started) * 1000
+        timing["calls"] += 1
+        timing["last_ms"] = round(elapsed, 3)
+        timing["max_ms"] = round(max(timing["max_ms"], elapsed), 3)
+        # Exponentially weighted, so a probe that turns slow shows up within a few samples
+        timing["avg_ms"] = round(elapsed if timing["calls"] == 1 else 0.8 * timing["avg_ms"] + 0.2 * elapsed, 3)
+    
+    def sample(self) -> Dict[str, Any]:
+        """Run the probes that are due and publish a new snapshot."""
+        now = time.monotonic()
+        for name, probe, every in self.probes:
+            if name not in self._last_run or now - self._last_run[name] >= every:
+                self._last_run[name] = now
+                self._run_probe(name, probe)
+        self._sequence += 1
+        snapshot = dict(self._fields)
+        self._snapshot = snapshot
+        row = dict(snapshot)
+        for i, percent in enumerate(snapshot.get("cores", ())):
+            row[f"core{i}"] = percent
+        values = self.history.append(row)
+        for event in self.anomalies.update(values):
+            logger.warning(event["message"])
+            self._pending_events.append(event)
+        return snapshot
+    
+    def _current_interval(self) -> Optional[float]:
+        # Only back off while broadcasting; a bare sampler (tests, history) keeps full rate
+        if self.running and self.channels.subscriber_count == 0:
+            return self.idle_interval
+        return self.sample_interval
+    
+    def _sample_loop(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            interval = self._current_interval()
+            if interval is None:
+                self._wake.wait()
+            else:
+                # Fixed cadence: a slow sample shortens the next wait instead of drifting
+                deadline = max(deadline + interval, time.monotonic())
+                self._wake.wait(deadline - time.monotonic())
+            if self._wake.is_set():
+                self._wake.clear()
+                deadline = time.monotonic()
+    
+    def wake(self):
+        """Sample right away (e.g. the first subscriber arrived while idle)."""
+        self._wake.set()
+    
+    def start_sampler(self):
+        """Start the background sampler thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="system-sampler", daemon=True)
+        self._thread.start()
+    
     def get_stats(self) -> Dict[str, Any]:
         """
-        Fetch current system statistics.
+        Latest system statistics; empty until the sampler has published its first snapshot.
+        Called from async handlers and /metrics, so it never samples inline.
         """
-        try:
-            cpu_percent = psutil.cpu_percent(interval=None)
-            ram = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            battery = psutil.sensors_battery()
-            
-            stats = {
-                "cpu": cpu_percent,
-                "ram": ram.percent,
-                "disk": disk.percent,
-                "battery": battery.percent if battery else 100,
-                "power_plugged": battery.power_plugged if battery else True
-            }
-            return stats
-        except Exception as e:
-            logger.error(f"Error collecting stats: {e}")
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.wake()
             return {}
-
-    async def start_monitoring(self, sio, interval: int = 2):
+        return snapshot
+    
+    def get_probe_timings(self) -> Dict[str, Any]:
+        """How long each probe takes, to spot expensive collectors."""
+        return {
+            "samples": self._sequence,
+            "sample_interval": self.sample_interval,
+            "probes": {
+                name: {**self.probe_timings[name], "every": every} for name, _, every in self.probes
+            }
+        }
+    
+    def get_processes(self, limit: int = 10, sort: str = "cpu", name: Optional[str] = None) -> Dict[str, Any]:
+        """Processes from the last refresh, sorted by cpu or memory."""
+        return self.process_table.get_processes(limit, sort, name)
+    
+    def get_anomalies(self) -> Dict[str, Any]:
+        """Active metric anomalies, recent alerts and detector cost."""
+        return self.anomalies.get_status()
+    
+    def get_history(self, metrics: Optional[List[str]] = None, window: float = 3600,
+                    resolution: Optional[float] = None) -> Dict[str, Any]:
+        """Recent samples of the given metrics (all by default), optionally downsampled."""
+        return self.history.query(metrics, window, resolution)
+    
+    def subscribe(self, sid: str, groups: List[str], interval: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Join sid to metric group rooms; returns {room: full group snapshot} to send it first."""
+        idle = self.channels.subscriber_count == 0
+        rooms = self.channels.subscribe(sid, groups, interval)
+        if idle:
+            self.wake()
+        snapshot = self.get_stats()
+        return {room: self.channels.snapshot_for(room, snapshot) for room in rooms}
+    
+    def unsubscribe(self, sid: str, groups: Optional[List[str]] = None) -> List[str]:
+        return self.channels.unsubscribe(sid, groups)
+    
+    async def start_monitoring(self, sio, interval: int = 1):
         """
-        Start the monitoring loop and emit stats via Socket.IO.
+        Start the monitoring loop: every `interval` seconds, emit to each subscription room
+        whose rate is due only the fields that changed beyond their threshold.
         """
         self.running = True
+        self.start_sampler()
         logger.info("System Monitor started.")
         while self.running:
-            stats = self.get_stats()
-            await sio.emit('system_stats', stats)
+            # Only reads the published snapshot; never samples on the loop
+            snapshot = self._snapshot
+            if snapshot is not None:
+                for room, changes in self.channels.due(snapshot):
+                    await sio.emit('system_stats', changes, room=room)
+            while self._pending_events:
+                await sio.emit('system_event', self._pending_events.popleft())
             await asyncio.sleep(interval)
-
+    
     def stop(self):
         self.running = False
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
 
 system_monitor = SystemMonitor()
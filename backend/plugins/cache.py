@@ -0,0 +1,212 @@
+"""
+Kalpana AGI - Plugin Command Cache
+Purpose: Shared result cache for plugin commands (TTL, LRU, stale-while-revalidate, negative caching).
+Dependencies: concurrent.futures
+"""
+
+import logging
+import time
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Hashable, Optional
+from backend.plugins.loader import plugin_loader
+
+logger = logging.getLogger("Kalpana.PluginCache")
+
+class _Entry:
+    __slots__ = ("value", "error", "fresh_until", "stale_until")
+    
+    def __init__(self, value: Any, error: Optional[BaseException], fresh_until: float, stale_until: float):
+        self.value = value
+        self.error = error
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+def _is_failure(result: Any) -> bool:
+    """Plugins report failures as {"status": "error", ...} rather than raising."""
+    return isinstance(result, dict) and result.get("status") == "error"
+
+def normalize_arg(value: Any, casefold: bool = False) -> Hashable:
+    """
+    Normalize an argument so equivalent calls share a cache key. Strings only have their
+    whitespace collapsed unless casefold is set (for case-insensitive arguments like city names).
+    """
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value.casefold() if casefold else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_arg(v, casefold) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), normalize_arg(v, casefold)) for k, v in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(normalize_arg(v, casefold) for v in value))
+    return value
+
+class CommandCache:
+    """Bounded LRU cache with stale-while-revalidate and negative caching."""
+    
+    def __init__(self, max_entries: int = 512, refresh_workers: int = 2):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="plugin-cache")
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: float,
+                       stale_ttl: float = 0.0, negative_ttl: float = 0.0,
+                       refresh: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Return a cached result for key, computing (or refreshing) it as needed.
+        refresh, if given, replaces compute for background revalidation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now < entry.fresh_until:
+                    self._entries.move_to_end(key)
+                    self.stats["negative_hits" if entry.error or _is_failure(entry.value) else "hits"] += 1
+                    return self._unwrap(entry)
+                if now < entry.stale_until:
+                    # Serve the stale value and refresh once in the background
+                    self._entries.move_to_end(key)
+                    self.stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, refresh or compute, ttl, stale_ttl, negative_ttl)
+                    return self._unwrap(entry)
+            
+            # Miss: only one caller computes, concurrent callers wait for its result
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = Future()
+                self._pending[key] = pending
+                owner = True
+                self.stats["misses"] += 1
+            else:
+                owner = False
+        
+        if not owner:
+            return pending.result()
+        
+        try:
+            result = self._compute_and_store(key, compute, ttl, stale_ttl, negative_ttl)
+            pending.set_result(result)
+            return result
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+    
+    def _unwrap(self, entry: _Entry) -> Any:
+        if entry.error is not None:
+            raise entry.error
+        return entry.value
+    
+    def _compute_and_store(self, key: Hashable, compute: Callable[[], Any], ttl: float,
+                           stale_ttl: float, negative_ttl: float) -> Any:
+        try:
+            result = compute()
+        except Exception as e:
+            if negative_ttl > 0:
+                self._store(key, _Entry(None, e, time.monotonic() + negative_ttl, 0.0))
+            raise
+        
+        now = time.monotonic()
+        if _is_failure(result):
+            if negative_ttl > 0:
+                self._store(key, _Entry(result, None, now + negative_ttl, 0.0))
+        elif ttl > 0:
+            self._store(key, _Entry(result, None, now + ttl, now + ttl + stale_ttl))
+        return result
+    
+    def _refresh(self, key: Hashable, compute: Callable[[], Any], ttl: float,
+                 stale_ttl: float, negative_ttl: float):
+        """Background revalidation; a failed refresh keeps serving the stale value."""
+        try:
+            result = compute()
+            if _is_failure(result):
+                logger.warning(f"Cache refresh failed for {key!r}: {result.get('message')}")
+            else:
+                now = time.monotonic()
+                self._store(key, _Entry(result, None, now + ttl, now + ttl + stale_ttl))
+                with self._lock:
+                    self.stats["refreshes"] += 1
+        except Exception as e:
+            logger.warning(f"Cache refresh error for {key!r}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+    
+    def _store(self, key: Hashable, entry: _Entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+    
+    def invalidate(self, prefix: Optional[str] = None):
+        """Drop all entries, or only those whose command name starts with prefix."""
+        with self._lock:
+            if prefix is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if isinstance(k, tuple) and str(k[0]).startswith(prefix)]:
+                    del self._entries[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, **self.stats}
+
+command_cache = CommandCache()
+
+def _current_method(plugin: Any, func: Callable) -> Callable:
+    """
+    The undecorated command on the instance the registry currently serves under plugin's
+    name, so a refresh after a hot reload runs the new code; plugin itself if not registered.
+    """
+    current = plugin_loader.get_plugin(getattr(plugin, "name", None))
+    if current is not None and current is not plugin:
+        method = getattr(type(current), func.__name__, None)
+        method = getattr(method, "__wrapped__", method)
+        if callable(method):
+            return functools.partial(method, current)
+    return functools.partial(func, plugin)
+
+def cached(ttl: float = 60.0, stale_ttl: float = 0.0, negative_ttl: float = 0.0,
+           cache: Optional[CommandCache] = None, casefold: bool = False):
+    """
+    Cache a plugin command's result, keyed on its normalized arguments.
+    ttl: seconds a result is fresh; stale_ttl: extra seconds it may be served while refreshing;
+    negative_ttl: seconds an error result (or exception) is remembered;
+    casefold: treat string arguments case-insensitively.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        name = func.__qualname__
+        
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = (name,) + tuple(
+                (arg, normalize_arg(value, casefold)) for arg, value in list(bound.arguments.items())[1:]
+            )
+            store = cache or command_cache
+            return store.get_or_compute(key, lambda: func(self, *args, **kwargs), ttl, stale_ttl, negative_ttl,
+                                        refresh=lambda: _current_method(self, func)(*args, **kwargs))
+        
+        wrapper.cache_info = lambda: (cache or command_cache).get_stats()
+        return wrapper
+    return decorator
@@ -1,20 +1,35 @@
 """
 Kalpana AGI - Calendar Integration Module (Local Storage)
 Purpose: Manage calendar events using local JSON storage (personal use)
+         Recurring events are stored once and expanded lazily inside the queried window.
 """
 
 import logging
 import os
 import json
-from datetime import datetime
-from typing import List, Dict, Any
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from backend.plugins.interval_tree import IntervalTree
+from backend.plugins.recurrence import RecurrenceRule
+from backend.plugins.ics import iter_ics_events, write_ics
 
 logger = logging.getLogger("Kalpana.Calendar")
 
 class CalendarManager:
-    def __init__(self):
-        self.events_file = os.path.join(os.path.dirname(__file__), "../data/calendar_events.json")
+    def __init__(self, events_file: Optional[str] = None):
+        self.events_file = events_file or os.path.join(os.path.dirname(__file__), "../data/calendar_events.json")
         self.events = []
+        self._index = IntervalTree()  # Events keyed by (start timestamp, id), augmented with max end
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._starts: Dict[str, float] = {}
+        self._by_uid: Dict[str, str] = {}
+        # Recurring masters: id -> (rule, dtstart, duration, excluded occurrence starts)
+        self._series: Dict[str, Tuple[RecurrenceRule, datetime, timedelta, set]] = {}
+        self._series_index = IntervalTree()  # Recurring masters only, spanning [DTSTART, end of last occurrence)
+        self._next_id = 1
+        self._lock = threading.RLock()
         self._load_events()
     
     def _load_events(self):
@@ -25,9 +40,97 @@ class CalendarManager:
                 with open(self.events_file, 'r') as f:
                     self.events = json.load(f)
                 logger.info(f"Loaded {len(self.events)} calendar events")
+            self._rebuild_index()
         except Exception as e:
             logger.error(f"Calendar load error: {e}")
             self.events = []
+            self._rebuild_index()
+    
+    def _rebuild_index(self):
+        """Parse event times once and index them."""
+        with self._lock:
+            self._by_id = {}
+            self._starts = {}
+            self._by_uid = {}
+            self._series = {}
+            items = []
+            for event in self.events:
+                try:
+                    start, end = self._event_span(event)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Skipping calendar event {event.get('id') if isinstance(event, dict) else event!r}: {e}")
+                    continue
+                items.append((start, end, event['id'], event))
+                self._by_id[event['id']] = event
+                self._starts[event['id']] = start
+                if event.get('uid'):
+                    self._by_uid[event['uid']] = event['id']
+            self._index = IntervalTree.build(items)
+            self._series_index = IntervalTree.build([item for item in items if item[2] in self._series])
+            numeric_ids = [
+                int(event_id[6:]) for event_id in self._by_id
+                if event_id.startswith("event_") and event_id[6:].isdigit()
+            ]
+            self._next_id = max(numeric_ids, default=0) + 1
+    
+    def _event_span(self, event: Dict[str, Any]) -> Tuple[float, float]:
+        """
+        Time span an event occupies in the index. A recurring master spans its whole series
+        (open-ended series extend to infinity) so window queries find it without copies.
+        """
+        start = datetime.fromisoformat(event['start_time'])
+        end = max(start, datetime.fromisoformat(event['end_time']))
+        if not event.get('rrule'):
+            return start.timestamp(), end.timestamp()
+        
+        try:
+            rule = RecurrenceRule.parse(event['rrule'])
+        except ValueError as e:
+            logger.warning(f"Unsupported recurrence on {event['id']} ({e}); treating as a single event")
+            return start.timestamp(), end.timestamp()
+        
+        duration = end - start
+        exdates = {datetime.fromisoformat(d) for d in event.get('exdates', [])}
+        self._series[event['id']] = (rule, start, duration, exdates)
+        last = rule.last_occurrence(start)
+        return start.timestamp(), float('inf') if last is None else (last + duration).timestamp()
+    
+    def _index_event(self, event: Dict[str, Any]):
+        """Add one event to the interval index (caller holds the lock)."""
+        start, end = self._event_span(event)
+        self._index.insert(start, end, event['id'], event)
+        if event['id'] in self._series:
+            self._series_index.insert(start, end, event['id'], event)
+        self._by_id[event['id']] = event
+        self._starts[event['id']] = start
+        if event.get('uid'):
+            self._by_uid[event['uid']] = event['id']
+    
+    def _occurrence(self, event: Dict[str, Any], start: datetime, duration: timedelta) -> Dict[str, Any]:
+        """Materialize one occurrence of a recurring event on demand (never stored)."""
+        occurrence = dict(event)
+        occurrence.update({
+            'id': f"{event['id']}@{start.isoformat()}",
+            'master_id': event['id'],
+            'recurrence_id': start.isoformat(),
+            'start_time': start.isoformat(),
+            'end_time': (start + duration).isoformat()
+        })
+        occurrence.pop('exdates', None)
+        return occurrence
+    
+    def _expand(self, event: Dict[str, Any], window_start: Optional[datetime] = None,
+                window_end: Optional[datetime] = None) -> Iterator[Tuple[datetime, Dict[str, Any]]]:
+        """Lazily yield (start, occurrence) for a recurring event, limited to a window."""
+        rule, dtstart, duration, exdates = self._series[event['id']]
+        # Occurrences starting up to one duration before the window still overlap it
+        search_start = window_start - duration if window_start is not None else None
+        for start in rule.occurrences(dtstart, start=search_start, end=window_end):
+            if start in exdates:
+                continue
+            if window_start is not None and start + duration <= window_start and start < window_start:
+                continue
+            yield start, self._occurrence(event, start, duration)
     
     def _save_events(self):
         """Save events to JSON file."""
@@ -38,24 +141,36 @@ class CalendarManager:
         except Exception as e:
             logger.error(f"Calendar save error: {e}")
     
-    def create_event(self, summary: str, start_time: datetime, end_time: datetime, description: str = "") -> Dict[str, Any]:
-        """Create a calendar event."""
+    def create_event(self, summary: str, start_time: datetime, end_time: datetime, description: str = "",
+                     rrule: Optional[str] = None) -> Dict[str, Any]:
+        """Create a calendar event. rrule makes it recurring (e.g. "FREQ=WEEKLY;BYDAY=MO,WE")."""
         try:
-            event_id = f"event_{len(self.events) + 1}"
-            event = {
-                'id': event_id,
-                'summary': summary,
-                'description': description,
-                'start_time': start_time.isoformat(),
-                'end_time': end_time.isoformat(),
-                'created_at': datetime.now().isoformat()
-            }
+            if end_time < start_time:
+                return {"status": "error", "message": "Event ends before it starts"}
+            if rrule:
+                rrule = RecurrenceRule.parse(rrule).to_string()
             
-            self.events.append(event)
+            with self._lock:
+                event_id = f"event_{self._next_id}"
+                self._next_id += 1
+                event = {
+                    'id': event_id,
+                    'summary': summary,
+                    'description': description,
+                    'start_time': start_time.isoformat(),
+                    'end_time': end_time.isoformat(),
+                    'created_at': datetime.now().isoformat()
+                }
+                if rrule:
+                    event['rrule'] = rrule
+                    event['exdates'] = []
+                conflicts = [e['id'] for e in self._overlapping(start_time, end_time)]
+                self.events.append(event)
+                self._index_event(event)
             self._save_events()
             
             logger.info(f"Created event: {summary}")
-            return {"status": "success", "event_id": event_id}
+            return {"status": "success", "event_id": event_id, "conflicts": conflicts}
             
         except Exception as e:
             logger.error(f"Create event error: {e}")
@@ -65,23 +180,138 @@ class CalendarManager:
         """Get upcoming events."""
         try:
             now = datetime.now()
-            upcoming = [
-                e for e in self.events
-                if datetime.fromisoformat(e['start_time']) >= now
-            ]
-            upcoming.sort(key=lambda x: x['start_time'])
+            with self._lock:
+                single = (
+                    (datetime.fromisoformat(event['start_time']), event)
+                    for _, _, event in self._index.starting_from(now.timestamp())
+                    if event['id'] not in self._series
+                )
+                # Each series that has not ended contributes a lazy stream of its future occurrences
+                live_series = self._series_index.overlapping(now.timestamp(), float('inf'))
+                streams = [single] + [self._expand(event, now) for _, _, event in live_series]
+                upcoming = []
+                for start, event in heapq.merge(*streams, key=lambda item: item[0]):
+                    if len(upcoming) >= max_results:
+                        break
+                    if start >= now:
+                        upcoming.append(event)
             
-            logger.info(f"Retrieved {len(upcoming[:max_results])} upcoming events")
-            return upcoming[:max_results]
+            logger.info(f"Retrieved {len(upcoming)} upcoming events")
+            return upcoming
             
         except Exception as e:
             logger.error(f"Get events error: {e}")
             return []
     
+    def _overlapping(self, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        """Events (and expanded recurring occurrences) overlapping [start_time, end_time), ordered by start."""
+        with self._lock:
+            results = []
+            expanded = False
+            for start, _, event in self._index.overlapping(start_time.timestamp(), end_time.timestamp()):
+                if event['id'] in self._series:
+                    expanded = True
+                    results.extend(self._expand(event, start_time, end_time))
+                else:
+                    results.append((datetime.fromtimestamp(start), event))
+            if expanded:
+                results.sort(key=lambda item: item[0])
+            return [event for _, event in results]
+    
+    def get_events_between(self, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        """Get events that overlap a time range."""
+        try:
+            return self._overlapping(start_time, end_time)
+        except Exception as e:
+            logger.error(f"Get events between error: {e}")
+            return []
+    
+    def get_conflicts(self, start_time: datetime, end_time: datetime, exclude_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get events that would clash with a proposed time range."""
+        try:
+            return [
+                e for e in self._overlapping(start_time, end_time)
+                if exclude_id is None or exclude_id not in (e['id'], e.get('master_id'))
+            ]
+        except Exception as e:
+            logger.error(f"Get conflicts error: {e}")
+            return []
+    
+    def get_free_busy(self, start_time: datetime, end_time: datetime) -> Dict[str, Any]:
+        """Get merged busy blocks and the free gaps between them within a range."""
+        try:
+            busy = []
+            for event in self._overlapping(start_time, end_time):
+                block_start = max(datetime.fromisoformat(event['start_time']), start_time)
+                block_end = min(datetime.fromisoformat(event['end_time']), end_time)
+                if busy and block_start <= busy[-1][1]:
+                    busy[-1][1] = max(busy[-1][1], block_end)
+                else:
+                    busy.append([block_start, block_end])
+            
+            free = []
+            cursor = start_time
+            for block_start, block_end in busy:
+                if block_start > cursor:
+                    free.append([cursor, block_start])
+                cursor = max(cursor, block_end)
+            if cursor < end_time:
+                free.append([cursor, end_time])
+            
+            return {
+                "status": "success",
+                "busy": [{"start": b[0].isoformat(), "end": b[1].isoformat()} for b in busy],
+                "free": [{"start": f[0].isoformat(), "end": f[1].isoformat()} for f in free]
+            }
+        except Exception as e:
+            logger.error(f"Free/busy error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def find_free_slots(self, start_time: datetime, end_time: datetime, duration_minutes: int = 60,
+                        max_results: int = 5) -> List[Dict[str, str]]:
+        """Find free slots of at least duration_minutes within a range."""
+        free_busy = self.get_free_busy(start_time, end_time)
+        if free_busy.get("status") != "success":
+            return []
+        
+        duration = timedelta(minutes=duration_minutes)
+        slots = []
+        for gap in free_busy["free"]:
+            gap_start = datetime.fromisoformat(gap["start"])
+            if datetime.fromisoformat(gap["end"]) - gap_start >= duration:
+                slots.append({"start": gap["start"], "end": (gap_start + duration).isoformat()})
+                if len(slots) >= max_results:
+                    break
+        return slots
+    
     def delete_event(self, event_id: str) -> Dict[str, Any]:
-        """Delete a calendar event."""
+        """Delete a calendar event. Deleting "<id>@<start>" removes one occurrence of a series."""
         try:
-            self.events = [e for e in self.events if e['id'] != event_id]
+            with self._lock:
+                if "@" in event_id:
+                    master_id, recurrence_id = event_id.split("@", 1)
+                    if master_id not in self._series:
+                        return {"status": "error", "message": f"No recurring event {master_id}"}
+                    rule, dtstart, _, exdates = self._series[master_id]
+                    try:
+                        occurrence = datetime.fromisoformat(recurrence_id)
+                    except ValueError:
+                        return {"status": "error", "message": f"Invalid occurrence: {recurrence_id}"}
+                    # Only a real occurrence of the series may become an exdate
+                    if next(rule.occurrences(dtstart, start=occurrence, end=occurrence + timedelta(microseconds=1)), None) != occurrence:
+                        return {"status": "error", "message": f"{recurrence_id} is not an occurrence of {master_id}"}
+                    self._by_id[master_id].setdefault('exdates', []).append(occurrence.isoformat())
+                    exdates.add(occurrence)
+                else:
+                    event = self._by_id.pop(event_id, None)
+                    if event is not None:
+                        start = self._starts.pop(event_id)
+                        self._index.remove(start, event_id)
+                        if self._series.pop(event_id, None) is not None:
+                            self._series_index.remove(start, event_id)
+                        if event.get('uid'):
+                            self._by_uid.pop(event['uid'], None)
+                        self.events.remove(event)
             self._save_events()
             logger.info(f"Deleted event: {event_id}")
             return {"status": "success"}
@@ -89,6 +319,71 @@ class CalendarManager:
         except Exception as e:
             logger.error(f"Delete event error: {e}")
             return {"status": "error", "message": str(e)}
+    
+    def import_ics(self, path: str) -> Dict[str, Any]:
+        """
+        Stream events from an .ics file into the calendar. Events whose UID is already
+        present are skipped, so re-importing the same calendar is cheap. Nothing is added
+        unless the whole file is read successfully.
+        """
+        try:
+            imported = skipped = recurring = 0
+            with open(path, 'r', encoding='utf-8', errors='replace') as f, self._lock:
+                new_events = []
+                new_uids = set()
+                next_id = self._next_id
+                for parsed in iter_ics_events(f):
+                    if parsed['uid'] and (parsed['uid'] in self._by_uid or parsed['uid'] in new_uids):
+                        skipped += 1
+                        continue
+                    event = {
+                        'id': f"event_{next_id}",
+                        'uid': parsed['uid'],
+                        'summary': parsed['summary'],
+                        'description': parsed['description'],
+                        'start_time': parsed['start'].isoformat(),
+                        'end_time': parsed['end'].isoformat(),
+                        'created_at': datetime.now().isoformat()
+                    }
+                    if parsed['rrule']:
+                        event['rrule'] = parsed['rrule']
+                        event['exdates'] = [d.isoformat() for d in parsed['exdates']]
+                        recurring += 1
+                    next_id += 1
+                    new_events.append(event)
+                    if event['uid']:
+                        new_uids.add(event['uid'])
+                    imported += 1
+                if imported:
+                    self.events.extend(new_events)
+                    try:
+                        self._rebuild_index()  # One bulk build beats per-event inserts for large files
+                    except Exception:
+                        del self.events[-len(new_events):]
+                        self._rebuild_index()
+                        raise
+            self._save_events()
+            
+            logger.info(f"Imported {imported} events from {path} ({skipped} already present)")
+            return {"status": "success", "imported": imported, "skipped": skipped, "recurring": recurring}
+            
+        except Exception as e:
+            logger.error(f"ICS import error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def export_ics(self, path: str) -> Dict[str, Any]:
+        """Stream all events (recurring ones as RRULE masters) to an .ics file."""
+        try:
+            with self._lock:
+                events = list(self.events)
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                count = write_ics(events, f)
+            logger.info(f"Exported {count} events to {path}")
+            return {"status": "success", "exported": count}
+            
+        except Exception as e:
+            logger.error(f"ICS export error: {e}")
+            return {"status": "error", "message": str(e)}
 
 calendar_manager = CalendarManager()
 
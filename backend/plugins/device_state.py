@@ -0,0 +1,244 @@
+"""
+Kalpana AGI - Device State & Message Log
+Purpose: Bounded columnar message log (ring buffer), MQTT topic trie with +/# wildcard lookups,
+         and a device state store that reports only the fields that actually changed.
+Dependencies: array
+"""
+
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+class TopicTrie:
+    """
+    Maps MQTT topics (or topic filters) to values, one trie level per topic segment.
+    match() finds stored topics for a wildcard filter; lookup() finds stored filters for a topic.
+    """
+    
+    __slots__ = ("children", "value", "has_value", "_size")
+    
+    def __init__(self):
+        self.children: Dict[str, "TopicTrie"] = {}
+        self.value: Any = None
+        self.has_value = False
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def insert(self, topic: str, value: Any) -> bool:
+        """Store value under topic; returns True if the topic is new."""
+        node = self
+        for level in topic.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TopicTrie()
+            node = child
+        added = not node.has_value
+        node.value, node.has_value = value, True
+        if added:
+            self._size += 1
+        return added
+    
+    def get(self, topic: str, default: Any = None) -> Any:
+        node = self
+        for level in topic.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return default
+        return node.value if node.has_value else default
+    
+    def remove(self, topic: str) -> bool:
+        path, node = [], self
+        for level in topic.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                return False
+            path.append((node, level))
+            node = child
+        if not node.has_value:
+            return False
+        node.value, node.has_value = None, False
+        self._size -= 1
+        # Prune now-empty branches
+        for parent, level in reversed(path):
+            child = parent.children[level]
+            if child.has_value or child.children:
+                break
+            del parent.children[level]
+        return True
+    
+    def items(self, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+        if self.has_value and prefix:
+            yield prefix, self.value
+        for level, child in self.children.items():
+            yield from child.items(f"{prefix}/{level}" if prefix else level)
+    
+    def match(self, topic_filter: str) -> Iterator[Tuple[str, Any]]:
+        """Yield (topic, value) for stored topics matching a filter such as home/+/kitchen/#."""
+        levels = topic_filter.split("/")
+        
+        def walk(node: "TopicTrie", i: int, path: List[str]):
+            if i == len(levels):
+                if node.has_value:
+                    yield "/".join(path), node.value
+                return
+            level = levels[i]
+            if level == "#":
+                # '#' also matches the parent level itself
+                if node.has_value and path:
+                    yield "/".join(path), node.value
+                for name, child in node.children.items():
+                    yield from child.items("/".join(path + [name]))
+            elif level == "+":
+                for name, child in node.children.items():
+                    yield from walk(child, i + 1, path + [name])
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    yield from walk(child, i + 1, path + [level])
+        
+        yield from walk(self, 0, [])
+    
+    def lookup(self, topic: str) -> List[Any]:
+        """Values of stored filters (which may contain + and #) that match a concrete topic."""
+        levels = topic.split("/")
+        found = []
+        
+        def walk(node: "TopicTrie", i: int):
+            wildcard = node.children.get("#")
+            if wildcard is not None and wildcard.has_value:
+                found.append(wildcard.value)
+            if i == len(levels):
+                if node.has_value:
+                    found.append(node.value)
+                return
+            for key in (levels[i], "+"):
+                child = node.children.get(key)
+                if child is not None:
+                    walk(child, i + 1)
+        
+        walk(self, 0)
+        return found
+
+class MessageLog:
+    """
+    Fixed-capacity columnar ring buffer. Topics are interned to integer ids and timestamps are
+    stored in a float array, so memory stays flat no matter how chatty the sensors are.
+    Interned topics are reference-counted by the entries using them and dropped (their id
+    reused) when the last one is overwritten, so a stream of unique topics stays bounded too.
+    """
+    
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._topic_ids = array("I", [0]) * capacity
+        self._timestamps = array("d", [0.0]) * capacity
+        self._payloads: List[Optional[str]] = [None] * capacity
+        self._topics: List[Optional[str]] = []
+        self._topic_refs: List[int] = []  # Ring entries per topic id
+        self._free_ids: List[int] = []
+        self._topic_index: Dict[str, int] = {}
+        self._topic_trie = TopicTrie()
+        self._next = 0
+        self.total = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+    
+    def append(self, topic: str, payload: str, timestamp: Optional[float] = None):
+        with self._lock:
+            topic_id = self._topic_index.get(topic)
+            if topic_id is None:
+                if self._free_ids:
+                    topic_id = self._free_ids.pop()
+                    self._topics[topic_id] = topic
+                else:
+                    topic_id = len(self._topics)
+                    self._topics.append(topic)
+                    self._topic_refs.append(0)
+                self._topic_index[topic] = topic_id
+                self._topic_trie.insert(topic, topic_id)
+            self._topic_refs[topic_id] += 1
+            slot = self._next
+            if self.total >= self.capacity:
+                self._release(self._topic_ids[slot])
+            self._topic_ids[slot] = topic_id
+            self._timestamps[slot] = time.time() if timestamp is None else timestamp
+            self._payloads[slot] = payload
+            self._next = (slot + 1) % self.capacity
+            self.total += 1
+    
+    def _release(self, topic_id: int):
+        """Drop one reference to an interned topic (the entry using it was overwritten)."""
+        self._topic_refs[topic_id] -= 1
+        if self._topic_refs[topic_id] == 0:
+            topic = self._topics[topic_id]
+            del self._topic_index[topic]
+            self._topic_trie.remove(topic)
+            self._topics[topic_id] = None
+            self._free_ids.append(topic_id)
+    
+    @property
+    def topic_count(self) -> int:
+        """Distinct topics currently held in the ring."""
+        return len(self._topic_index)
+    
+    def tail(self, max_count: int = 10, topic_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent messages, oldest first (optionally only topics matching a wildcard filter)."""
+        with self._lock:
+            results = []
+            topic_ids = None
+            if topic_filter:
+                topic_ids = {topic_id for _, topic_id in self._topic_trie.match(topic_filter)}
+                if not topic_ids:
+                    return []
+            for offset in range(1, len(self) + 1):
+                if len(results) >= max_count:
+                    break
+                slot = (self._next - offset) % self.capacity
+                if topic_ids is not None and self._topic_ids[slot] not in topic_ids:
+                    continue
+                results.append({
+                    'topic': self._topics[self._topic_ids[slot]],
+                    'payload': self._payloads[slot],
+                    'timestamp': datetime.fromtimestamp(self._timestamps[slot]).isoformat()
+                })
+            results.reverse()
+            return results
+
+class DeviceStateStore:
+    """Latest state per device; update() returns a diff only when something changed."""
+    
+    def __init__(self):
+        self.devices: Dict[str, Any] = {}
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self.stats = {"updates": 0, "changes": 0}
+    
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        """Call callback(diff) whenever a device's state changes."""
+        self._subscribers.append(callback)
+    
+    def update(self, device_id: str, state: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.stats["updates"] += 1
+            previous = self.devices.get(device_id)
+            if isinstance(state, dict) and isinstance(previous, dict):
+                changes = {k: v for k, v in state.items() if k not in previous or previous[k] != v}
+                if not changes:
+                    return None
+                # Partial reports merge into the known state
+                self.devices[device_id] = {**previous, **state}
+            else:
+                if device_id in self.devices and previous == state:
+                    return None
+                changes = dict(state) if isinstance(state, dict) else {"value": state}
+                self.devices[device_id] = state
+            self.stats["changes"] += 1
+        diff = {"device": device_id, "changes": changes, "timestamp": datetime.now().isoformat()}
+        for callback in list(self._subscribers):
+            callback(diff)
+        return diff
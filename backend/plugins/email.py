@@ -1,61 +1,62 @@
 """
 Kalpana AGI - Email Integration Module (Local Storage)
 Purpose: Email management with local storage (personal use - demo mode)
+         Messages live in an indexed SQLite store (emails.db); emails.json is migrated once.
 """
 
 import logging
 import os
-import json
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from backend.plugins.email_store import EmailStore
+from backend.plugins.mail_import import MailImporter
+from backend.plugins.outbox import Outbox
 
 logger = logging.getLogger("Kalpana.Email")
 
 class EmailManager:
-    def __init__(self):
-        self.emails_file = os.path.join(os.path.dirname(__file__), "../data/emails.json")
-        self.emails = []
+    def __init__(self, db_path: Optional[str] = None):
+        data_dir = os.path.join(os.path.dirname(__file__), "../data")
+        self.emails_file = os.path.join(data_dir, "emails.json")
+        self.db_path = db_path or os.path.join(data_dir, "emails.db")
+        self.store = None
+        self.importer = None
+        self.outbox = None
         self._load_emails()
     
     def _load_emails(self):
-        """Load emails from JSON file."""
+        """Open the email store, migrating the legacy JSON file on first run."""
         try:
-            os.makedirs(os.path.dirname(self.emails_file), exist_ok=True)
-            if os.path.exists(self.emails_file):
-                with open(self.emails_file, 'r') as f:
-                    self.emails = json.load(f)
-                logger.info(f"Loaded {len(self.emails)} emails")
+            self.store = EmailStore(self.db_path)
+            self.store.migrate_json(self.emails_file)
+            self.importer = MailImporter(self.store)
+            self.outbox = Outbox(self.db_path)
+            logger.info(f"Email store ready ({self.store.count()} emails)")
         except Exception as e:
             logger.error(f"Email load error: {e}")
-            self.emails = []
-    
-    def _save_emails(self):
-        """Save emails to JSON file."""
-        try:
-            with open(self.emails_file, 'w') as f:
-                json.dump(self.emails, f, indent=2)
-            logger.info("Emails saved")
-        except Exception as e:
-            logger.error(f"Email save error: {e}")
     
     def send_email(self, to: str, subject: str, body: str) -> Dict[str, Any]:
-        """Send an email (saves to local storage for demo)."""
+        """Send an email: stored locally, and queued for SMTP delivery when SMTP_HOST is configured."""
         try:
+            Outbox.check_headers(to, subject)
             email = {
-                'id': f"email_{len(self.emails) + 1}",
                 'to': to,
-                'from': 'kalpana@local',
+                'from': self.outbox.sender,
                 'subject': subject,
                 'body': body,
                 'date': datetime.now().isoformat(),
                 'type': 'sent'
             }
             
-            self.emails.append(email)
-            self._save_emails()
+            email_id = self.store.add(email)
+            
+            if self.outbox.enabled:
+                outbox_id = self.outbox.enqueue(to, subject, body, email_id=email_id)
+                logger.info(f"Queued email to {to}")
+                return {"status": "success", "message": "Email queued for delivery", "email_id": email_id, "outbox_id": outbox_id}
             
             logger.info(f"Sent email to {to}")
-            return {"status": "success", "message": "Email sent (local storage)"}
+            return {"status": "success", "message": "Email sent (local storage)", "email_id": email_id}
             
         except Exception as e:
             logger.error(f"Send email error: {e}")
@@ -64,14 +65,48 @@ class EmailManager:
     def read_emails(self, max_count: int = 10) -> List[Dict[str, Any]]:
         """Read recent emails."""
         try:
-            # Return most recent emails
-            recent = sorted(self.emails, key=lambda x: x['date'], reverse=True)
-            logger.info(f"Read {len(recent[:max_count])} emails")
-            return recent[:max_count]
+            # Served newest-first straight from the date index
+            recent = self.store.latest(limit=max_count)['emails']
+            logger.info(f"Read {len(recent)} emails")
+            return recent
             
         except Exception as e:
             logger.error(f"Read emails error: {e}")
             return []
+    
+    def list_emails(self, limit: int = 20, folder: Optional[str] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Page through emails newest-first; pass back next_cursor to continue."""
+        try:
+            page = self.store.latest(limit=limit, folder=folder, cursor=cursor)
+            return {"status": "success", **page}
+            
+        except Exception as e:
+            logger.error(f"List emails error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def search_emails(self, query: str, limit: int = 20, folder: Optional[str] = None,
+                      cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Full-text search over subject and body."""
+        try:
+            page = self.store.search(query, limit=limit, folder=folder, cursor=cursor)
+            logger.info(f"Search '{query}' matched {len(page['emails'])} emails")
+            return {"status": "success", **page}
+            
+        except Exception as e:
+            logger.error(f"Search emails error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def import_mailbox(self, path: str, folder: str = "inbox", progress=None) -> Dict[str, Any]:
+        """Import new messages from a local mbox file or Maildir directory."""
+        return self.importer.import_path(os.path.expanduser(path), folder=folder, progress=progress)
+    
+    def get_email(self, email_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch one email by id."""
+        try:
+            return self.store.get(email_id)
+        except Exception as e:
+            logger.error(f"Get email error: {e}")
+            return None
 
 email_manager = EmailManager()
 
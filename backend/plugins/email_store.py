@@ -0,0 +1,225 @@
+"""
+Kalpana AGI - Email Store
+Purpose: SQLite-backed mailbox with folder/date indexes, keyset (cursor) pagination
+         and FTS5 full-text search over subject and body.
+Dependencies: sqlite3
+"""
+
+import logging
+import os
+import json
+import base64
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger("Kalpana.EmailStore")
+
+_COLUMNS = ("seq", "folder", "sender", "recipient", "subject", "body", "date", "message_id")
+_SELECT = ", ".join(f"emails.{column}" for column in _COLUMNS)
+_INSERT = 'INSERT INTO emails (folder, sender, recipient, subject, body, date, message_id) VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+def encode_cursor(date: str, seq: int) -> str:
+    """Opaque pagination cursor pointing just after (date, seq)."""
+    return base64.urlsafe_b64encode(f"{date}|{seq}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        date, seq = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return date, int(seq)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _seq_from_id(email_id: str) -> Optional[int]:
+    try:
+        return int(email_id.rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+class EmailStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.fts_enabled = False
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._initialize()
+    
+    def _initialize(self):
+        """Create tables, indexes and the full-text index."""
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS emails (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL,
+                sender TEXT,
+                recipient TEXT,
+                subject TEXT,
+                body TEXT,
+                date TEXT NOT NULL,
+                message_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_emails_date ON emails (date, seq);
+            CREATE INDEX IF NOT EXISTS idx_emails_folder_date ON emails (folder, date, seq);
+            CREATE INDEX IF NOT EXISTS idx_emails_message_id ON emails (message_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS imported (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (source, key)
+            ) WITHOUT ROWID;
+        ''')
+        
+        try:
+            self.conn.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                    subject, body, content='emails', content_rowid='seq'
+                );
+                CREATE TRIGGER IF NOT EXISTS emails_ai AFTER INSERT ON emails BEGIN
+                    INSERT INTO emails_fts (rowid, subject, body) VALUES (new.seq, new.subject, new.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS emails_ad AFTER DELETE ON emails BEGIN
+                    INSERT INTO emails_fts (emails_fts, rowid, subject, body)
+                    VALUES ('delete', old.seq, old.subject, old.body);
+                END;
+            ''')
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, search falls back to LIKE: {e}")
+        self.conn.commit()
+    
+    def _row_to_email(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'id': f"email_{row['seq']}",
+            'to': row['recipient'],
+            'from': row['sender'],
+            'subject': row['subject'],
+            'body': row['body'],
+            'date': row['date'],
+            'type': row['folder'],
+            'message_id': row['message_id']
+        }
+    
+    @staticmethod
+    def _values(email: Dict[str, Any]) -> Tuple:
+        return (email.get('type', 'inbox'), email.get('from', ''), email.get('to', ''), email.get('subject', ''),
+                email.get('body', ''), email['date'], email.get('message_id'))
+    
+    def add(self, email: Dict[str, Any]) -> str:
+        """Insert one email and return its id."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(_INSERT, self._values(email))
+        # Ids are derived from the primary key, so they stay unique without a counter
+        return f"email_{cursor.lastrowid}"
+    
+    def add_many(self, emails: Iterable[Dict[str, Any]], meta: Optional[Dict[str, str]] = None,
+                 imported: Optional[Tuple[str, Iterable[str]]] = None) -> int:
+        """
+        Insert emails in a single transaction. Import checkpoints (meta values and
+        (source, keys) of processed messages) are committed atomically with them.
+        """
+        with self._lock, self.conn:
+            count = self.conn.executemany(_INSERT, (self._values(email) for email in emails)).rowcount
+            if meta:
+                self.conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta.items())
+            if imported:
+                source, keys = imported
+                self.conn.executemany('INSERT OR IGNORE INTO imported (source, key) VALUES (?, ?)',
+                                      ((source, key) for key in keys))
+            return count
+    
+    def imported_keys(self, source: str) -> set:
+        """Keys of messages already imported from a source (e.g. Maildir file names)."""
+        with self._lock:
+            return {row[0] for row in self.conn.execute('SELECT key FROM imported WHERE source = ?', (source,))}
+    
+    def get(self, email_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(f'SELECT {_SELECT} FROM emails WHERE seq = ?', (_seq_from_id(email_id),)).fetchone()
+        return self._row_to_email(row) if row else None
+    
+    def delete(self, email_id: str) -> bool:
+        with self._lock, self.conn:
+            return self.conn.execute('DELETE FROM emails WHERE seq = ?', (_seq_from_id(email_id),)).rowcount > 0
+    
+    def count(self, folder: Optional[str] = None) -> int:
+        with self._lock:
+            if folder:
+                row = self.conn.execute('SELECT COUNT(*) FROM emails WHERE folder = ?', (folder,)).fetchone()
+            else:
+                row = self.conn.execute('SELECT COUNT(*) FROM emails').fetchone()
+        return row[0]
+    
+    def _page(self, where: List[str], params: List[Any], limit: int, cursor: Optional[str],
+              source: str = "emails") -> Dict[str, Any]:
+        """Newest-first page using keyset pagination on (date, seq)."""
+        if cursor:
+            date, seq = decode_cursor(cursor)
+            where.append("(emails.date, emails.seq) < (?, ?)")
+            params += [date, seq]
+        sql = f"SELECT {_SELECT} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY emails.date DESC, emails.seq DESC LIMIT ?"
+        params.append(limit + 1)
+        
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "emails": [self._row_to_email(row) for row in rows],
+            "next_cursor": encode_cursor(rows[-1]['date'], rows[-1]['seq']) if more else None
+        }
+    
+    def latest(self, limit: int = 10, folder: Optional[str] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Most recent emails, optionally in one folder, continuing after cursor."""
+        where, params = [], []
+        if folder:
+            where.append("emails.folder = ?")
+            params.append(folder)
+        return self._page(where, params, limit, cursor)
+    
+    def search(self, query: str, limit: int = 10, folder: Optional[str] = None,
+               cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Full-text search over subject and body, newest first."""
+        where, params = [], []
+        if self.fts_enabled:
+            source = "emails_fts JOIN emails ON emails.seq = emails_fts.rowid"
+            where.append("emails_fts MATCH ?")
+            # Quote each term so user input cannot be parsed as FTS query syntax
+            params.append(" ".join('"' + term.replace('"', '""') + '"' for term in query.split()))
+        else:
+            source = "emails"
+            for term in query.split():
+                where.append("(emails.subject LIKE ? OR emails.body LIKE ?)")
+                params += [f"%{term}%", f"%{term}%"]
+        if folder:
+            where.append("emails.folder = ?")
+            params.append(folder)
+        return self._page(where, params, limit, cursor, source=source)
+    
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set_meta(self, key: str, value: str):
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+    
+    def migrate_json(self, json_path: str) -> int:
+        """One-time import of the legacy emails.json in file order, so ids stay the same (the file is left untouched)."""
+        if self.get_meta("json_migrated") or not os.path.exists(json_path):
+            return 0
+        with open(json_path, 'r') as f:
+            emails = json.load(f)
+        count = self.add_many(emails)
+        self.set_meta("json_migrated", "1")
+        logger.info(f"Migrated {count} emails from {json_path}")
+        return count
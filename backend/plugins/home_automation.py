@@ -1,48 +1,149 @@
 """
-Kalpana AGI - Smart Home Control (In-Memory Simulation)  
+Kalpana AGI - Smart Home Control (In-Memory Simulation)
 Purpose: Control IoT devices with simulated MQTT (personal use - no broker needed)
+         Set MQTT_HOST to talk to a real broker over an async MQTT 3.1.1 client instead.
 """
 
 import logging
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
 import json
-from datetime import datetime
+from backend.config.settings import settings
+from backend.plugins.mqtt_client import MQTTClient
+from backend.plugins.device_state import DeviceStateStore, MessageLog, TopicTrie
+from backend.plugins.timeseries import TimeSeriesStore
 
 logger = logging.getLogger("Kalpana.SmartHome")
 
+# Devices report their state here; commands go to .../command
+STATE_TOPICS = ["home/+/+/state", "home/+/state"]
+
+# Which topic level names the device (or a fixed device name), most specific first
+DEVICE_ROUTES = [
+    ("home/lights/+/#", 2),
+    ("home/thermostat/#", "thermostat"),
+    ("home/+/+/state", 2),
+    ("home/+/state", 1),
+]
+
 class SmartHomeBridge:
-    def __init__(self):
-        self.connected = True  # Always connected (simulation)
-        self.devices = {}
-        self.message_log = []
-        logger.info("Smart Home Bridge initialized (simulation mode)")
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
+        self.host = settings.MQTT_HOST if host is None else host
+        self.qos = settings.MQTT_QOS
+        self.client = None
+        if self.host:
+            self.client = MQTTClient(
+                self.host, port or settings.MQTT_PORT, client_id=settings.MQTT_CLIENT_ID,
+                username=settings.MQTT_USER, password=settings.MQTT_PASSWORD
+            )
+        self.connected = self.client is None  # Always connected (simulation)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.state = DeviceStateStore()
+        self.devices = self.state.devices
+        self.message_log = MessageLog(capacity=1000)
+        self.device_topics = TopicTrie()  # topic -> device id, for wildcard device queries
+        self.telemetry = TimeSeriesStore()  # History of numeric readings (<device>.<field>)
+        self.routes = TopicTrie()
+        for priority, (topic_filter, device) in enumerate(DEVICE_ROUTES):
+            self.routes.insert(topic_filter, (priority, device))
+        if self.client is None:
+            logger.info("Smart Home Bridge initialized (simulation mode)")
+        else:
+            logger.info(f"Smart Home Bridge initialized (MQTT broker {self.host})")
+    
+    async def start(self):
+        """Connect to the broker and follow device state topics (no-op in simulation mode)."""
+        if self.client is None:
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+            await self.client.connect()
+            for topic_filter in STATE_TOPICS:
+                await self.client.subscribe(topic_filter, self._on_state, qos=self.qos)
+            self.connected = True
+        except Exception as e:
+            logger.error(f"MQTT start error: {e}")
+    
+    async def stop(self):
+        if self.client is not None:
+            await self.client.disconnect()
+            self.connected = False
+    
+    def device_for_topic(self, topic: str) -> Optional[str]:
+        """Resolve the device a topic belongs to via the route trie."""
+        routes = self.routes.lookup(topic)
+        if not routes:
+            return None
+        _, device = min(routes, key=lambda route: route[0])
+        if isinstance(device, int):
+            levels = topic.split('/')
+            return levels[device] if device < len(levels) else None
+        return device
+    
+    def _on_state(self, topic: str, payload: bytes):
+        """Update device state from a state report (home/lights/<id>/state or home/<device>/state)."""
+        text = payload.decode("utf-8", errors="replace")
+        try:
+            state = json.loads(text)
+        except ValueError:
+            state = text
+        self.message_log.append(topic, text)
+        device_id = self.device_for_topic(topic)
+        if device_id is not None:
+            self.device_topics.insert(topic, device_id)
+            self.telemetry.record(device_id, state)
+            self.state.update(device_id, state)
+    
+    def _send(self, messages: List[Tuple[str, str]]):
+        """Hand messages to the MQTT client from sync code (HUD handlers, plugins, worker threads)."""
+        coroutine = self.client.publish_many(messages, qos=self.qos)
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            future = self._loop.create_task(coroutine)
+        else:
+            future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        future.add_done_callback(
+            lambda f: f.cancelled() or f.exception() is None or logger.error(f"MQTT publish error: {f.exception()}")
+        )
     
     def publish(self, topic: str, payload: Any) -> Dict[str, Any]:
-        """Publish message to topic (simulated)."""
+        """Publish message to topic (simulated unless a broker is configured)."""
+        return self.publish_batch([(topic, payload)])
+    
+    def publish_batch(self, messages: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        """Publish several messages at once; with a broker they go out in a single write."""
         try:
-            if isinstance(payload, dict):
-                payload_str = json.dumps(payload)
-            else:
-                payload_str = str(payload)
+            if self.client is not None and not self.connected:
+                return {"status": "error", "message": "MQTT broker not connected"}
             
-            # Log the message
-            message = {
-                'topic': topic,
-                'payload': payload_str,
-                'timestamp': datetime.now().isoformat()
-            }
-            self.message_log.append(message)
+            encoded = []
+            for topic, payload in messages:
+                if isinstance(payload, dict):
+                    payload_str = json.dumps(payload)
+                else:
+                    payload_str = str(payload)
+                encoded.append((topic, payload_str))
+                
+                # Log the message
+                self.message_log.append(topic, payload_str)
+                
+                # Simulated devices follow commands directly; real ones report back on state topics
+                if self.client is None:
+                    device_id = self.device_for_topic(topic)
+                    if device_id is not None:
+                        self.device_topics.insert(topic, device_id)
+                        self.telemetry.record(device_id, payload)
+                        self.state.update(device_id, payload)
             
-            # Update device state
-            if 'lights' in topic:
-                device_id = topic.split('/')[-2] if '/' in topic else 'unknown'
-                self.devices[device_id] = payload
-            elif 'thermostat' in topic:
-                self.devices['thermostat'] = payload
+            if self.client is not None:
+                self._send(encoded)
+            
+            logger.info(f"Published {len(encoded)} message(s): {', '.join(t for t, _ in encoded[:5])}")
+            return {"status": "success", "published": len(encoded)}
             
-            logger.info(f"Published to {topic}: {payload_str}")
-            return {"status": "success"}
-                
         except Exception as e:
             logger.error(f"Publish error: {e}")
             return {"status": "error", "message": str(e)}
@@ -52,6 +153,10 @@ class SmartHomeBridge:
         topic = f"home/lights/{device_id}/command"
         return self.publish(topic, {"state": state})
     
+    def set_scene(self, lights: Dict[str, str]) -> Dict[str, Any]:
+        """Switch many lights at once (e.g. {"kitchen": "off", "hall": "on"}) as one batch."""
+        return self.publish_batch([(f"home/lights/{device_id}/command", {"state": state}) for device_id, state in lights.items()])
+    
     def control_thermostat(self, temperature: float) -> Dict[str, Any]:
         """Set thermostat temperature."""
         topic = "home/thermostat/set_temperature"
@@ -67,9 +172,21 @@ class SmartHomeBridge:
         """Get all device states."""
         return self.devices
     
-    def get_message_log(self, max_count: int = 10) -> list:
-        """Get recent message log."""
-        return self.message_log[-max_count:]
+    def get_message_log(self, max_count: int = 10, topic_filter: Optional[str] = None) -> list:
+        """Get recent message log, optionally only topics matching a filter (e.g. home/+/kitchen/#)."""
+        return self.message_log.tail(max_count, topic_filter)
+    
+    def get_telemetry(self, series: str, start: Optional[float] = None, end: Optional[float] = None,
+                      max_points: int = 500, resolution: Optional[str] = None) -> Dict[str, Any]:
+        """History of one reading (e.g. thermostat.temperature) between epoch timestamps."""
+        return self.telemetry.query(series, start, end, max_points, resolution)
+    
+    def find_devices(self, topic_filter: str) -> Dict[str, Any]:
+        """States of devices whose topics match a wildcard filter."""
+        return {
+            device_id: self.devices[device_id]
+            for _, device_id in self.device_topics.match(topic_filter)
+            if device_id in self.devices
+        }
 
 mqtt_bridge = SmartHomeBridge()
-
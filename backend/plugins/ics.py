@@ -0,0 +1,188 @@
+"""
+Kalpana AGI - iCalendar (ICS) Streaming Reader/Writer
+Purpose: Import and export VEVENTs line by line without loading whole calendars into memory.
+Dependencies: datetime, recurrence
+Notes: Times with a TZID are treated as local ("floating") time; UTC times (suffix Z) are
+       converted to local time, matching how the rest of Kalpana stores naive datetimes.
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, IO, Iterable, Iterator, Optional, Tuple
+from backend.plugins.recurrence import parse_ical_datetime, format_ical_datetime
+
+_DURATION_PATTERN = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+def parse_duration(value: str) -> timedelta:
+    """Parse an iCalendar DURATION such as PT1H30M or P1D."""
+    match = _DURATION_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    parts = {k: int(v) for k, v in match.groupdict().items() if v and k != "sign"}
+    duration = timedelta(**parts)
+    return -duration if match.group("sign") == "-" else duration
+
+_ESCAPED = re.compile(r"\\([\\;,nN])")
+
+def _unescape(value: str) -> str:
+    # One left-to-right pass, so an escaped backslash before "n" stays a backslash
+    return _ESCAPED.sub(lambda match: "\n" if match.group(1) in "nN" else match.group(1), value)
+
+def _escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;")
+                 .replace(",", "\\,").replace("\n", "\\n"))
+
+def _unfolded_lines(stream: IO[str]) -> Iterator[str]:
+    """Yield logical content lines, joining RFC 5545 folded continuation lines."""
+    pending = None
+    for raw in stream:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+            continue
+        if pending:
+            yield pending
+        pending = line
+    if pending:
+        yield pending
+
+def _split_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    """Split "NAME;PARAM=X:VALUE" into its parts (colons inside quoted params are respected)."""
+    if '"' not in line:
+        head, sep, value = line.partition(":")
+        if not sep:
+            return line.upper(), {}, ""
+        if ";" not in head:
+            return head.upper(), {}, value
+        return _parse_params(head, value)
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return line.upper(), {}, ""
+    return _parse_params(head, value)
+
+def _parse_params(head: str, value: str) -> Tuple[str, Dict[str, str], str]:
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        if "=" in param:
+            key, val = param.split("=", 1)
+            params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+def _parse_time(value: str, params: Dict[str, str]) -> Tuple[datetime, bool]:
+    """Return (datetime, is_all_day)."""
+    all_day = params.get("VALUE") == "DATE" or (len(value) == 8 and value.isdigit())
+    return parse_ical_datetime(value), all_day
+
+def iter_ics_events(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream VEVENTs from an iCalendar file object, one dict at a time.
+    Each dict has uid, summary, description, start, end (datetimes) and optional rrule/exdates.
+    """
+    current: Optional[Dict[str, Any]] = None
+    depth = 0  # Nesting inside the VEVENT (e.g. VALARM), whose properties are ignored
+    for line in _unfolded_lines(stream):
+        name, params, value = _split_property(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and current is None:
+                current = {"exdates": []}
+                depth = 0
+            elif current is not None:
+                depth += 1
+            continue
+        if name == "END":
+            if current is not None and depth > 0:
+                depth -= 1
+            elif current is not None and value.upper() == "VEVENT":
+                event = _finish_event(current)
+                current = None
+                if event is not None:
+                    yield event
+            continue
+        if current is None or depth > 0:
+            continue
+        
+        if name == "UID":
+            current["uid"] = value
+        elif name == "SUMMARY":
+            current["summary"] = _unescape(value)
+        elif name == "DESCRIPTION":
+            current["description"] = _unescape(value)
+        elif name == "DTSTART":
+            current["start"], current["all_day"] = _parse_time(value, params)
+        elif name == "DTEND":
+            current["end"], _ = _parse_time(value, params)
+        elif name == "DURATION":
+            current["duration"] = parse_duration(value)
+        elif name == "RRULE":
+            current["rrule"] = value
+        elif name == "EXDATE":
+            current["exdates"].extend(parse_ical_datetime(v) for v in value.split(",") if v)
+
+def _finish_event(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if "start" not in raw:
+        return None
+    start = raw["start"]
+    end = raw.get("end")
+    if end is None:
+        end = start + raw.get("duration", timedelta(days=1) if raw.get("all_day") else timedelta(0))
+    return {
+        "uid": raw.get("uid"),
+        "summary": raw.get("summary", ""),
+        "description": raw.get("description", ""),
+        "start": start,
+        "end": max(start, end),
+        "rrule": raw.get("rrule"),
+        "exdates": raw["exdates"],
+    }
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets as RFC 5545 requires."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    chunks, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > (75 if not chunks else 74):
+            chunks.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    chunks.append(current)
+    return "\r\n ".join(chunks) + "\r\n"
+
+def write_ics(events: Iterable[Dict[str, Any]], stream: IO[str], prodid: str = "-//Kalpana AGI//Calendar//EN") -> int:
+    """Write calendar events (Kalpana's stored format) to a file object, one at a time."""
+    stream.write(_fold("BEGIN:VCALENDAR"))
+    stream.write(_fold("VERSION:2.0"))
+    stream.write(_fold(f"PRODID:{prodid}"))
+    count = 0
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    for event in events:
+        stream.write(_fold("BEGIN:VEVENT"))
+        stream.write(_fold(f"UID:{event.get('uid') or event['id'] + '@kalpana'}"))
+        stream.write(_fold(f"DTSTAMP:{stamp}"))
+        stream.write(_fold(f"DTSTART:{format_ical_datetime(datetime.fromisoformat(event['start_time']))}"))
+        stream.write(_fold(f"DTEND:{format_ical_datetime(datetime.fromisoformat(event['end_time']))}"))
+        stream.write(_fold(f"SUMMARY:{_escape(event.get('summary', ''))}"))
+        if event.get("description"):
+            stream.write(_fold(f"DESCRIPTION:{_escape(event['description'])}"))
+        if event.get("rrule"):
+            stream.write(_fold(f"RRULE:{event['rrule']}"))
+        if event.get("exdates"):
+            values = ",".join(format_ical_datetime(datetime.fromisoformat(d)) for d in event["exdates"])
+            stream.write(_fold(f"EXDATE:{values}"))
+        stream.write(_fold("END:VEVENT"))
+        count += 1
+    stream.write(_fold("END:VCALENDAR"))
+    return count
@@ -0,0 +1,167 @@
+"""
+Kalpana AGI - Interval Tree
+Purpose: In-memory interval index (randomized treap ordered by start, augmented with max end)
+         for overlap, upcoming and free/busy queries in O(log n + k).
+Dependencies: random
+"""
+
+import random
+from typing import Any, Iterator, List, Optional, Tuple
+
+class _Node:
+    __slots__ = ("start", "end", "key", "value", "priority", "left", "right", "max_end")
+    
+    def __init__(self, start: float, end: float, key: Any, value: Any):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.max_end = end
+    
+    def update(self):
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+def _split(node: Optional[_Node], start: float, key: Any) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Split into nodes ordered before (start, key) and the rest."""
+    if node is None:
+        return None, None
+    if (node.start, node.key) < (start, key):
+        node.right, right = _split(node.right, start, key)
+        node.update()
+        return node, right
+    left, node.left = _split(node.left, start, key)
+    node.update()
+    return left, node
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+class IntervalTree:
+    """Half-open intervals [start, end) keyed by (start, key); values are arbitrary payloads."""
+    
+    def __init__(self):
+        self.root: Optional[_Node] = None
+        self.size = 0
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    @classmethod
+    def build(cls, items: List[Tuple[float, float, Any, Any]]) -> "IntervalTree":
+        """Build a tree from (start, end, key, value) tuples in O(n log n) without rebalancing."""
+        tree = cls()
+        items = sorted(items, key=lambda item: (item[0], item[2]))
+        # Cartesian tree construction: keys in order, heap-ordered by random priority
+        spine: List[_Node] = []
+        for start, end, key, value in items:
+            node = _Node(start, end, key, value)
+            last = None
+            while spine and spine[-1].priority < node.priority:
+                last = spine.pop()
+            node.left = last
+            if spine:
+                spine[-1].right = node
+            spine.append(node)
+        tree.root = spine[0] if spine else None
+        tree.size = len(items)
+        
+        # Post-order pass to fill in max_end
+        stack, order = [tree.root] if tree.root else [], []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        for node in reversed(order):
+            node.update()
+        return tree
+    
+    def insert(self, start: float, end: float, key: Any, value: Any = None):
+        """Insert an interval. (start, key) must be unique."""
+        node = _Node(start, end, key, value)
+        left, right = _split(self.root, start, key)
+        self.root = _merge(_merge(left, node), right)
+        self.size += 1
+    
+    def remove(self, start: float, key: Any) -> bool:
+        """Remove the interval identified by (start, key)."""
+        parent, node = None, self.root
+        while node is not None and (node.start, node.key) != (start, key):
+            parent = node
+            node = node.left if (start, key) < (node.start, node.key) else node.right
+        if node is None:
+            return False
+        
+        replacement = _merge(node.left, node.right)
+        if parent is None:
+            self.root = replacement
+        elif parent.left is node:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        self.size -= 1
+        
+        # Refresh max_end along the path from the root to the removed node
+        path, cursor = [], self.root
+        while cursor is not None and cursor is not replacement:
+            path.append(cursor)
+            cursor = cursor.left if (start, key) < (cursor.start, cursor.key) else cursor.right
+        for ancestor in reversed(path):
+            ancestor.update()
+        return True
+    
+    def overlapping(self, start: float, end: float) -> Iterator[Tuple[float, float, Any]]:
+        """Yield (start, end, value) for intervals overlapping [start, end), ordered by start."""
+        stack: List[_Node] = []
+        node = self.root
+        while stack or node is not None:
+            # Descend left while the subtree can still contain an overlap
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if node.start >= end:
+                return  # Everything after this starts too late
+            if node.end > start:
+                yield node.start, node.end, node.value
+            node = node.right
+    
+    def starting_from(self, start: float) -> Iterator[Tuple[float, float, Any]]:
+        """Yield (start, end, value) for intervals starting at or after start, ordered by start."""
+        stack: List[_Node] = []
+        node = self.root
+        while node is not None:
+            if node.start >= start:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.start, node.end, node.value
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
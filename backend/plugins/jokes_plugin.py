@@ -5,7 +5,7 @@ Purpose: Tell jokes.
 
 import logging
 import random
-from backend.plugins.loader import PluginInterface
+from backend.plugins.loader import PluginInterface, command
 from typing import Dict, Any
 
 logger = logging.getLogger("Kalpana.JokesPlugin")
@@ -25,13 +25,7 @@ class JokesPlugin(PluginInterface):
         self.version = "1.0.0"
         self.description = "Tell random jokes"
     
-    def execute(self, command: str, **kwargs) -> Dict[str, Any]:
-        """Execute jokes command."""
-        if command == "tell_joke":
-            return self.tell_joke()
-        else:
-            return {"status": "error", "message": f"Unknown command: {command}"}
-    
+    @command()
     def tell_joke(self) -> Dict[str, Any]:
         """Tell a random joke."""
         joke = random.choice(JOKES)
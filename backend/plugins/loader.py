@@ -1,20 +1,85 @@
 """
 Kalpana AGI - Plugin System
-Purpose: Dynamic plugin loading and management.
-Dependencies: importlib
+Purpose: Dynamic plugin loading, hot reloading and management.
+Dependencies: importlib, watchdog
 """
 
 import logging
 import os
+import sys
 import importlib
 import inspect
-from typing import Dict, Any, List, Callable
+import threading
+import time
+from typing import Dict, Any, List, Callable, Optional
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from backend.modules.openmetrics import metrics
 
 logger = logging.getLogger("Kalpana.Plugins")
 
+PLUGIN_LATENCY = metrics.histogram("kalpana_plugin_command_seconds", "Plugin command execution time", ["plugin", "command"])
+PLUGIN_ERRORS = metrics.counter("kalpana_plugin_command_errors", "Plugin commands that returned or raised an error", ["plugin", "command"])
+
+# Parameter types we check at dispatch time; anything else is passed through as-is.
+_CHECKED_TYPES = (str, int, float, bool, list, dict)
+
+def command(name: Optional[str] = None, description: str = ""):
+    """Mark a plugin method as a command exposed through the dispatch table."""
+    def decorator(func: Callable) -> Callable:
+        func._plugin_command = {
+            "name": name or func.__name__,
+            "description": description or (inspect.getdoc(func) or "").split("\n")[0]
+        }
+        return func
+    return decorator
+
+def _build_command_spec(func: Callable, name: str, description: str) -> Dict[str, Any]:
+    """Inspect a command's signature once and describe its arguments."""
+    params = {}
+    required = set()
+    for param in list(inspect.signature(func).parameters.values())[1:]:  # Skip self
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        annotation = param.annotation if param.annotation in _CHECKED_TYPES else None
+        params[param.name] = {
+            "type": annotation.__name__ if annotation else "any",
+            "required": param.default is param.empty,
+            "default": None if param.default is param.empty else param.default
+        }
+        if param.default is param.empty:
+            required.add(param.name)
+    
+    return {
+        "name": name,
+        "attr": func.__name__,
+        "description": description,
+        "params": params,
+        "required": frozenset(required),
+        "allowed": frozenset(params),
+        "types": {
+            p: param.annotation for p, param in inspect.signature(func).parameters.items()
+            if param.annotation in _CHECKED_TYPES
+        }
+    }
+
 class PluginInterface:
     """Base interface for plugins."""
     
+    # Dispatch table built once per class from @command-decorated methods
+    _commands: Dict[str, Dict[str, Any]] = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        commands = {}
+        for base in reversed(cls.__mro__[1:]):
+            commands.update(getattr(base, "_commands", {}))
+        for attr, func in vars(cls).items():
+            meta = getattr(func, "_plugin_command", None)
+            if meta:
+                commands[meta["name"]] = _build_command_spec(func, meta["name"], meta["description"])
+        cls._commands = commands
+    
     def __init__(self):
         self.name = "base_plugin"
         self.version = "1.0.0"
@@ -22,7 +87,47 @@ class PluginInterface:
     
     def execute(self, command: str, **kwargs) -> Dict[str, Any]:
         """Execute plugin command."""
-        raise NotImplementedError("Plugin must implement execute method")
+        if not self._commands:
+            raise NotImplementedError("Plugin must implement execute method or declare @command methods")
+        
+        spec = self._commands.get(command)
+        if spec is None:
+            return {"status": "error", "message": f"Unknown command: {command}"}
+        
+        error = self.validate_args(spec, kwargs)
+        if error:
+            return {"status": "error", "message": error}
+        
+        return getattr(self, spec["attr"])(**kwargs)
+    
+    @staticmethod
+    def validate_args(spec: Dict[str, Any], kwargs: Dict[str, Any]) -> Optional[str]:
+        """Check arguments against a command spec. Returns an error message or None."""
+        keys = kwargs.keys()
+        missing = spec["required"] - keys
+        if missing:
+            return f"Missing argument(s) for {spec['name']}: {', '.join(sorted(missing))}"
+        unknown = keys - spec["allowed"]
+        if unknown:
+            return f"Unknown argument(s) for {spec['name']}: {', '.join(sorted(unknown))}"
+        for arg, expected in spec["types"].items():
+            if arg in kwargs and not isinstance(kwargs[arg], expected):
+                # Allow ints where floats are expected (e.g. temperature=21)
+                if expected is float and isinstance(kwargs[arg], int):
+                    continue
+                return f"Argument '{arg}' for {spec['name']} must be {expected.__name__}"
+        return None
+    
+    def shutdown(self):
+        """Release resources before the plugin is unloaded or replaced."""
+        pass
+    
+    def get_commands(self) -> List[Dict[str, Any]]:
+        """Get schemas of all commands this plugin exposes."""
+        return [
+            {"name": spec["name"], "description": spec["description"], "params": spec["params"]}
+            for spec in self._commands.values()
+        ]
     
     def get_info(self) -> Dict[str, str]:
         """Get plugin information."""
@@ -32,12 +137,70 @@ class PluginInterface:
             "description": self.description
         }
 
+class PluginReloadHandler(FileSystemEventHandler):
+    """Watch the plugins directory and hot-reload changed plugin modules."""
+    
+    def __init__(self, loader: "PluginLoader", debounce: float = 0.5):
+        self.loader = loader
+        self.debounce = debounce
+        self._timers: Dict[str, threading.Timer] = {}
+        self._lock = threading.Lock()
+    
+    def _schedule(self, path: str, deleted: bool = False):
+        """Coalesce the burst of events editors emit for a single save."""
+        filename = os.path.basename(path)
+        if not filename.endswith('.py') or filename.startswith('__'):
+            return
+        module_name = filename[:-3]
+        action = self.loader.unload_plugin if deleted else self.loader.reload_plugin
+        
+        with self._lock:
+            timer = self._timers.pop(module_name, None)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, action, args=(module_name,))
+            timer.daemon = True
+            self._timers[module_name] = timer
+            timer.start()
+    
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
+    
+    def on_created(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
+    
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path, deleted=True)
+            self._schedule(event.dest_path)
+    
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path, deleted=True)
+
 class PluginLoader:
     """Dynamic plugin loader."""
     
     def __init__(self):
         self.plugins: Dict[str, PluginInterface] = {}
         self.plugins_dir = os.path.join(os.path.dirname(__file__), ".")
+        self.plugin_modules: Dict[str, str] = {}  # module name -> plugin name
+        self.drain_timeout = 30.0
+        self._cond = threading.Condition()
+        self._inflight: Dict[int, int] = {}  # id(plugin instance) -> running calls
+        self.observer = None
+    
+    def _find_plugin_class(self, module):
+        """
+        Find the plugin class defined in a module, ignoring imported ones. Modules without
+        one are support code for other plugins (caches, stores, protocol clients).
+        """
+        for name, obj in inspect.getmembers(module, inspect.isclass):
+            if issubclass(obj, PluginInterface) and obj is not PluginInterface and obj.__module__ == module.__name__:
+                return obj
+        return None
     
     def load_plugin(self, plugin_name: str) -> bool:
         """Load a plugin by name."""
@@ -46,12 +209,12 @@ class PluginLoader:
             module = importlib.import_module(f"backend.plugins.{plugin_name}")
             
             # Find plugin class (should inherit from PluginInterface)
-            for name, obj in inspect.getmembers(module):
-                if inspect.isclass(obj) and issubclass(obj, PluginInterface) and obj != PluginInterface:
-                    plugin_instance = obj()
-                    self.plugins[plugin_instance.name] = plugin_instance
-                    logger.info(f"Loaded plugin: {plugin_instance.name}")
-                    return True
+            plugin_class = self._find_plugin_class(module)
+            if plugin_class:
+                plugin_instance = plugin_class()
+                self._swap(plugin_name, plugin_instance)
+                logger.info(f"Loaded plugin: {plugin_instance.name}")
+                return True
             
             logger.warning(f"No valid plugin class found in {plugin_name}")
             return False
@@ -60,16 +223,116 @@ class PluginLoader:
             logger.error(f"Failed to load plugin {plugin_name}: {e}")
             return False
     
+    def reload_plugin(self, module_name: str) -> bool:
+        """
+        Re-import a single plugin module and swap the new instance in atomically.
+        Calls already running on the old instance finish before it is shut down.
+        """
+        full_name = f"backend.plugins.{module_name}"
+        if full_name not in sys.modules:
+            # New file dropped into the plugins directory
+            return self.load_plugin(module_name)
+        
+        if module_name not in self.plugin_modules:
+            # Helper modules hold singletons other code already references; reloading them would fork state
+            logger.info(f"Skipping reload of {module_name}: not a plugin module (restart to apply changes)")
+            return False
+        
+        try:
+            module = importlib.reload(sys.modules[full_name])
+            plugin_class = self._find_plugin_class(module)
+            if not plugin_class:
+                logger.warning(f"No valid plugin class found in {module_name} after reload")
+                return False
+            
+            self._swap(module_name, plugin_class())
+            logger.info(f"Hot-reloaded plugin module: {module_name}")
+            return True
+            
+        except Exception as e:
+            # Keep serving the old instance if the new code is broken
+            logger.error(f"Failed to reload plugin {module_name}: {e}")
+            return False
+    
+    def unload_plugin(self, module_name: str) -> bool:
+        """Remove a plugin whose module was deleted."""
+        with self._cond:
+            plugin_name = self.plugin_modules.pop(module_name, None)
+            old = self.plugins.pop(plugin_name, None) if plugin_name else None
+        if old is None:
+            return False
+        
+        sys.modules.pop(f"backend.plugins.{module_name}", None)
+        self._retire(old)
+        logger.info(f"Unloaded plugin: {plugin_name}")
+        return True
+    
+    def _swap(self, module_name: str, plugin_instance: PluginInterface):
+        """Publish a new plugin instance and retire the one it replaces."""
+        with self._cond:
+            previous_name = self.plugin_modules.get(module_name)
+            old = self.plugins.get(plugin_instance.name)
+            if previous_name and previous_name != plugin_instance.name:
+                # Plugin was renamed in the new code
+                old = self.plugins.pop(previous_name, None)
+            self.plugins[plugin_instance.name] = plugin_instance
+            self.plugin_modules[module_name] = plugin_instance.name
+        
+        if old is not None and old is not plugin_instance:
+            self._retire(old)
+    
+    def _retire(self, plugin: PluginInterface):
+        """Shut down an old instance once its in-flight calls have drained."""
+        def drain():
+            with self._cond:
+                drained = self._cond.wait_for(lambda: self._inflight.get(id(plugin), 0) == 0, timeout=self.drain_timeout)
+            if not drained:
+                logger.warning(f"Plugin {plugin.name} still busy after {self.drain_timeout}s, shutting down anyway")
+            try:
+                plugin.shutdown()
+            except Exception as e:
+                logger.error(f"Plugin shutdown error ({plugin.name}): {e}")
+        
+        threading.Thread(target=drain, name=f"plugin-drain-{plugin.name}", daemon=True).start()
+    
+    def start_hot_reload(self):
+        """Watch the plugins directory and reload plugins when their files change."""
+        if self.observer is not None:
+            return
+        try:
+            self.observer = Observer()
+            self.observer.schedule(PluginReloadHandler(self), self.plugins_dir, recursive=False)
+            self.observer.start()
+            logger.info("Plugin hot reload ACTIVE")
+        except Exception as e:
+            logger.error(f"Failed to start plugin hot reload: {e}")
+            self.observer = None
+    
+    def stop_hot_reload(self):
+        """Stop watching the plugins directory."""
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+    
     def load_all_plugins(self):
         """Load all available plugins."""
         try:
-            plugin_files = [
+            module_names = [
                 f[:-3] for f in os.listdir(self.plugins_dir)
-                if f.endswith('.py') and f not in ['__init__.py', '__pycache__', 'loader.py']
+                if f.endswith('.py') and not f.startswith('__')
             ]
             
-            for plugin_file in plugin_files:
-                self.load_plugin(plugin_file)
+            for module_name in module_names:
+                try:
+                    module = importlib.import_module(f"backend.plugins.{module_name}")
+                except Exception as e:
+                    logger.error(f"Failed to load plugin {module_name}: {e}")
+                    continue
+                if self._find_plugin_class(module) is None:
+                    logger.debug(f"{module_name} defines no plugin class, treating it as a support module")
+                    continue
+                self.load_plugin(module_name)
             
             logger.info(f"Loaded {len(self.plugins)} plugins")
             
@@ -84,17 +347,60 @@ class PluginLoader:
         """List all loaded plugins."""
         return [plugin.get_info() for plugin in self.plugins.values()]
     
+    def list_commands(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get command schemas for every loaded plugin."""
+        return {name: plugin.get_commands() for name, plugin in self.plugins.items()}
+    
     def execute_plugin(self, plugin_name: str, command: str, **kwargs) -> Dict[str, Any]:
         """Execute a command on a plugin."""
-        plugin = self.get_plugin(plugin_name)
+        return self._execute(plugin_name, command, kwargs)
+    
+    def _execute(self, plugin_name: str, command: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a command with its arguments as a dict, so any argument name is safe to pass."""
+        with self._cond:
+            plugin = self.plugins.get(plugin_name)
+            if plugin:
+                self._inflight[id(plugin)] = self._inflight.get(id(plugin), 0) + 1
         if not plugin:
             return {"status": "error", "message": f"Plugin '{plugin_name}' not found"}
         
+        started = time.perf_counter()
         try:
             result = plugin.execute(command, **kwargs)
+            if isinstance(result, dict) and result.get("status") == "error":
+                PLUGIN_ERRORS.inc(plugin_name, command)
             return result
         except Exception as e:
             logger.error(f"Plugin execution error: {e}")
+            PLUGIN_ERRORS.inc(plugin_name, command)
             return {"status": "error", "message": str(e)}
+        finally:
+            PLUGIN_LATENCY.observe(time.perf_counter() - started, plugin_name, command)
+            with self._cond:
+                remaining = self._inflight[id(plugin)] - 1
+                if remaining:
+                    self._inflight[id(plugin)] = remaining
+                else:
+                    del self._inflight[id(plugin)]
+                    self._cond.notify_all()
+    
+    def execute_batch(self, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Execute several plugin commands in one round-trip.
+        Each call is {"plugin": ..., "command": ..., "args": {...}}; results keep the same order.
+        """
+        if not isinstance(calls, list):
+            return [{"status": "error", "message": "'calls' must be a list"}]
+        results = []
+        for call in calls:
+            if not isinstance(call, dict) or not isinstance(call.get("plugin"), str) or not isinstance(call.get("command"), str):
+                results.append({"status": "error", "message": "Each call needs 'plugin' and 'command' names"})
+                continue
+            args = call.get("args") or {}
+            if not isinstance(args, dict):
+                results.append({"status": "error", "message": "'args' must be an object"})
+                continue
+            results.append(self._execute(call["plugin"], call["command"], args))
+        return results
 
 plugin_loader = PluginLoader()
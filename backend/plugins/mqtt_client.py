@@ -0,0 +1,340 @@
+"""
+Kalpana AGI - Async MQTT Client
+Purpose: Minimal asyncio MQTT 3.1.1 client (QoS 0/1, batched publishes, wildcard subscriptions,
+         keepalive and automatic reconnect).
+Dependencies: asyncio
+Notes: Only the MQTT 3.1.1 wire protocol is implemented; MQTT 5 properties are not.
+"""
+
+import logging
+import asyncio
+import struct
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger("Kalpana.MQTT")
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 12, 13, 14
+
+Payload = Union[bytes, str]
+MessageCallback = Callable[[str, bytes], Optional[Awaitable[None]]]
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+def encode_publish(topic: str, payload: Payload, qos: int = 0, retain: bool = False,
+                   packet_id: Optional[int] = None, dup: bool = False) -> bytes:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    body = _encode_string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    return _packet(PUBLISH, (dup << 3) | (qos << 1) | int(retain), body + payload)
+
+def decode_publish(flags: int, body: bytes) -> Tuple[str, bytes, int, Optional[int], bool]:
+    """Return (topic, payload, qos, packet_id, retain)."""
+    qos = (flags >> 1) & 0x03
+    (topic_length,) = struct.unpack_from("!H", body)
+    topic = body[2:2 + topic_length].decode("utf-8")
+    offset = 2 + topic_length
+    packet_id = None
+    if qos:
+        (packet_id,) = struct.unpack_from("!H", body, offset)
+        offset += 2
+    return topic, body[offset:], qos, packet_id, bool(flags & 0x01)
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Read one control packet and return (type, flags, body)."""
+    header = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+        if multiplier > 128 ** 3:
+            raise ValueError("Malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return header >> 4, header & 0x0F, body
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT wildcard match: + is one level, # is the remainder (including the parent level)."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+class MQTTClient:
+    def __init__(self, host: str, port: int = 1883, client_id: str = "kalpana", username: str = "",
+                 password: str = "", keepalive: int = 60, ack_timeout: float = 10.0,
+                 max_inflight: int = 1000, reconnect_delay: float = 1.0, max_reconnect_delay: float = 60.0):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.ack_timeout = ack_timeout
+        self.max_inflight = max_inflight
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._next_id = 0
+        # packet id -> (future, encoded packet) for QoS 1 publishes awaiting PUBACK
+        self._inflight: Dict[int, Tuple[asyncio.Future, bytes]] = {}
+        self._pending_subacks: Dict[int, asyncio.Future] = {}
+        self._subscriptions: Dict[str, Tuple[int, MessageCallback]] = {}
+        self._pingresp: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.running = False
+        self.stats = {"published": 0, "received": 0, "reconnects": 0, "ping_timeouts": 0, "protocol_errors": 0}
+    
+    @property
+    def connected(self) -> bool:
+        return self._connected is not None and self._connected.is_set()
+    
+    def _packet_id(self) -> int:
+        for _ in range(65535):
+            self._next_id = self._next_id % 65535 + 1
+            if self._next_id not in self._inflight and self._next_id not in self._pending_subacks:
+                return self._next_id
+        raise RuntimeError("No free MQTT packet ids")
+    
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        flags = 0x02  # Clean session
+        payload = _encode_string(self.client_id)
+        if self.username:
+            flags |= 0x80
+            payload += _encode_string(self.username)
+            if self.password:
+                flags |= 0x40
+                payload += _encode_string(self.password)
+        body = _encode_string("MQTT") + bytes([4, flags]) + struct.pack("!H", self.keepalive) + payload
+        writer.write(_packet(CONNECT, 0, body))
+        await writer.drain()
+        
+        packet_type, _, body = await asyncio.wait_for(read_packet(reader), timeout=self.ack_timeout)
+        if packet_type != CONNACK or len(body) < 2 or body[1] != 0:
+            writer.close()
+            raise ConnectionError(f"MQTT connection refused (code {body[1] if len(body) > 1 else '?'})")
+        self._reader, self._writer = reader, writer
+    
+    async def connect(self):
+        """Connect and keep the session alive (reconnecting and resubscribing as needed)."""
+        self._connected = asyncio.Event()
+        self.running = True
+        await self._open()
+        self._connected.set()
+        logger.info(f"MQTT connected to {self.host}:{self.port}")
+        self._tasks = [asyncio.create_task(self._supervise()), asyncio.create_task(self._ping())]
+    
+    async def _supervise(self):
+        delay = self.reconnect_delay
+        while self.running:
+            protocol_error = False
+            try:
+                await self._read_loop()
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                if self.running:
+                    logger.warning(f"MQTT connection lost: {e}")
+            except Exception as e:
+                # Malformed packet (bad length, topic encoding...): the stream can't be trusted, start over
+                logger.error(f"MQTT protocol error, reconnecting: {e!r}")
+                self.stats["protocol_errors"] += 1
+                self._writer.transport.abort()
+                protocol_error = True
+            self._connected.clear()
+            if protocol_error and self.running:
+                # Reconnecting will succeed, but the broker may send the same packet again: back off
+                await asyncio.sleep(delay)
+                delay = min(self.max_reconnect_delay, delay * 2)
+            while self.running:
+                try:
+                    await self._open()
+                    break
+                except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                    logger.warning(f"MQTT reconnect failed ({e}); retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(self.max_reconnect_delay, delay * 2)
+            if not self.running:
+                return
+            if not protocol_error:
+                delay = self.reconnect_delay
+            self.stats["reconnects"] += 1
+            await self._restore_session()
+    
+    async def _restore_session(self):
+        """Resubscribe and resend unacknowledged QoS 1 publishes with DUP set."""
+        self._connected.set()
+        for pending in self._pending_subacks.values():
+            pending.cancel()
+        self._pending_subacks.clear()
+        for topic_filter, (qos, _) in self._subscriptions.items():
+            self._writer.write(self._subscribe_packet(topic_filter, qos, self._packet_id())[0])
+        for _, packet in self._inflight.values():
+            self._writer.write(bytes([packet[0] | 0x08]) + packet[1:])
+        await self._writer.drain()
+    
+    async def _read_loop(self):
+        while self.running:
+            packet_type, flags, body = await read_packet(self._reader)
+            if packet_type == PUBLISH:
+                topic, payload, qos, packet_id, _ = decode_publish(flags, body)
+                if qos:
+                    self._writer.write(_packet(PUBACK, 0, struct.pack("!H", packet_id)))
+                self.stats["received"] += 1
+                self._dispatch(topic, payload)
+            elif packet_type == PUBACK:
+                (packet_id,) = struct.unpack("!H", body[:2])
+                entry = self._inflight.pop(packet_id, None)
+                if entry is not None and not entry[0].done():
+                    entry[0].set_result(True)
+            elif packet_type == SUBACK:
+                (packet_id,) = struct.unpack("!H", body[:2])
+                future = self._pending_subacks.pop(packet_id, None)
+                if future is not None and not future.done():
+                    future.set_result(list(body[2:]))
+            elif packet_type == PINGRESP:
+                if self._pingresp is not None:
+                    self._pingresp.set()
+    
+    def _dispatch(self, topic: str, payload: bytes):
+        for topic_filter, (_, callback) in list(self._subscriptions.items()):
+            if not topic_matches(topic_filter, topic):
+                continue
+            try:
+                result = callback(topic, payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                logger.error(f"MQTT callback error on {topic}: {e}")
+    
+    async def _ping(self):
+        while self.running:
+            await asyncio.sleep(max(1, self.keepalive / 2))
+            if not self.connected:
+                continue
+            writer = self._writer
+            self._pingresp = asyncio.Event()
+            
+            async def round_trip():
+                writer.write(_packet(PINGREQ, 0, b""))
+                await writer.drain()
+                await self._pingresp.wait()
+            
+            try:
+                await asyncio.wait_for(round_trip(), timeout=self.keepalive)
+            except asyncio.TimeoutError:
+                # Half-open connection: the read loop would wait forever, so drop the socket
+                # and let the supervisor reconnect
+                logger.warning(f"MQTT broker did not answer PINGREQ within {self.keepalive}s; reconnecting")
+                self.stats["ping_timeouts"] += 1
+                writer.transport.abort()
+            except (ConnectionError, OSError):
+                pass
+    
+    async def _wait_connected(self):
+        if self._connected is None:
+            raise ConnectionError("MQTT client is not connected")
+        await asyncio.wait_for(self._connected.wait(), timeout=self.ack_timeout)
+    
+    async def publish(self, topic: str, payload: Payload, qos: int = 0, retain: bool = False):
+        await self.publish_many([(topic, payload)], qos=qos, retain=retain)
+    
+    async def publish_many(self, messages: Iterable[Tuple[str, Payload]], qos: int = 0, retain: bool = False) -> int:
+        """
+        Publish a batch with one socket write per window of max_inflight messages;
+        for QoS 1 all PUBACKs of a window are awaited together instead of one round-trip each.
+        """
+        if qos not in (0, 1):
+            raise ValueError("Only QoS 0 and 1 are supported")
+        await self._wait_connected()
+        loop = asyncio.get_running_loop()
+        messages = list(messages)
+        for start in range(0, len(messages), self.max_inflight):
+            buffer = bytearray()
+            futures = []
+            packet_ids = []
+            try:
+                for topic, payload in messages[start:start + self.max_inflight]:
+                    if qos:
+                        packet_id = self._packet_id()
+                        packet = encode_publish(topic, payload, qos, retain, packet_id)
+                        future = loop.create_future()
+                        self._inflight[packet_id] = (future, packet)
+                        futures.append(future)
+                        packet_ids.append(packet_id)
+                    else:
+                        packet = encode_publish(topic, payload, 0, retain)
+                    buffer += packet
+                self._writer.write(buffer)
+                await self._writer.drain()
+                if futures:
+                    await asyncio.wait_for(asyncio.gather(*futures), timeout=self.ack_timeout)
+            finally:
+                # Acknowledged ids were already released by the read loop; free the rest so a
+                # broker that drops PUBACKs cannot exhaust the packet id space
+                for packet_id in packet_ids:
+                    entry = self._inflight.pop(packet_id, None)
+                    if entry is not None and not entry[0].done():
+                        entry[0].cancel()
+        self.stats["published"] += len(messages)
+        return len(messages)
+    
+    def _subscribe_packet(self, topic_filter: str, qos: int, packet_id: int) -> Tuple[bytes, asyncio.Future]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending_subacks[packet_id] = future
+        body = struct.pack("!H", packet_id) + _encode_string(topic_filter) + bytes([qos])
+        return _packet(SUBSCRIBE, 0x02, body), future
+    
+    async def subscribe(self, topic_filter: str, callback: MessageCallback, qos: int = 1) -> int:
+        """Subscribe to a filter (wildcards allowed); returns the granted QoS."""
+        await self._wait_connected()
+        self._subscriptions[topic_filter] = (qos, callback)
+        packet, future = self._subscribe_packet(topic_filter, qos, self._packet_id())
+        self._writer.write(packet)
+        await self._writer.drain()
+        granted = (await asyncio.wait_for(future, timeout=self.ack_timeout))[0]
+        if granted == 0x80:
+            raise ConnectionError(f"Subscription to {topic_filter} refused")
+        return granted
+    
+    async def disconnect(self):
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        if self._writer is not None:
+            try:
+                self._writer.write(_packet(DISCONNECT, 0, b""))
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                pass
+            self._writer.close()
+        if self._connected is not None:
+            self._connected.clear()
+        for future, _ in self._inflight.values():
+            future.cancel()
+        self._inflight.clear()
@@ -0,0 +1,327 @@
+"""
+Kalpana AGI - Outbound Mail Queue
+Purpose: Persistent SMTP outbox drained by an async worker. Batches are sent over pooled,
+         reused SMTP connections, failures are retried with exponential backoff, and each
+         message's status is reported back through a callback (the HUD's email_status event).
+Dependencies: smtplib, sqlite3
+Notes: smtplib cannot pipeline commands, so throughput comes from reusing connections
+       (no TCP/TLS/AUTH handshake per message) and sending on several connections at once.
+"""
+
+import logging
+import time
+import random
+import asyncio
+import smtplib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import make_msgid, formatdate
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from backend.config.settings import settings
+
+logger = logging.getLogger("Kalpana.Outbox")
+
+# Code recorded when a message cannot be built locally; like a 5xx reply it is never retried
+UNSENDABLE = 554
+
+class SMTPPool:
+    """A small pool of open SMTP connections, reused across batches."""
+    
+    def __init__(self, host: str, port: int, username: str = "", password: str = "",
+                 starttls: bool = False, size: int = 2, idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: List[tuple] = []  # (connection, last_used)
+        self._lock = threading.Lock()
+        self.stats = {"connections_opened": 0, "connections_reused": 0}
+    
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        connection.ehlo()
+        if self.starttls:
+            connection.starttls()
+            connection.ehlo()
+        if self.username:
+            connection.login(self.username, self.password)
+        self.stats["connections_opened"] += 1
+        return connection
+    
+    def acquire(self) -> smtplib.SMTP:
+        """Return a live connection, reusing an idle one when possible."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            if time.monotonic() - last_used > self.idle_timeout:
+                self.discard(connection)
+                continue
+            try:
+                # Servers drop idle sessions; NOOP is cheaper than a failed send
+                if connection.noop()[0] == 250:
+                    self.stats["connections_reused"] += 1
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.discard(connection)
+        return self._connect()
+    
+    def release(self, connection: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self.discard(connection)
+    
+    @staticmethod
+    def discard(connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+    
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+class Outbox:
+    def __init__(self, db_path: str, host: Optional[str] = None, port: Optional[int] = None,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: Optional[bool] = None, sender: Optional[str] = None,
+                 pool_size: int = 2, batch_size: int = 20, max_attempts: int = 5,
+                 base_delay: float = 5.0, max_delay: float = 900.0):
+        self.host = settings.SMTP_HOST if host is None else host
+        self.port = settings.SMTP_PORT if port is None else port
+        self.sender = sender or settings.SMTP_FROM
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pool = SMTPPool(
+            self.host, self.port,
+            settings.SMTP_USER if username is None else username,
+            settings.SMTP_PASSWORD if password is None else password,
+            settings.SMTP_STARTTLS if starttls is None else starttls,
+            size=pool_size
+        )
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="smtp")
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.running = False
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                email_id TEXT,
+                recipient TEXT NOT NULL,
+                subject TEXT,
+                body TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                sent_at TEXT
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)')
+        # Messages caught mid-send by a crash go back to the queue
+        self.conn.execute("UPDATE outbox SET status = 'queued' WHERE status = 'sending'")
+        self.conn.commit()
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.host)
+    
+    def enqueue(self, to: str, subject: str, body: str, email_id: Optional[str] = None) -> int:
+        """Persist a message for delivery and wake the worker."""
+        self.check_headers(to, subject)
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO outbox (email_id, recipient, subject, body, next_attempt, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (email_id, to, subject, body, time.time(), datetime.now().isoformat())
+            )
+        self._rearm()
+        return cursor.lastrowid
+    
+    @staticmethod
+    def check_headers(to: str, subject: str):
+        """Refuse line breaks in header values; they would inject extra headers."""
+        for header, value in (("recipient", to), ("subject", subject)):
+            if value and ("\r" in value or "\n" in value):
+                raise ValueError(f"Line breaks are not allowed in the {header}")
+    
+    def _rearm(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def _claim_due(self) -> List[Dict[str, Any]]:
+        """Take up to batch_size due messages and mark them as sending."""
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT * FROM outbox WHERE status = 'queued' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+            self.conn.executemany("UPDATE outbox SET status = 'sending' WHERE seq = ?", [(row['seq'],) for row in rows])
+        return [dict(row) for row in rows]
+    
+    def _seconds_until_due(self) -> Optional[float]:
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+    
+    def _build_message(self, item: Dict[str, Any]) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = item['recipient']
+        message['Subject'] = item['subject'] or ""
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid(domain=self.sender.split("@")[-1] or None)
+        message.set_content(item['body'] or "")
+        return message
+    
+    def _deliver_chunk(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Send several messages over one pooled connection (runs in a worker thread)."""
+        results = []
+        connection = None
+        for item in items:
+            try:
+                message = self._build_message(item)
+            except (ValueError, TypeError) as e:
+                # Bad headers (e.g. rows queued before enqueue checked them) fail alone, not the batch
+                results.append((item, UNSENDABLE, f"Invalid message: {e}"))
+                continue
+            try:
+                if connection is None:
+                    connection = self.pool.acquire()
+                refused = connection.send_message(message)
+                # Partial refusal still delivered the message to the other recipients
+                results.append((item, 250, f"Refused: {', '.join(refused)}" if refused else None))
+            except smtplib.SMTPRecipientsRefused as e:
+                code, reason = next(iter(e.recipients.values()))
+                results.append((item, code, reason.decode(errors="replace") if isinstance(reason, bytes) else str(reason)))
+                connection = self._reset(connection)
+            except smtplib.SMTPResponseException as e:
+                results.append((item, e.smtp_code, str(e.smtp_error)))
+                connection = self._reset(connection)
+            except Exception as e:
+                # Connection-level (or unexpected) failure: drop it and let the next message reconnect
+                results.append((item, None, str(e) or e.__class__.__name__))
+                if connection is not None:
+                    self.pool.discard(connection)
+                connection = None
+        if connection is not None:
+            self.pool.release(connection)
+        return results
+    
+    def _reset(self, connection: smtplib.SMTP) -> Optional[smtplib.SMTP]:
+        """RSET after a rejected transaction so the connection can be reused."""
+        try:
+            connection.rset()
+            return connection
+        except Exception:
+            self.pool.discard(connection)
+            return None
+    
+    def _record(self, item: Dict[str, Any], code: Optional[int], error: Optional[str]) -> Dict[str, Any]:
+        """Persist the outcome of one attempt; 5xx is permanent, anything else is retried."""
+        attempts = item['attempts'] + 1
+        if code is not None and 200 <= code < 300:
+            status, next_attempt = "sent", None
+        elif (code is not None and code >= 500) or attempts >= self.max_attempts:
+            status, next_attempt = "failed", None
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            status, next_attempt = "queued", time.time() + delay * random.uniform(0.8, 1.2)
+        
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE outbox SET status = ?, attempts = ?, next_attempt = COALESCE(?, next_attempt), '
+                'last_error = ?, sent_at = ? WHERE seq = ?',
+                (status, attempts, next_attempt, error, datetime.now().isoformat() if status == "sent" else None, item['seq'])
+            )
+        return {
+            "outbox_id": item['seq'],
+            "email_id": item['email_id'],
+            "to": item['recipient'],
+            "subject": item['subject'],
+            "status": "retrying" if status == "queued" else status,
+            "attempts": attempts,
+            "error": error,
+            "retry_in": round(next_attempt - time.time(), 1) if next_attempt else None
+        }
+    
+    async def drain_once(self) -> List[Dict[str, Any]]:
+        """Deliver one batch of due messages, split across the connection pool."""
+        items = await asyncio.to_thread(self._claim_due)
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        chunks = [items[i::self.pool.size] for i in range(self.pool.size) if items[i::self.pool.size]]
+        outcomes = await asyncio.gather(*(loop.run_in_executor(self._executor, self._deliver_chunk, chunk) for chunk in chunks))
+        statuses = await asyncio.to_thread(
+            lambda: [self._record(item, code, error) for results in outcomes for item, code, error in results]
+        )
+        logger.info(f"Outbox batch: {sum(s['status'] == 'sent' for s in statuses)}/{len(statuses)} sent")
+        return statuses
+    
+    async def run(self, on_status: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                  max_sleep: float = 300.0):
+        """Worker loop: drain due batches, then sleep until the next retry or a new message."""
+        if not self.enabled:
+            logger.info("SMTP_HOST not set; outbox worker not started (demo mode)")
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.running = True
+        logger.info(f"Outbox worker started ({self.host}:{self.port})")
+        try:
+            while self.running:
+                self._wakeup.clear()
+                try:
+                    statuses = await self.drain_once()
+                except Exception as e:
+                    logger.error(f"Outbox delivery error: {e}")
+                    statuses = []
+                if on_status:
+                    for status in statuses:
+                        await on_status(status)
+                if statuses:
+                    continue  # More may be due right away
+                
+                delay = await asyncio.to_thread(self._seconds_until_due)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(max_sleep, delay) if delay is not None else max_sleep)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.pool.close()
+    
+    def stop(self):
+        self.running = False
+        self._rearm()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth by status plus connection reuse counters."""
+        with self._lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        return {
+            "enabled": self.enabled,
+            "queue": {row[0]: row[1] for row in rows},
+            **self.pool.stats
+        }
@@ -0,0 +1,220 @@
+"""
+Kalpana AGI - Recurrence Rules
+Purpose: RRULE-style recurrence (minutely/hourly/daily/weekly/weekdays, interval, until, count)
+         with lazy occurrence expansion shared by reminders and the calendar.
+Dependencies: datetime
+"""
+
+import re
+import math
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterator, List, Optional
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+FREQUENCIES = {
+    "MINUTELY": timedelta(minutes=1),
+    "HOURLY": timedelta(hours=1),
+    "DAILY": timedelta(days=1),
+    "WEEKLY": timedelta(weeks=1),
+}
+
+# Friendly names accepted wherever a rule string is
+ALIASES = {
+    "hourly": "FREQ=HOURLY",
+    "daily": "FREQ=DAILY",
+    "weekly": "FREQ=WEEKLY",
+    "weekdays": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "weekends": "FREQ=WEEKLY;BYDAY=SA,SU",
+}
+
+_EVERY_PATTERN = re.compile(r"^every\s+(\d+)?\s*(minute|hour|day|week)s?$")
+_EVERY_FREQ = {"minute": "MINUTELY", "hour": "HOURLY", "day": "DAILY", "week": "WEEKLY"}
+_DATE_ONLY = re.compile(r"^\d{4}-?\d{2}-?\d{2}$")
+
+def parse_ical_datetime(value: str) -> datetime:
+    """Parse an iCalendar DATE/DATE-TIME (or ISO string) into a naive local datetime."""
+    value = value.strip()
+    if value.endswith("Z"):
+        utc = parse_ical_datetime(value[:-1].replace("-", "").replace(":", ""))
+        return utc.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    if "-" in value or ":" in value:
+        return datetime.fromisoformat(value)
+    # Basic formats are sliced directly; strptime dominates bulk ICS imports otherwise
+    if len(value) == 15 and value[8] == "T" and value[:8].isdigit() and value[9:].isdigit():
+        return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                        int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if len(value) == 8 and value.isdigit():
+        return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    if "T" in value:
+        return datetime.strptime(value, "%Y%m%dT%H%M%S")
+    return datetime.strptime(value, "%Y%m%d")
+
+def format_ical_datetime(value: datetime) -> str:
+    """Format a naive local datetime as an iCalendar floating DATE-TIME."""
+    return value.strftime("%Y%m%dT%H%M%S")
+
+class RecurrenceRule:
+    """A parsed recurrence rule. Occurrences are generated on demand, never stored."""
+    
+    def __init__(self, freq: str, interval: int = 1, byday: Optional[List[str]] = None,
+                 until: Optional[datetime] = None, count: Optional[int] = None):
+        freq = freq.upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported frequency: {freq}")
+        if interval < 1:
+            raise ValueError("INTERVAL must be at least 1")
+        if count is not None and count < 1:
+            raise ValueError("COUNT must be at least 1")
+        
+        byday = sorted({WEEKDAYS.index(d.upper()) for d in byday}) if byday else None
+        if byday is not None and freq in ("MINUTELY", "HOURLY"):
+            raise ValueError("BYDAY is only supported with DAILY or WEEKLY rules")
+        if byday is not None and freq == "DAILY":
+            if interval != 1:
+                raise ValueError("BYDAY with DAILY requires INTERVAL=1")
+            freq = "WEEKLY"  # FREQ=DAILY;BYDAY=... picks the same days as a weekly rule
+        
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday
+        self.until = until
+        self.count = count
+    
+    @classmethod
+    def parse(cls, rule: str) -> "RecurrenceRule":
+        """Parse "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10", "RRULE:...", "weekdays" or "every 15 minutes"."""
+        text = rule.strip()
+        lowered = " ".join(text.lower().split())
+        if lowered in ALIASES:
+            text = ALIASES[lowered]
+        else:
+            match = _EVERY_PATTERN.match(lowered)
+            if match:
+                text = f"FREQ={_EVERY_FREQ[match.group(2)]};INTERVAL={match.group(1) or 1}"
+        if text.upper().startswith("RRULE:"):
+            text = text[6:]
+        
+        parts = {}
+        for part in text.split(";"):
+            if not part.strip():
+                continue
+            if "=" not in part:
+                raise ValueError(f"Invalid rule part: {part}")
+            key, value = part.split("=", 1)
+            parts[key.strip().upper()] = value.strip()
+        
+        unsupported = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "UNTIL", "COUNT", "WKST"}
+        if unsupported:
+            raise ValueError(f"Unsupported rule part(s): {', '.join(sorted(unsupported))}")
+        if "FREQ" not in parts:
+            raise ValueError(f"Rule is missing FREQ: {rule}")
+        if "UNTIL" in parts and "COUNT" in parts:
+            raise ValueError("UNTIL and COUNT cannot both be set")
+        
+        byday = None
+        if "BYDAY" in parts:
+            byday = [d.strip().upper() for d in parts["BYDAY"].split(",")]
+            invalid = [d for d in byday if d not in WEEKDAYS]
+            if invalid:
+                # Ordinals ("1MO", "-1FR") need monthly/yearly rules, which are not supported
+                raise ValueError(f"Unsupported BYDAY value(s): {', '.join(invalid)}")
+        
+        until = None
+        if "UNTIL" in parts:
+            until = parse_ical_datetime(parts["UNTIL"])
+            if _DATE_ONLY.match(parts["UNTIL"]):
+                until = datetime.combine(until.date(), time.max)  # A date-only UNTIL includes that whole day
+        
+        return cls(
+            freq=parts["FREQ"],
+            interval=int(parts.get("INTERVAL", 1)),
+            byday=byday,
+            until=until,
+            count=int(parts["COUNT"]) if "COUNT" in parts else None,
+        )
+    
+    def to_string(self) -> str:
+        """Serialize back to an RRULE value."""
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.byday is not None:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in self.byday))
+        if self.until is not None:
+            parts.append(f"UNTIL={format_ical_datetime(self.until)}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        return ";".join(parts)
+    
+    def __repr__(self) -> str:
+        return f"RecurrenceRule({self.to_string()!r})"
+    
+    def occurrences(self, dtstart: datetime, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> Iterator[datetime]:
+        """
+        Lazily yield occurrences of a series beginning at dtstart, optionally limited to [start, end).
+        Occurrences before start are skipped arithmetically, so the cost does not grow with series age.
+        """
+        if self.byday is None:
+            yield from self._simple(dtstart, start, end)
+        else:
+            yield from self._weekly_byday(dtstart, start, end)
+    
+    def _simple(self, dtstart: datetime, start: Optional[datetime], end: Optional[datetime]) -> Iterator[datetime]:
+        step = FREQUENCIES[self.freq] * self.interval
+        index = 0
+        if start is not None and start > dtstart:
+            index = math.ceil((start - dtstart) / step)
+        while self.count is None or index < self.count:
+            occurrence = dtstart + step * index
+            if self.until is not None and occurrence > self.until:
+                return
+            if end is not None and occurrence >= end:
+                return
+            yield occurrence
+            index += 1
+    
+    def _weekly_byday(self, dtstart: datetime, start: Optional[datetime], end: Optional[datetime]) -> Iterator[datetime]:
+        # Occurrences are generated week by week from the Monday of dtstart's week
+        anchor = dtstart - timedelta(days=dtstart.weekday())
+        first_week = [d for d in self.byday if d >= dtstart.weekday()]
+        per_week = len(self.byday)
+        
+        week = 0   # Active weeks since the anchor (each is `interval` calendar weeks apart)
+        index = 0  # Number of occurrences before the current week, for COUNT
+        if start is not None and start > dtstart:
+            week = max(0, (start - anchor).days // (7 * self.interval))
+            if week > 0:
+                index = len(first_week) + (week - 1) * per_week
+        
+        while True:
+            week_start = anchor + timedelta(weeks=week * self.interval)
+            for day in (first_week if week == 0 else self.byday):
+                if self.count is not None and index >= self.count:
+                    return
+                occurrence = week_start + timedelta(days=day)
+                if self.until is not None and occurrence > self.until:
+                    return
+                if end is not None and occurrence >= end:
+                    return
+                index += 1
+                if start is None or occurrence >= start:
+                    yield occurrence
+            week += 1
+    
+    def next_after(self, dtstart: datetime, after: datetime) -> Optional[datetime]:
+        """First occurrence strictly after `after`, or None when the series has ended."""
+        for occurrence in self.occurrences(dtstart, start=after):
+            if occurrence > after:
+                return occurrence
+        return None
+    
+    def last_occurrence(self, dtstart: datetime) -> Optional[datetime]:
+        """Upper bound of the series (None if it repeats forever)."""
+        if self.count is None:
+            return self.until
+        last = None
+        for last in self.occurrences(dtstart):
+            pass
+        return last
@@ -1,15 +1,18 @@
 """
 Kalpana AGI - Reminders Module
 Purpose: Schedule and manage reminders and alarms.
-Dependencies: schedule, asyncio
+Dependencies: asyncio, heapq, recurrence
 """
 
 import logging
 import asyncio
+import heapq
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import json
 import os
+from backend.plugins.recurrence import RecurrenceRule
 
 logger = logging.getLogger("Kalpana.Reminders")
 
@@ -17,6 +20,16 @@ class ReminderManager:
     def __init__(self):
         self.reminders_file = os.path.join(os.path.dirname(__file__), "../data/reminders.json")
         self.reminders = []
+        # Min-heap of (trigger timestamp, reminder id); entries are invalidated lazily
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}  # reminder id -> timestamp of its live heap entry
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._rules: Dict[int, RecurrenceRule] = {}  # Parsed once; only the next occurrence is ever scheduled
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.max_sleep = 300  # Upper bound on a single wait, guards against wall-clock jumps
         self.load_reminders()
     
     def load_reminders(self):
@@ -26,9 +39,70 @@ class ReminderManager:
                 with open(self.reminders_file, 'r') as f:
                     self.reminders = json.load(f)
                 logger.info(f"Loaded {len(self.reminders)} reminders")
+            self._rebuild_schedule()
         except Exception as e:
             logger.error(f"Load reminders error: {e}")
             self.reminders = []
+            self._rebuild_schedule()
+    
+    def _rebuild_schedule(self):
+        """Index reminders by id and heapify the active ones in O(n)."""
+        with self._lock:
+            self._by_id = {}
+            self._scheduled = {}
+            self._heap = []
+            self._rules = {}
+            readable = []
+            for reminder in self.reminders:
+                try:
+                    reminder_id = reminder['id']
+                    if not isinstance(reminder_id, int):
+                        raise TypeError(f"id must be an integer, not {reminder_id!r}")
+                    ts = datetime.fromisoformat(reminder['trigger_time']).timestamp() if reminder.get('active', False) else None
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    logger.error(f"Skipping unreadable reminder {reminder!r}: {e}")
+                    continue
+                readable.append(reminder)
+                self._by_id[reminder_id] = reminder
+                if reminder.get('recurring', False):
+                    try:
+                        self._rules[reminder_id] = RecurrenceRule.parse(reminder.get('rule') or "FREQ=DAILY")
+                    except (TypeError, ValueError, AttributeError) as e:
+                        logger.error(f"Invalid recurrence rule on reminder {reminder_id}: {e}")
+                        reminder['recurring'] = False
+                if ts is not None:
+                    self._scheduled[reminder_id] = ts
+                    self._heap.append((ts, reminder_id))
+            self.reminders = readable
+            self._next_id = max(self._by_id, default=0) + 1
+            heapq.heapify(self._heap)
+    
+    def _schedule(self, reminder: Dict[str, Any], trigger_time: datetime):
+        """Push a reminder's next trigger onto the heap (caller holds the lock)."""
+        ts = trigger_time.timestamp()
+        self._scheduled[reminder['id']] = ts
+        heapq.heappush(self._heap, (ts, reminder['id']))
+    
+    def _unschedule(self, reminder_id: int):
+        """Invalidate a reminder's heap entry; compact when stale entries dominate."""
+        self._scheduled.pop(reminder_id, None)
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._scheduled):
+            self._heap = [(ts, rid) for ts, rid in self._heap if self._scheduled.get(rid) == ts]
+            heapq.heapify(self._heap)
+    
+    def _rearm(self):
+        """Wake the monitor so it recomputes how long to sleep."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def seconds_until_next(self) -> Optional[float]:
+        """Seconds until the earliest active reminder, or None if nothing is scheduled."""
+        with self._lock:
+            while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)  # Drop stale entries
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - datetime.now().timestamp())
     
     def save_reminders(self):
         """Save reminders to file."""
@@ -40,20 +114,43 @@ class ReminderManager:
         except Exception as e:
             logger.error(f"Save reminders error: {e}")
     
-    def add_reminder(self, message: str, trigger_time: datetime, recurring: bool = False) -> Dict[str, Any]:
-        """Add a new reminder."""
+    def add_reminder(self, message: str, trigger_time: datetime, recurring: bool = False,
+                     rule: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Add a new reminder.
+        rule: RRULE-style recurrence ("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10", "weekdays",
+        "every 30 minutes"); trigger_time is the start of the series. recurring=True without
+        a rule repeats daily.
+        """
         try:
-            reminder = {
-                'id': len(self.reminders) + 1,
-                'message': message,
-                'trigger_time': trigger_time.isoformat(),
-                'recurring': recurring,
-                'active': True,
-                'created_at': datetime.now().isoformat()
-            }
+            parsed_rule = None
+            if rule or recurring:
+                parsed_rule = RecurrenceRule.parse(rule or "FREQ=DAILY")
+                first = next(parsed_rule.occurrences(trigger_time), None)
+                if first is None:
+                    return {"status": "error", "message": "Recurrence rule produces no occurrences"}
+                trigger_time = first
+            
+            with self._lock:
+                reminder = {
+                    'id': self._next_id,
+                    'message': message,
+                    'trigger_time': trigger_time.isoformat(),
+                    'recurring': parsed_rule is not None,
+                    'active': True,
+                    'created_at': datetime.now().isoformat()
+                }
+                if parsed_rule is not None:
+                    reminder['rule'] = parsed_rule.to_string()
+                    reminder['dtstart'] = trigger_time.isoformat()
+                    self._rules[reminder['id']] = parsed_rule
+                self._next_id += 1
+                self.reminders.append(reminder)
+                self._by_id[reminder['id']] = reminder
+                self._schedule(reminder, trigger_time)
             
-            self.reminders.append(reminder)
             self.save_reminders()
+            self._rearm()
             
             logger.info(f"Added reminder: {message} at {trigger_time}")
             return {"status": "success", "reminder": reminder}
@@ -67,15 +164,32 @@ class ReminderManager:
         return [r for r in self.reminders if r.get('active', False)]
     
     def check_due_reminders(self) -> List[Dict[str, Any]]:
-        """Check for reminders that are due."""
+        """Pop reminders that are due off the heap. Only due entries are touched."""
         now = datetime.now()
+        now_ts = now.timestamp()
         due_reminders = []
         
-        for reminder in self.get_active_reminders():
-            trigger_time = datetime.fromisoformat(reminder['trigger_time'])
-            if trigger_time <= now:
-                due_reminders.append(reminder)
-                if not reminder.get('recurring', False):
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_ts:
+                ts, reminder_id = heapq.heappop(self._heap)
+                if self._scheduled.get(reminder_id) != ts:
+                    continue  # Deleted or rescheduled since it was pushed
+                del self._scheduled[reminder_id]
+                
+                reminder = self._by_id[reminder_id]
+                due_reminders.append(dict(reminder))
+                rule = self._rules.get(reminder_id)
+                next_time = None
+                if rule is not None:
+                    # Missed occurrences (e.g. while the server was down) collapse into this one firing
+                    dtstart = datetime.fromisoformat(reminder.get('dtstart') or reminder['trigger_time'])
+                    fired = datetime.fromisoformat(reminder['trigger_time'])
+                    next_time = rule.next_after(dtstart, max(now, fired))
+                if next_time is not None:
+                    reminder.setdefault('dtstart', reminder['trigger_time'])
+                    reminder['trigger_time'] = next_time.isoformat()
+                    self._schedule(reminder, next_time)
+                else:
                     reminder['active'] = False
         
         if due_reminders:
@@ -86,8 +200,13 @@ class ReminderManager:
     def delete_reminder(self, reminder_id: int) -> Dict[str, Any]:
         """Delete a reminder."""
         try:
-            self.reminders = [r for r in self.reminders if r['id'] != reminder_id]
+            with self._lock:
+                self.reminders = [r for r in self.reminders if r['id'] != reminder_id]
+                self._by_id.pop(reminder_id, None)
+                self._rules.pop(reminder_id, None)
+                self._unschedule(reminder_id)
             self.save_reminders()
+            self._rearm()
             logger.info(f"Deleted reminder {reminder_id}")
             return {"status": "success"}
         except Exception as e:
@@ -95,10 +214,14 @@ class ReminderManager:
             return {"status": "error", "message": str(e)}
     
     async def start_monitoring(self, sio):
-        """Monitor reminders and emit notifications."""
+        """Monitor reminders and emit notifications, sleeping until the next one is due."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
         logger.info("Started reminder monitoring")
         while True:
             try:
+                # Clear before checking so an add/delete racing with us still wakes the next wait
+                self._wakeup.clear()
                 due = self.check_due_reminders()
                 for reminder in due:
                     await sio.emit('reminder_notification', {
@@ -107,8 +230,13 @@ class ReminderManager:
                     })
                     logger.info(f"Triggered reminder: {reminder['message']}")
                 
-                await asyncio.sleep(30)  # Check every 30 seconds
-                
+                delay = self.seconds_until_next()
+                timeout = self.max_sleep if delay is None else min(delay, self.max_sleep)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                    
             except Exception as e:
                 logger.error(f"Reminder monitoring error: {e}")
                 await asyncio.sleep(60)
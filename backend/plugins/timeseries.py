@@ -0,0 +1,313 @@
+"""
+Kalpana AGI - Device Telemetry Store
+Purpose: Embedded time-series storage for sensor readings. Raw samples are kept in
+         NumPy column chunks with delta-encoded timestamps and rolled up into
+         1s -> 1m -> 1h aggregates, each tier with its own retention window.
+Dependencies: numpy
+Notes: Range queries pick the finest tier that answers within max_points, so HUD
+       charts read a few hundred pre-aggregated buckets instead of raw samples.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("Kalpana.Telemetry")
+
+# (name, bucket seconds, retention seconds); raw samples are rolled up into 1s buckets
+RAW_RETENTION = 3600
+ROLLUP_TIERS = [
+    ("1s", 1, 6 * 3600),
+    ("1m", 60, 7 * 86400),
+    ("1h", 3600, 365 * 86400),
+]
+
+class RawChunk:
+    """A frozen block of samples: first timestamp plus uint32 millisecond deltas, float64 values."""
+    
+    __slots__ = ("start_ms", "end_ms", "deltas", "values")
+    
+    def __init__(self, timestamps_ms: array, values: array):
+        stamps = np.frombuffer(timestamps_ms, dtype=np.int64)
+        self.start_ms = int(stamps[0])
+        self.end_ms = int(stamps[-1])
+        self.deltas = np.diff(stamps).astype(np.uint32)
+        self.values = np.array(values, dtype=np.float64)
+    
+    def timestamps_ms(self) -> np.ndarray:
+        stamps = np.empty(len(self.values), dtype=np.int64)
+        stamps[0] = self.start_ms
+        np.cumsum(self.deltas, out=stamps[1:])
+        stamps[1:] += self.start_ms
+        return stamps
+    
+    @property
+    def nbytes(self) -> int:
+        return self.deltas.nbytes + self.values.nbytes
+
+class RollupTier:
+    """
+    Fixed-width aggregate buckets (count/sum/min/max/last). The open bucket absorbs
+    samples until one lands in a later bucket; the closed bucket is then returned so
+    the next, coarser tier can absorb it.
+    """
+    
+    COLUMNS = ("count", "sum", "min", "max", "last")
+    
+    def __init__(self, name: str, seconds: int, retention: float):
+        self.name = name
+        self.seconds = seconds
+        self.retention = retention
+        self.starts = array("q")
+        self.columns = {column: array("d") for column in self.COLUMNS}
+        self._head = 0  # Buckets before this index have expired
+        self.open: Optional[List[float]] = None  # [start, count, sum, min, max, last]
+    
+    def __len__(self) -> int:
+        return len(self.starts) - self._head
+    
+    def add(self, start: float, count: float, total: float, low: float, high: float, last: float) -> Optional[Tuple]:
+        bucket = int(start // self.seconds) * self.seconds
+        current = self.open
+        if current is not None and bucket == current[0]:
+            current[1] += count
+            current[2] += total
+            current[3] = min(current[3], low)
+            current[4] = max(current[4], high)
+            current[5] = last
+            return None
+        closed = None
+        if current is not None:
+            closed = tuple(current)
+            self.starts.append(int(current[0]))
+            for column, value in zip(self.COLUMNS, current[1:]):
+                self.columns[column].append(value)
+            self._expire(current[0])
+        self.open = [bucket, count, total, low, high, last]
+        return closed
+    
+    def _expire(self, now: float):
+        cutoff = now - self.retention
+        head = bisect.bisect_left(self.starts, cutoff, lo=self._head)
+        self._head = head
+        # Compact once the expired prefix dominates, so pruning stays amortised O(1)
+        if head > 1024 and head * 2 > len(self.starts):
+            self.starts = self.starts[head:]
+            for column in self.COLUMNS:
+                self.columns[column] = self.columns[column][head:]
+            self._head = 0
+    
+    def oldest(self) -> Optional[float]:
+        if len(self):
+            return float(self.starts[self._head])
+        return None if self.open is None else float(self.open[0])
+    
+    def query(self, start: float, end: float) -> Dict[str, np.ndarray]:
+        """Buckets starting in [start, end), including the still-open bucket."""
+        starts = np.frombuffer(self.starts, dtype=np.int64)[self._head:] if len(self.starts) else np.empty(0, np.int64)
+        lo, hi = np.searchsorted(starts, [start, end])
+        result = {"timestamps": starts[lo:hi].astype(np.float64)}
+        for column in self.COLUMNS:
+            values = self.columns[column]
+            # Copy out of the array buffer so later appends can still resize it
+            result[column] = np.frombuffer(values, dtype=np.float64)[self._head + lo:self._head + hi].copy() if len(values) else np.empty(0)
+        if self.open is not None and start <= self.open[0] < end:
+            result["timestamps"] = np.append(result["timestamps"], self.open[0])
+            for column, value in zip(self.COLUMNS, self.open[1:]):
+                result[column] = np.append(result[column], value)
+        return result
+
+class Series:
+    """One numeric signal, e.g. thermostat.temperature."""
+    
+    def __init__(self, chunk_size: int, raw_retention: float, tiers: List[Tuple[str, int, float]]):
+        self.chunk_size = chunk_size
+        self.raw_retention = raw_retention
+        self.chunks: List[RawChunk] = []
+        self.chunk_starts: List[int] = []
+        self._stamps = array("q")  # Active chunk, frozen into NumPy once full
+        self._values = array("d")
+        self.tiers = [RollupTier(*tier) for tier in tiers]
+        self.first: Optional[float] = None
+        self.samples = 0
+        self.out_of_order = 0
+    
+    def append(self, timestamp: float, value: float):
+        stamp_ms = int(timestamp * 1000)
+        last_ms = self._stamps[-1] if self._stamps else (self.chunks[-1].end_ms if self.chunks else None)
+        if last_ms is not None and stamp_ms < last_ms:
+            # Deltas are unsigned and rollups only move forward
+            self.out_of_order += 1
+            return
+        if self._stamps and stamp_ms - self._stamps[-1] > 0xFFFFFFFF:
+            self._freeze()  # Gap too wide for a uint32 delta
+        if self.first is None:
+            self.first = timestamp
+        self._stamps.append(stamp_ms)
+        self._values.append(value)
+        self.samples += 1
+        if len(self._stamps) >= self.chunk_size:
+            self._freeze()
+        
+        bucket = (timestamp, 1.0, value, value, value, value)
+        for tier in self.tiers:
+            bucket = tier.add(*bucket)
+            if bucket is None:
+                break
+    
+    def _freeze(self):
+        chunk = RawChunk(self._stamps, self._values)
+        self.chunks.append(chunk)
+        self.chunk_starts.append(chunk.start_ms)
+        self._stamps, self._values = array("q"), array("d")
+        cutoff_ms = (chunk.end_ms / 1000 - self.raw_retention) * 1000
+        expired = 0
+        while expired < len(self.chunks) and self.chunks[expired].end_ms < cutoff_ms:
+            expired += 1
+        if expired:
+            del self.chunks[:expired]
+            del self.chunk_starts[:expired]
+    
+    def oldest_raw(self) -> Optional[float]:
+        if self.chunks:
+            return self.chunks[0].start_ms / 1000
+        return self._stamps[0] / 1000 if self._stamps else None
+    
+    def count_raw(self, start: float, end: float) -> int:
+        """Upper bound on raw samples in a range, from chunk bounds alone (nothing is decoded)."""
+        start_ms, end_ms = start * 1000, end * 1000
+        first = max(0, bisect.bisect_right(self.chunk_starts, start_ms) - 1)
+        total = len(self._stamps)
+        for chunk in self.chunks[first:]:
+            if chunk.start_ms >= end_ms:
+                break
+            if chunk.end_ms >= start_ms:
+                total += len(chunk.values)
+        return total
+    
+    def query_raw(self, start: float, end: float) -> Dict[str, np.ndarray]:
+        start_ms, end_ms = start * 1000, end * 1000
+        stamps, values = [], []
+        # Skip straight to the first chunk that can overlap the range
+        first = max(0, bisect.bisect_right(self.chunk_starts, start_ms) - 1)
+        for chunk in self.chunks[first:]:
+            if chunk.start_ms >= end_ms:
+                break
+            if chunk.end_ms < start_ms:
+                continue
+            stamps.append(chunk.timestamps_ms())
+            values.append(chunk.values)
+        if self._stamps:
+            stamps.append(np.frombuffer(self._stamps, dtype=np.int64))
+            values.append(np.frombuffer(self._values, dtype=np.float64))
+        if not stamps:
+            return {"timestamps": np.empty(0), "value": np.empty(0)}
+        stamps, values = np.concatenate(stamps), np.concatenate(values)
+        lo, hi = np.searchsorted(stamps, [start_ms, end_ms])
+        return {"timestamps": stamps[lo:hi] / 1000.0, "value": values[lo:hi]}
+    
+    @property
+    def nbytes(self) -> int:
+        raw = sum(chunk.nbytes for chunk in self.chunks) + self._stamps.itemsize * len(self._stamps) * 2
+        rollups = sum(len(tier.starts) * 8 * (1 + len(tier.COLUMNS)) for tier in self.tiers)
+        return raw + rollups
+
+class TimeSeriesStore:
+    def __init__(self, chunk_size: int = 1024, raw_retention: float = RAW_RETENTION,
+                 tiers: Optional[List[Tuple[str, int, float]]] = None):
+        self.chunk_size = chunk_size
+        self.raw_retention = raw_retention
+        self.tier_specs = ROLLUP_TIERS if tiers is None else tiers
+        self.series: Dict[str, Series] = {}
+        self._lock = threading.Lock()
+    
+    def append(self, name: str, value: float, timestamp: Optional[float] = None):
+        with self._lock:
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = Series(self.chunk_size, self.raw_retention, self.tier_specs)
+            series.append(time.time() if timestamp is None else timestamp, float(value))
+    
+    def record(self, device_id: str, state: Any, timestamp: Optional[float] = None) -> int:
+        """Store the numeric fields of a device state report as <device>.<field> series."""
+        if isinstance(state, dict):
+            fields = state.items()
+        else:
+            fields = [("value", state)]
+        recorded = 0
+        for field, value in fields:
+            # Booleans chart as 0/1 (e.g. switch on-time); text states are not telemetry
+            if isinstance(value, (int, float)) and value == value:
+                self.append(f"{device_id}.{field}", value, timestamp)
+                recorded += 1
+        return recorded
+    
+    def list_series(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"name": name, "samples": series.samples, "bytes": series.nbytes, "out_of_order": series.out_of_order}
+                for name, series in sorted(self.series.items())
+            ]
+    
+    def query(self, name: str, start: Optional[float] = None, end: Optional[float] = None,
+              max_points: int = 500, resolution: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Samples of a series between two epoch timestamps (default: the last hour).
+        Without an explicit resolution ("raw", "1s", "1m", "1h") the finest tier that
+        covers the range in at most max_points buckets is used.
+        """
+        try:
+            end = time.time() if end is None else end
+            start = end - 3600 if start is None else start
+            with self._lock:
+                series = self.series.get(name)
+                if series is None:
+                    return {"status": "error", "message": f"Unknown series: {name}"}
+                
+                if resolution is None:
+                    resolution = self._pick_resolution(series, start, end, max_points)
+                if resolution == "raw":
+                    data = series.query_raw(start, end)
+                else:
+                    tier = next((t for t in series.tiers if t.name == resolution), None)
+                    if tier is None:
+                        return {"status": "error", "message": f"Unknown resolution: {resolution}"}
+                    buckets = tier.query(start, end)
+                    data = {
+                        "timestamps": buckets["timestamps"],
+                        "avg": buckets["sum"] / np.maximum(buckets["count"], 1),
+                        "min": buckets["min"],
+                        "max": buckets["max"],
+                        "count": buckets["count"]
+                    }
+            
+            return {
+                "status": "success",
+                "series": name,
+                "resolution": resolution,
+                "points": len(data["timestamps"]),
+                **{column: values.tolist() for column, values in data.items()}
+            }
+            
+        except Exception as e:
+            logger.error(f"Telemetry query error: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    @staticmethod
+    def _pick_resolution(series: Series, start: float, end: float, max_points: int) -> str:
+        # A young series only needs to cover the range from its first sample
+        effective_start = max(start, series.first or start)
+        raw_oldest = series.oldest_raw()
+        if raw_oldest is not None and raw_oldest <= effective_start and series.count_raw(start, end) <= max_points:
+            return "raw"
+        span = max(end - effective_start, 0.0)
+        for tier in series.tiers:
+            oldest = tier.oldest()
+            if oldest is not None and oldest <= effective_start and span / tier.seconds <= max_points:
+                return tier.name
+        return series.tiers[-1].name if series.tiers else "raw"
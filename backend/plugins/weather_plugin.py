@@ -7,7 +7,8 @@ Dependencies: requests
 import logging
 import os
 import requests
-from backend.plugins.loader import PluginInterface
+from backend.plugins.loader import PluginInterface, command
+from backend.plugins.cache import cached
 from typing import Dict, Any
 
 logger = logging.getLogger("Kalpana.WeatherPlugin")
@@ -19,23 +20,20 @@ class WeatherPlugin(PluginInterface):
         self.version = "1.0.0"
         self.description = "Get weather information"
         self.api_key = os.getenv("WEATHER_API_KEY", "")
+        self.api_url = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+        # Keep-alive session so repeated lookups reuse the upstream connection
+        self.session = requests.Session()
     
-    def execute(self, command: str, **kwargs) -> Dict[str, Any]:
-        """Execute weather command."""
-        if command == "get_weather":
-            location = kwargs.get("location", "London")
-            return self.get_weather(location)
-        else:
-            return {"status": "error", "message": f"Unknown command: {command}"}
-    
-    def get_weather(self, location: str) -> Dict[str, Any]:
+    @command()
+    @cached(ttl=600, stale_ttl=1800, negative_ttl=60, casefold=True)
+    def get_weather(self, location: str = "London") -> Dict[str, Any]:
         """Get current weather for a location."""
         if not self.api_key:
             return {"status": "success", "message": f"Weather in {location}: 72°F, Partly cloudy (demo mode - no API key)"}
         
         try:
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={self.api_key}&units=imperial"
-            response = requests.get(url, timeout=5)
+            params = {"q": location, "appid": self.api_key, "units": "imperial"}
+            response = self.session.get(self.api_url, params=params, timeout=5)
             data = response.json()
             
             if response.status_code == 200:
@@ -51,3 +49,7 @@ class WeatherPlugin(PluginInterface):
         except Exception as e:
             logger.error(f"Weather error: {e}")
             return {"status": "error", "message": str(e)}
+    
+    def shutdown(self):
+        """Close pooled upstream connections."""
+        self.session.close()
@@ -0,0 +1,145 @@
+"""
+Kalpana AGI - Security Event Queue
+Purpose: Moves file-event processing off watchdog's observer thread. Events are keyed
+         (by path), repeated events for a key within the debounce window collapse into
+         one, and a fixed pool of worker threads processes due keys in batches.
+Dependencies: None
+Notes: The window starts at a key's first event and is not extended by later ones, so
+       a file rewritten continuously is still processed every `debounce` seconds.
+       submit() never blocks: past max_pending new keys are dropped and counted.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("Kalpana.SecurityQueue")
+
+class CoalescingDispatcher:
+    def __init__(self, handler: Callable[[List[Dict[str, Any]]], None], workers: int = 4,
+                 debounce: float = 0.5, batch_size: int = 32, max_pending: int = 10000):
+        """handler(items) runs on a worker thread; each item is {key, payload, events, first_seen}."""
+        self.handler = handler
+        self.workers = workers
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._due: List[Tuple[float, int, Any]] = []  # Heap of (due time, sequence, key)
+        self._sequence = itertools.count()
+        self._inflight: set = set()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self.running = False
+        self.stats = {"submitted": 0, "coalesced": 0, "dropped": 0, "processed": 0, "batches": 0, "errors": 0,
+                      "lag_ms": 0.0, "avg_lag_ms": 0.0, "max_lag_ms": 0.0, "process_ms": 0.0}
+    
+    def submit(self, key: Any, payload: Any = None) -> bool:
+        """Queue an event for key; returns False if the queue is full and the event was dropped."""
+        now = time.monotonic()
+        with self._cond:
+            self.stats["submitted"] += 1
+            item = self._pending.get(key)
+            if item is not None:
+                item["payload"] = payload
+                item["events"] += 1
+                self.stats["coalesced"] += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            self._pending[key] = {"key": key, "payload": payload, "events": 1, "first_seen": now}
+            heapq.heappush(self._due, (now + self.debounce, next(self._sequence), key))
+            self._cond.notify()
+            return True
+    
+    def _take_batch(self) -> Optional[List[Dict[str, Any]]]:
+        """Wait for due keys and claim up to batch_size of them; None when stopping."""
+        with self._cond:
+            while self.running:
+                now = time.monotonic()
+                batch = []
+                while self._due and self._due[0][0] <= now and len(batch) < self.batch_size:
+                    _, _, key = heapq.heappop(self._due)
+                    if key in self._inflight:
+                        # Another worker is still on this key: look again after the next window
+                        heapq.heappush(self._due, (now + self.debounce, next(self._sequence), key))
+                        break
+                    batch.append(self._pending.pop(key))
+                    self._inflight.add(key)
+                if batch:
+                    if self._due and self._due[0][0] <= now:
+                        self._cond.notify()  # More is due: wake another worker
+                    return batch
+                self._cond.wait(self._due[0][0] - now if self._due else None)
+            return None
+    
+    def _work(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            lag = max(started - item["first_seen"] for item in batch)
+            try:
+                self.handler(batch)
+            except Exception as e:
+                logger.error(f"Security event batch error: {e}")
+                with self._cond:
+                    self.stats["errors"] += 1
+            elapsed = time.monotonic() - started
+            with self._cond:
+                for item in batch:
+                    self._inflight.discard(item["key"])
+                stats = self.stats
+                stats["processed"] += len(batch)
+                stats["batches"] += 1
+                stats["lag_ms"] = round(lag * 1000, 2)
+                # EWMA over batches
+                stats["avg_lag_ms"] = round(0.9 * stats["avg_lag_ms"] + 0.1 * stats["lag_ms"], 2) if stats["batches"] > 1 else stats["lag_ms"]
+                stats["max_lag_ms"] = max(stats["max_lag_ms"], stats["lag_ms"])
+                stats["process_ms"] = round(elapsed * 1000, 2)
+    
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self._threads = [threading.Thread(target=self._work, name=f"security-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+    
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until every queued key has been processed (used by tests and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._pending and not self._inflight:
+                    return True
+            time.sleep(0.01)
+        return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, keys being processed, and how long events waited before processing."""
+        with self._cond:
+            oldest = min((item["first_seen"] for item in self._pending.values()), default=None)
+            return {
+                "running": self.running,
+                "workers": self.workers,
+                "depth": len(self._pending),
+                "inflight": len(self._inflight),
+                "oldest_ms": round((time.monotonic() - oldest) * 1000, 2) if oldest is not None else 0.0,
+                **self.stats
+            }
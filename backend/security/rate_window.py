@@ -0,0 +1,92 @@
+"""
+Kalpana AGI - Sliding-Window Rate Counters
+Purpose: Event counts over the last N seconds, kept as a ring of per-second buckets with a
+         running total. Recording and the full-window count are O(1); a count over the
+         last k seconds sums k buckets. Expired buckets are cleared as time advances, at
+         most once per second of elapsed time, whatever the event rate.
+Dependencies: None
+"""
+
+import heapq
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+def _second(now: Optional[float]) -> int:
+    return int(time.monotonic() if now is None else now)
+
+class SlidingWindowCounter:
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.buckets = [0] * window
+        self.newest: Optional[int] = None  # Absolute second held by the newest bucket
+        self.total = 0
+    
+    def _advance(self, second: int):
+        if self.newest is None:
+            self.newest = second
+            return
+        gap = second - self.newest
+        if gap <= 0:
+            return
+        if gap >= self.window:
+            self.buckets = [0] * self.window
+            self.total = 0
+        else:
+            for expired in range(self.newest + 1, second + 1):
+                index = expired % self.window
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+        self.newest = second
+    
+    def add(self, amount: int = 1, now: Optional[float] = None):
+        second = _second(now)
+        self._advance(second)
+        if second <= self.newest - self.window:
+            return  # Older than the window
+        self.buckets[second % self.window] += amount
+        self.total += amount
+    
+    def count(self, seconds: Optional[int] = None, now: Optional[float] = None) -> int:
+        """Events in the last `seconds` (default: the whole window), including the current second."""
+        self._advance(_second(now))
+        if seconds is None or seconds >= self.window:
+            return self.total
+        return sum(self.buckets[(self.newest - i) % self.window] for i in range(seconds))
+    
+    def rate(self, seconds: Optional[int] = None, now: Optional[float] = None) -> float:
+        """Events per second over the last `seconds`."""
+        seconds = self.window if seconds is None else min(seconds, self.window)
+        return self.count(seconds, now) / seconds
+
+class KeyedWindowCounters:
+    """One SlidingWindowCounter per key (directory, extension...), bounded to max_keys."""
+    
+    def __init__(self, window: int = 60, max_keys: int = 1000):
+        self.window = window
+        self.max_keys = max_keys
+        self.counters: Dict[Any, SlidingWindowCounter] = {}
+    
+    def add(self, key: Any, amount: int = 1, now: Optional[float] = None):
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) >= self.max_keys:
+                self._prune(now)
+                if len(self.counters) >= self.max_keys:
+                    return  # Every tracked key is still active; new keys wait for one to go idle
+            counter = self.counters[key] = SlidingWindowCounter(self.window)
+        counter.add(amount, now)
+    
+    def count(self, key: Any, seconds: Optional[int] = None, now: Optional[float] = None) -> int:
+        counter = self.counters.get(key)
+        return counter.count(seconds, now) if counter is not None else 0
+    
+    def _prune(self, now: Optional[float] = None):
+        """Drop keys with no events left in the window."""
+        for key in [key for key, counter in self.counters.items() if counter.count(None, now) == 0]:
+            del self.counters[key]
+    
+    def top(self, limit: int = 5, seconds: Optional[int] = None, now: Optional[float] = None) -> List[Tuple[Any, int]]:
+        """The `limit` busiest keys over the last `seconds`, as (key, count)."""
+        self._prune(now)
+        counts = ((key, counter.count(seconds, now)) for key, counter in self.counters.items())
+        return [(key, count) for key, count in heapq.nlargest(limit, counts, key=lambda pair: pair[1]) if count]
@@ -1,65 +1,121 @@
 """
 Kalpana AGI - Enhanced Security Core (Section T)
 Purpose: Advanced threat detection, ransomware monitoring, file integrity
-Dependencies: watchdog, cryptography
+Dependencies: watchdog, cryptography, numpy
 Permissions: File System Read/Write
 """
 
 import logging
+import os
+import threading
 import time
-import math
 from pathlib import Path
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Any, Dict, List
+import numpy as np
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from backend.config.settings import settings
+from backend.security.event_queue import CoalescingDispatcher
+from backend.security.rate_window import KeyedWindowCounters, SlidingWindowCounter
 
 logger = logging.getLogger("Kalpana.SecurityCore")
 
+ENTROPY_BLOCK = 4096  # Bytes per sampled region
+ENTROPY_THRESHOLD = 7.5  # Bits per byte; encrypted or compressed data is close to 8
+ENTROPY_SUFFIXES = ('.txt', '.doc', '.pdf')
+
 class SecurityMetrics:
     def __init__(self):
-        self.files_modified_last_minute = []
+        # Per-second buckets over the last minute: recording and the threat score's queries are O(1)
+        self.modifications = SlidingWindowCounter(60)
+        self.modifications_by_directory = KeyedWindowCounters(60)
+        self.modifications_by_extension = KeyedWindowCounters(60)
         self.suspicious_extensions = ['.encrypted', '.locked', '.crypto', '.cerber', '.locky']
+        # Own counter: the keyed map above drops new keys once it is full, and these must never be dropped
+        self.suspicious_modifications = SlidingWindowCounter(60)
         self.high_entropy_files = []
         self.threat_score = 0.0
         self.alerts = []
+        self.lock = threading.Lock()  # Event queue workers update the metrics concurrently
     
     def calculate_entropy(self, data: bytes) -> float:
         """Calculate Shannon entropy of data (measure of randomness)."""
         if not data:
             return 0.0
-        
-        entropy = 0
-        for x in range(256):
-            p_x = float(data.count(bytes([x]))) / len(data)
-            if p_x > 0:
-                entropy += - p_x * math.log2(p_x)
-        return entropy
+        counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        p = counts[counts > 0] / len(data)
+        return float(-(p * np.log2(p)).sum())
+    
+    def calculate_entropy_batch(self, blocks: List[bytes]) -> np.ndarray:
+        """Shannon entropy of many blocks: one byte histogram each, then the entropy of all rows at once."""
+        counts = np.zeros((len(blocks), 256), dtype=np.int64)
+        for i, block in enumerate(blocks):
+            counts[i] = np.bincount(np.frombuffer(block, dtype=np.uint8), minlength=256)
+        lengths = np.maximum(counts.sum(axis=1), 1)
+        p = counts / lengths[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(counts > 0, p * np.log2(p), 0.0)
+        return -terms.sum(axis=1)
+    
+    def sample_regions(self, file_path: Path) -> List[bytes]:
+        """Head, middle and tail blocks of a file, so encrypting past the first block is still seen."""
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            regions = []
+            for offset in sorted({0, max(0, (size - ENTROPY_BLOCK) // 2), max(0, size - ENTROPY_BLOCK)}):
+                f.seek(offset)
+                regions.append(f.read(ENTROPY_BLOCK))
+            return regions
+    
+    def entropy_scores(self, file_paths: List[Path]) -> Dict[str, float]:
+        """Highest region entropy per file, for many files at once (unreadable files are skipped)."""
+        owners, blocks = [], []
+        for file_path in file_paths:
+            try:
+                regions = self.sample_regions(file_path)
+            except OSError:
+                continue
+            owners.extend([str(file_path)] * len(regions))
+            blocks.extend(regions)
+        scores: Dict[str, float] = {}
+        for owner, entropy in zip(owners, self.calculate_entropy_batch(blocks)):
+            scores[owner] = max(scores.get(owner, 0.0), float(entropy))
+        return scores
     
     def is_high_entropy(self, file_path: Path) -> bool:
         """Check if file has high entropy (likely encrypted)."""
         try:
-            data = file_path.read_bytes()[:4096]  # Sample first 4KB
-            entropy = self.calculate_entropy(data)
-            return entropy > 7.5  # Threshold for encrypted data
+            return self.entropy_scores([file_path]).get(str(file_path), 0.0) > ENTROPY_THRESHOLD
         except Exception:
             return False
     
+    def is_suspicious(self, file_path: Path) -> bool:
+        """Ransomware-style extension (case-insensitive)?"""
+        return file_path.suffix.lower() in self.suspicious_extensions
+    
+    def record_modification(self, file_path: Path):
+        """Count one file modification in the global, per-directory and per-extension windows."""
+        self.modifications.add()
+        self.modifications_by_directory.add(str(file_path.parent))
+        self.modifications_by_extension.add(file_path.suffix.lower())
+        if self.is_suspicious(file_path):
+            self.suspicious_modifications.add()
+    
     def update_threat_score(self):
         """Calculate overall threat score (0-100)."""
         score = 0
         
         # Recent rapid file changes
-        recent_changes = len([t for t in self.files_modified_last_minute 
-                             if datetime.now() - t < timedelta(seconds=5)])
+        recent_changes = self.modifications.count(5)
         if recent_changes > 10:
             score += 40
         elif recent_changes > 5:
             score += 20
         
-        # Suspicious extensions
-        if self.suspicious_extensions:
+        # Suspicious extensions written in the last minute
+        if self.suspicious_modifications.count():
             score += 30
         
         # High entropy files
@@ -70,33 +126,39 @@ class SecurityMetrics:
         return self.threat_score
 
 class SecurityEventHandler(FileSystemEventHandler):
-    def __init__(self, metrics: SecurityMetrics):
+    def __init__(self, metrics: SecurityMetrics, workers: int = 4, debounce: float = 0.5):
         self.metrics = metrics
+        # Watchdog's observer thread only enqueues; file reads and scoring run on the queue's workers
+        self.queue = CoalescingDispatcher(self.process_batch, workers=workers, debounce=debounce)
         logger.info("Security Event Handler initialized")
     
     def on_modified(self, event):
         if event.is_directory:
             return
+        if not self.queue.submit(event.src_path, datetime.now()):
+            # Queue full: the file goes unscored, but the burst still counts toward the rate and score
+            with self.metrics.lock:
+                self.metrics.record_modification(Path(event.src_path))
+                self.metrics.update_threat_score()
+    
+    def process_batch(self, items: List[Dict[str, Any]]):
+        """Score a batch of modified files (one item per path, repeats coalesced) and update the metrics."""
+        paths = [Path(item["key"]) for item in items]
+        # Entropy sampling is the I/O-heavy part and runs outside the metrics lock
+        scores = self.metrics.entropy_scores([path for path in paths if path.suffix in ENTROPY_SUFFIXES])
         
-        try:
-            file_path = Path(event.src_path)
-            self.metrics.files_modified_last_minute.append(datetime.now())
-            
-            # Clean up old timestamps (keep last minute only)
-            cutoff = datetime.now() - timedelta(minutes=1)
-            self.metrics.files_modified_last_minute = [
-                t for t in self.metrics.files_modified_last_minute if t > cutoff
-            ]
-            
-            # Check for suspicious extension
-            if any(file_path.suffix == ext for ext in self.metrics.suspicious_extensions):
-                alert = f"⚠️ Suspicious file extension detected: {file_path.name}"
-                self.metrics.alerts.append(alert)
-                logger.warning(alert)
-            
-            # Check for high entropy (encrypted content)
-            if file_path.suffix in ['.txt', '.doc', '.pdf'] and file_path.exists():
-                if self.metrics.is_high_entropy(file_path):
+        with self.metrics.lock:
+            for file_path in paths:
+                self.metrics.record_modification(file_path)
+                
+                # Check for suspicious extension
+                if self.metrics.is_suspicious(file_path):
+                    alert = f"⚠️ Suspicious file extension detected: {file_path.name}"
+                    self.metrics.alerts.append(alert)
+                    logger.warning(alert)
+                
+                # Check for high entropy (encrypted content)
+                if scores.get(str(file_path), 0.0) > ENTROPY_THRESHOLD:
                     self.metrics.high_entropy_files.append(str(file_path))
                     alert = f"⚠️ High entropy file detected (possible encryption): {file_path.name}"
                     self.metrics.alerts.append(alert)
@@ -104,23 +166,21 @@ class SecurityEventHandler(FileSystemEventHandler):
             
             # Update threat score
             score = self.metrics.update_threat_score()
-            if score > 50:
-                logger.error(f"🚨 THREAT LEVEL HIGH: {score}/100")
-            
-        except Exception as e:
-            logger.error(f"Security event error: {e}")
+        if score > 50:
+            logger.error(f"🚨 THREAT LEVEL HIGH: {score}/100")
 
 class SecurityCore:
     def __init__(self):
         self.monitor_path = settings.PROJECT_ROOT
         self.metrics = SecurityMetrics()
-        self.event_handler = SecurityEventHandler(self.metrics)
+        self.event_handler = SecurityEventHandler(self.metrics, settings.SECURITY_WORKERS, settings.SECURITY_DEBOUNCE)
         self.observer = Observer()
         logger.info(f"Security Core initialized, monitoring: {self.monitor_path}")
     
     def start_protection(self):
         """Start file system monitoring."""
         try:
+            self.event_handler.queue.start()
             self.observer.schedule(self.event_handler, str(self.monitor_path), recursive=True)
             self.observer.start()
             logger.info("🛡️ Security monitoring ACTIVE")
@@ -129,27 +189,42 @@ class SecurityCore:
     
     def stop_protection(self):
         """Stop file system monitoring."""
-        self.observer.stop()
-        self.observer.join()
+        if self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
+        # Score what was already queued before the workers exit
+        if not self.event_handler.queue.flush():
+            logger.warning("Security event queue did not drain before shutdown")
+        self.event_handler.queue.stop()
         logger.info("Security monitoring STOPPED")
     
     def get_status(self):
         """Get current security status."""
-        threat_level = "LOW"
-        if self.metrics.threat_score > 70:
-            threat_level = "CRITICAL"
-        elif self.metrics.threat_score > 40:
-            threat_level = "HIGH"
-        elif self.metrics.threat_score > 20:
-            threat_level = "MEDIUM"
-        
-        return {
-            "active": self.observer.is_alive(),
-            "threat_level": threat_level,
-            "threat_score": self.metrics.threat_score,
-            "monitored_path": str(self.monitor_path),
-            "recent_alerts": self.metrics.alerts[-5:],  # Last 5 alerts
-            "files_modified_last_minute": len(self.metrics.files_modified_last_minute)
-        }
+        # The window counters advance and prune on read, so the whole snapshot is taken under
+        # the lock the event workers record with
+        with self.metrics.lock:
+            # Cheap to recompute, and lets the score decay once a burst is over
+            score = self.metrics.update_threat_score()
+            threat_level = "LOW"
+            if score > 70:
+                threat_level = "CRITICAL"
+            elif score > 40:
+                threat_level = "HIGH"
+            elif score > 20:
+                threat_level = "MEDIUM"
+            
+            status = {
+                "active": self.observer.is_alive(),
+                "threat_level": threat_level,
+                "threat_score": score,
+                "monitored_path": str(self.monitor_path),
+                "recent_alerts": self.metrics.alerts[-5:],  # Last 5 alerts
+                "files_modified_last_minute": self.metrics.modifications.count(),
+                "modification_rate": round(self.metrics.modifications.rate(5), 2),  # Per second, last 5s
+                "busiest_directories": self.metrics.modifications_by_directory.top(5),
+                "busiest_extensions": self.metrics.modifications_by_extension.top(5)
+            }
+        status["event_queue"] = self.event_handler.queue.get_stats()
+        return status
 
 security_core = SecurityCore()
@@ -0,0 +1,389 @@
+"""
+Kalpana AGI - Performance Benchmarks
+Purpose: Measure hot paths of the assistant's subsystems with realistic data volumes.
+Usage: python benchmark_features.py [section ...]
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def timed(fn, repeat: int = 1):
+    """Run fn `repeat` times and return (last result, average seconds per run)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+def bench_calendar():
+    """Interval index vs. linear scan over 100k calendar events."""
+    from backend.plugins.calendar import CalendarManager
+
+    count = 100_000
+    base = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=180)
+    events = []
+    for i in range(count):
+        start = base + timedelta(minutes=random.randrange(0, 365 * 24 * 60, 15))
+        end = start + timedelta(minutes=random.choice([15, 30, 60, 90, 120]))
+        events.append({
+            'id': f"event_{i + 1}",
+            'summary': f"Event {i + 1}",
+            'description': "",
+            'start_time': start.isoformat(),
+            'end_time': end.isoformat(),
+            'created_at': base.isoformat()
+        })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar_events.json")
+        with open(path, 'w') as f:
+            json.dump(events, f)
+
+        manager, load_time = timed(lambda: CalendarManager(events_file=path))
+        print(f"  Load + index {count:,} events: {load_time * 1000:.0f} ms")
+
+        def linear_upcoming():
+            now = datetime.now()
+            upcoming = [e for e in manager.events if datetime.fromisoformat(e['start_time']) >= now]
+            upcoming.sort(key=lambda x: x['start_time'])
+            return upcoming[:10]
+
+        _, linear = timed(linear_upcoming, repeat=3)
+        result, indexed = timed(lambda: manager.get_upcoming_events(10), repeat=1000)
+        assert [e['start_time'] for e in result] == [e['start_time'] for e in linear_upcoming()]
+        print(f"  Upcoming (10): linear {linear * 1000:.1f} ms, indexed {indexed * 1e6:.1f} µs ({linear / indexed:,.0f}x)")
+
+        window_start = datetime.now().replace(hour=15, minute=0, second=0, microsecond=0)
+        window_end = window_start + timedelta(hours=2)
+        overlaps, overlap_time = timed(lambda: manager.get_events_between(window_start, window_end), repeat=1000)
+        print(f"  Overlap 15:00-17:00: {len(overlaps)} events in {overlap_time * 1e6:.1f} µs")
+
+        day_start = window_start.replace(hour=9)
+        day_end = window_start.replace(hour=18)
+        slots, slot_time = timed(lambda: manager.find_free_slots(day_start, day_end, duration_minutes=60), repeat=200)
+        print(f"  Free 1h slots 09:00-18:00: {len(slots)} found in {slot_time * 1e6:.1f} µs")
+
+        _, create_time = timed(lambda: manager._index_event(dict(events[0], id="event_bench")))
+        print(f"  Index insert: {create_time * 1e6:.1f} µs")
+
+        ics_path = os.path.join(tmp, "calendar.ics")
+        exported, export_time = timed(lambda: manager.export_ics(ics_path))
+        print(f"  ICS export {exported['exported']:,} events: {export_time * 1000:.0f} ms")
+        copy = CalendarManager(events_file=os.path.join(tmp, "copy.json"))
+        imported, import_time = timed(lambda: copy.import_ics(ics_path))
+        print(f"  ICS import {imported['imported']:,} events: {import_time * 1000:.0f} ms")
+
+def bench_email():
+    """Latest-N, pagination and full-text search over a 100k message mailbox."""
+    from backend.plugins.email import EmailManager
+
+    count = 100_000
+    words = ["invoice", "meeting", "report", "travel", "budget", "launch", "review", "lunch", "deadline", "update"]
+    base = datetime.now() - timedelta(days=365)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = EmailManager(db_path=os.path.join(tmp, "emails.db"))
+        emails = [{
+            'to': "me@local",
+            'from': f"sender{i % 500}@example.com",
+            'subject': f"{random.choice(words)} {random.choice(words)} #{i}",
+            'body': " ".join(random.choice(words) for _ in range(40)),
+            'date': (base + timedelta(seconds=random.randrange(365 * 86400))).isoformat(),
+            'type': random.choice(["inbox", "inbox", "inbox", "sent"])
+        } for i in range(count)]
+        _, load_time = timed(lambda: manager.store.add_many(emails))
+        print(f"  Bulk insert {count:,} emails: {load_time * 1000:.0f} ms")
+
+        _, send_time = timed(lambda: manager.send_email("you@example.com", "Hello", "Single insert"), repeat=200)
+        print(f"  send_email (single insert): {send_time * 1e6:.0f} µs")
+
+        latest, latest_time = timed(lambda: manager.read_emails(10), repeat=200)
+        print(f"  Latest 10: {latest_time * 1000:.2f} ms")
+
+        page = manager.list_emails(limit=50, folder="inbox")
+        _, page_time = timed(lambda: manager.list_emails(limit=50, folder="inbox", cursor=page['next_cursor']), repeat=200)
+        print(f"  Inbox page 2 (50): {page_time * 1000:.2f} ms")
+
+        found, search_time = timed(lambda: manager.search_emails("invoice deadline", limit=20), repeat=50)
+        print(f"  Search 'invoice deadline' (20 newest): {search_time * 1000:.1f} ms")
+
+        emails.sort(key=lambda e: e['date'], reverse=True)
+        _, linear = timed(lambda: sorted(emails, key=lambda x: x['date'], reverse=True)[:10], repeat=5)
+        print(f"  Old approach (sort list per read): {linear * 1000:.1f} ms")
+        manager.store.conn.close()
+
+def bench_mail_import():
+    """Streaming mbox import throughput and checkpointed re-import."""
+    import mailbox
+    from email.message import EmailMessage
+    from backend.plugins.email_store import EmailStore
+    from backend.plugins.mail_import import MailImporter
+
+    count = 20_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inbox.mbox")
+        box = mailbox.mbox(path)
+        for i in range(count):
+            message = EmailMessage()
+            message['From'] = f"Sender {i % 300} <sender{i % 300}@example.com>"
+            message['To'] = "me@local"
+            message['Subject'] = f"Message {i}"
+            message['Date'] = "Mon, 19 Oct 2026 10:00:00 +0000"
+            message['Message-ID'] = f"<{i}@example.com>"
+            message.set_content("Lorem ipsum dolor sit amet.\n" * 20)
+            box.add(message)
+        box.flush()
+        print(f"  mbox size: {os.path.getsize(path) / 1e6:.1f} MB")
+
+        importer = MailImporter(EmailStore(os.path.join(tmp, "emails.db")))
+        stats = importer.import_path(path)
+        print(f"  Import {stats['imported']:,} messages: {stats['seconds']:.2f} s ({stats['messages_per_second']:,.0f} msg/s)")
+        again = importer.import_path(path)
+        print(f"  Re-import from checkpoint: {again['imported']} new in {again['seconds'] * 1000:.1f} ms")
+        importer.store.conn.close()
+
+def bench_mqtt():
+    """MQTT publish throughput against the in-process broker: QoS 0/1, batched vs. one at a time."""
+    import asyncio
+    from backend.plugins.mqtt_client import MQTTClient
+    from mqtt_test_broker import LocalBroker
+
+    async def run():
+        broker = LocalBroker()
+        await broker.start()
+        client = MQTTClient("127.0.0.1", broker.port, client_id="bench")
+        await client.connect()
+        payload = b'{"state": "on", "brightness": 80}'
+
+        count = 50_000
+        for qos in (0, 1):
+            messages = [(f"home/lights/lamp{i % 100}/command", payload) for i in range(count)]
+            start = time.perf_counter()
+            await client.publish_many(messages, qos=qos)
+            elapsed = time.perf_counter() - start
+            print(f"  QoS {qos} batched: {count / elapsed:,.0f} msg/s")
+
+        single = 2_000
+        start = time.perf_counter()
+        for i in range(single):
+            await client.publish(f"home/lights/lamp{i % 100}/command", payload, qos=1)
+        elapsed = time.perf_counter() - start
+        print(f"  QoS 1 one at a time: {single / elapsed:,.0f} msg/s")
+
+        received = []
+        listener = MQTTClient("127.0.0.1", broker.port, client_id="listener")
+        await listener.connect()
+        await listener.subscribe("home/+/+/state", lambda topic, data: received.append(topic), qos=0)
+        start = time.perf_counter()
+        await client.publish_many([(f"home/sensors/s{i % 50}/state", payload) for i in range(count)], qos=0)
+        while len(received) < count and time.perf_counter() - start < 30:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        print(f"  End-to-end fan-out to subscriber: {len(received) / elapsed:,.0f} msg/s")
+
+        await listener.disconnect()
+        await client.disconnect()
+        await broker.stop()
+
+    asyncio.run(run())
+
+def bench_telemetry():
+    """Telemetry ingest rate and chart queries: rollup tiers vs. a scan over raw samples."""
+    import numpy as np
+    from backend.plugins.timeseries import TimeSeriesStore
+
+    store = TimeSeriesStore(raw_retention=7 * 86400)
+    count = 7 * 86400  # One week of 1 Hz thermostat readings
+    base = time.time() - count
+    readings = (20 + 2 * np.sin(np.arange(count) / 3600) + np.random.normal(0, 0.1, count)).tolist()
+    start = time.perf_counter()
+    for i, value in enumerate(readings):
+        store.append("thermostat.temperature", value, base + i)
+    elapsed = time.perf_counter() - start
+    info = store.list_series()[0]
+    print(f"  Ingest: {count / elapsed:,.0f} samples/s, {info['bytes'] / count:.1f} bytes/sample")
+
+    for label, span in (("1 hour", 3600), ("1 day", 86400), ("1 week", count)):
+        result, seconds = timed(lambda: store.query("thermostat.temperature", base + count - span, base + count), repeat=20)
+        raw, raw_seconds = timed(lambda: store.query("thermostat.temperature", base + count - span, base + count, resolution="raw"), repeat=3)
+        print(f"  {label}: {result['points']} points from {result['resolution']} in {seconds * 1000:.2f}ms "
+              f"(raw scan of {raw['points']:,} samples: {raw_seconds * 1000:.1f}ms)")
+
+def bench_processes():
+    """Process table refresh: cached Process objects + oneshot() vs. re-creating every process per tick."""
+    import psutil
+    from backend.modules.process_table import ProcessTable
+
+    def fresh_scan():
+        rows = []
+        for pid in psutil.pids():
+            try:
+                process = psutil.Process(pid)
+                rows.append((pid, process.name(), process.cpu_percent(None), process.memory_info().rss, process.num_threads()))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        return rows
+
+    table = ProcessTable()
+    table.refresh()
+    summary, cached = timed(table.refresh, repeat=20)
+    _, fresh = timed(fresh_scan, repeat=20)
+    print(f"  {summary['count']} processes: cached refresh {cached * 1000:.2f}ms vs. fresh scan {fresh * 1000:.2f}ms per tick")
+
+def bench_portscan():
+    """
+    TCP connect scan throughput over 127.0.0.0/26 x 100 ports at increasing concurrency.
+    Loopback refuses instantly, so this measures per-probe overhead; on a LAN the
+    concurrency window is what hides the round-trip time.
+    """
+    import asyncio
+    from backend.modules.port_scanner import PortScanner
+
+    async def scan(concurrency):
+        stats = {}
+        scanner = PortScanner(concurrency=concurrency, timeout=0.5)
+        async for _ in scanner.scan_iter("127.0.0.0/26", "20000-20099", grab_banners=False, resolve_names=False, stats=stats):
+            pass
+        return stats
+
+    for concurrency in (1, 16, 64, 256):
+        stats = asyncio.run(scan(concurrency))
+        print(f"  concurrency {concurrency:>4}: {stats['hosts']} hosts x {stats['ports']} ports in {stats['seconds']:.2f}s "
+              f"= {stats['probes_per_second']:,.0f} host-ports/s")
+
+def bench_bandwidth():
+    """Per-process bandwidth tick: /proc/net with cached inode owners vs. psutil's full connection scan."""
+    import psutil
+    from backend.modules.bandwidth import BandwidthAccountant
+
+    proc = BandwidthAccountant(use_proc=True)
+    proc.sample()
+    _, proc_tick = timed(proc.sample, repeat=50)
+    fallback = BandwidthAccountant(use_proc=False)
+    fallback.sample()
+    _, psutil_tick = timed(fallback.sample, repeat=50)
+    _, scan = timed(lambda: psutil.net_connections(kind="inet"), repeat=50)
+    print(f"  /proc tick {proc_tick * 1000:.2f}ms ({proc.stats['owner_scans']} owner scan(s) in {proc.stats['samples']} ticks)"
+          f" vs. psutil tick {psutil_tick * 1000:.2f}ms (net_connections alone {scan * 1000:.2f}ms)")
+
+def bench_entropy():
+    """Shannon entropy: 256 data.count() passes vs. one bincount, per block and batched over 1,000 blocks."""
+    import math
+    import os
+    from backend.security.security_core import SecurityMetrics
+
+    def count_entropy(data):
+        entropy = 0
+        for x in range(256):
+            p_x = float(data.count(bytes([x]))) / len(data)
+            if p_x > 0:
+                entropy += - p_x * math.log2(p_x)
+        return entropy
+
+    scoring = SecurityMetrics()
+    blocks = [os.urandom(4096) for _ in range(1000)]
+    _, before = timed(lambda: [count_entropy(block) for block in blocks])
+    _, single = timed(lambda: [scoring.calculate_entropy(block) for block in blocks])
+    _, batch = timed(lambda: scoring.calculate_entropy_batch(blocks), repeat=5)
+    print(f"  1,000 x 4 KB blocks: count() loop {before * 1000:.1f}ms, bincount per block {single * 1000:.1f}ms, "
+          f"batched {batch * 1000:.1f}ms ({before / batch:.0f}x)")
+
+def bench_security_queue():
+    """Watchdog thread time for a write burst: scoring inline (old handler) vs. enqueue + worker pool."""
+    import logging
+    import os
+    import tempfile
+    import time
+    from datetime import datetime
+    from pathlib import Path
+    from watchdog.events import FileModifiedEvent
+    from backend.security.security_core import SecurityMetrics, SecurityEventHandler
+
+    logging.getLogger("Kalpana.SecurityCore").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i in range(500):
+            path = Path(folder) / f"doc{i}.txt"
+            path.write_bytes(os.urandom(64 * 1024))
+            paths.append(str(path))
+        events = [FileModifiedEvent(path) for path in paths for _ in range(4)]  # Each file written 4 times
+
+        inline = SecurityEventHandler(SecurityMetrics())
+        started = time.perf_counter()
+        for event in events:
+            inline.process_batch([{"key": event.src_path, "payload": datetime.now(), "events": 1}])
+        inline_seconds = time.perf_counter() - started
+
+        queued = SecurityEventHandler(SecurityMetrics(), workers=4, debounce=0.05)
+        queued.queue.start()
+        started = time.perf_counter()
+        for event in events:
+            queued.on_modified(event)
+        enqueue_seconds = time.perf_counter() - started
+        queued.queue.flush(timeout=60)
+        drained_seconds = time.perf_counter() - started
+        stats = queued.queue.get_stats()
+        queued.queue.stop()
+    print(f"  {len(events)} events on {len(paths)} files: inline {inline_seconds * 1000:.0f}ms on the watchdog thread; "
+          f"queued {enqueue_seconds * 1000:.1f}ms to enqueue, all scored after {drained_seconds * 1000:.0f}ms "
+          f"({stats['processed']} files, max lag {stats['max_lag_ms']:.0f}ms)")
+
+def bench_rate_window():
+    """Recording a file event and scoring: timestamp list rebuilt per event vs. per-second bucket counters."""
+    import time
+    from datetime import datetime, timedelta
+    from pathlib import Path
+    from backend.security.security_core import SecurityMetrics
+
+    events = 2000
+    paths = [Path(f"/data/project{i % 50}/file{i}.txt") for i in range(events)]
+
+    def timestamp_list():
+        modified = []
+        for _ in range(events):
+            modified.append(datetime.now())
+            cutoff = datetime.now() - timedelta(minutes=1)
+            modified = [t for t in modified if t > cutoff]
+            len([t for t in modified if datetime.now() - t < timedelta(seconds=5)])
+
+    def bucket_counters():
+        scoring = SecurityMetrics()
+        for path in paths:
+            scoring.record_modification(path)
+            scoring.update_threat_score()
+
+    _, before = timed(timestamp_list)
+    _, after = timed(bucket_counters)
+    print(f"  {events:,} events within one minute: list rebuild {before:.2f}s ({before / events * 1e6:.0f}us/event) "
+          f"vs. counters {after:.3f}s ({after / events * 1e6:.1f}us/event)")
+
+SECTIONS = {
+    "calendar": bench_calendar,
+    "email": bench_email,
+    "mail_import": bench_mail_import,
+    "mqtt": bench_mqtt,
+    "telemetry": bench_telemetry,
+    "processes": bench_processes,
+    "portscan": bench_portscan,
+    "bandwidth": bench_bandwidth,
+    "entropy": bench_entropy,
+    "security_queue": bench_security_queue,
+    "rate_window": bench_rate_window,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(SECTIONS)
+    print("=" * 80)
+    print("KALPANA PERFORMANCE BENCHMARKS")
+    print("=" * 80)
+    for name in selected:
+        print(f"\n⏱️  {name.upper()}")
+        print("-" * 80)
+        SECTIONS[name]()
+    print()
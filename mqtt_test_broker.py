@@ -0,0 +1,101 @@
+"""
+Kalpana AGI - Local MQTT Broker Stand-in
+Purpose: In-process MQTT 3.1.1 broker (QoS 0/1, retained messages) used by
+         test_all_features.py and benchmark_features.py. Not part of the application.
+Dependencies: asyncio
+"""
+
+import asyncio
+import struct
+from typing import Any, Dict, Optional, Tuple
+from backend.plugins.mqtt_client import (
+    CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT,
+    _packet, decode_publish, encode_publish, read_packet, topic_matches
+)
+
+class LocalBroker:
+    """In-process MQTT 3.1.1 broker stand-in (QoS 0/1, retained messages) for tests and benchmarks."""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sessions: Dict[asyncio.StreamWriter, Dict[str, Any]] = {}
+        self._handlers: set = set()
+        self._retained: Dict[str, Tuple[bytes, int]] = {}
+        self.stats = {"received": 0, "delivered": 0}
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+    
+    def _deliver(self, session: Dict[str, Any], topic: str, payload: bytes, qos: int, retain: bool = False):
+        packet_id = None
+        if qos:
+            session["next_id"] = session["next_id"] % 65535 + 1
+            packet_id = session["next_id"]
+        session["writer"].write(encode_publish(topic, payload, qos, retain, packet_id))
+        self.stats["delivered"] += 1
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = {"writer": writer, "subscriptions": {}, "next_id": 0}
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            packet_type, _, _ = await read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+            self._sessions[writer] = session
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == PUBLISH:
+                    topic, payload, qos, packet_id, retain = decode_publish(flags, body)
+                    self.stats["received"] += 1
+                    if qos:
+                        writer.write(_packet(PUBACK, 0, struct.pack("!H", packet_id)))
+                    if retain:
+                        if payload:
+                            self._retained[topic] = (payload, qos)
+                        else:
+                            self._retained.pop(topic, None)
+                    for other in list(self._sessions.values()):
+                        granted = [q for f, q in other["subscriptions"].items() if topic_matches(f, topic)]
+                        if granted:
+                            self._deliver(other, topic, payload, min(qos, max(granted)))
+                elif packet_type == SUBSCRIBE:
+                    (packet_id,) = struct.unpack_from("!H", body)
+                    offset, codes, new_filters = 2, [], []
+                    while offset < len(body):
+                        (length,) = struct.unpack_from("!H", body, offset)
+                        topic_filter = body[offset + 2:offset + 2 + length].decode("utf-8")
+                        qos = min(body[offset + 2 + length], 1)
+                        offset += 3 + length
+                        session["subscriptions"][topic_filter] = qos
+                        codes.append(qos)
+                        new_filters.append((topic_filter, qos))
+                    writer.write(_packet(SUBACK, 0, struct.pack("!H", packet_id) + bytes(codes)))
+                    for topic, (payload, retained_qos) in self._retained.items():
+                        for topic_filter, qos in new_filters:
+                            if topic_matches(topic_filter, topic):
+                                self._deliver(session, topic, payload, min(qos, retained_qos), retain=True)
+                                break
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            self._sessions.pop(writer, None)
+            writer.close()
@@ -6,6 +6,7 @@ Purpose: Test all implemented Jarvis-like features
 import sys
 import os
 import asyncio
+import tempfile
 from datetime import datetime, timedelta
 
 # Add backend to path
@@ -101,6 +102,63 @@ try:
     # Get upcoming events
     events = calendar_manager.get_upcoming_events(max_results=5)
     print(f"  Upcoming events: {len(events)}")
+    
+    # Overlap and free/busy queries through the interval index
+    clash = calendar_manager.get_conflicts(start + timedelta(minutes=30), end + timedelta(minutes=30))
+    print(f"  Conflicts with a shifted meeting: {len(clash)}")
+    assert any(e['id'] == result['event_id'] for e in clash)
+    free_busy = calendar_manager.get_free_busy(start - timedelta(hours=2), end + timedelta(hours=2))
+    print(f"  Busy blocks: {len(free_busy['busy'])}, free gaps: {len(free_busy['free'])}")
+    slots = calendar_manager.find_free_slots(start - timedelta(hours=2), end + timedelta(hours=2), duration_minutes=60)
+    print(f"  First free hour: {slots[0]['start'] if slots else 'none'}")
+    
+    # Recurring events expand lazily; ICS round-trip into a scratch calendar
+    import json
+    from backend.plugins.calendar import CalendarManager
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = CalendarManager(events_file=os.path.join(tmp, "events.json"))
+        standup = start.replace(hour=9, minute=0, second=0, microsecond=0)
+        scratch.create_event("Stand-up", standup, standup + timedelta(minutes=15), rrule="weekdays")
+        week = scratch.get_events_between(standup, standup + timedelta(days=7))
+        print(f"  Stand-up occurrences this week: {len(week)}")
+        scratch.delete_event(week[0]['id'])
+        master_id = week[0]['master_id']
+        assert scratch.delete_event(f"{master_id}@garbage")['status'] == "error"
+        assert scratch.delete_event(f"{master_id}@{(standup + timedelta(minutes=7)).isoformat()}")['status'] == "error"
+        assert len(scratch._by_id[master_id]['exdates']) == 1
+        
+        # An event that cannot be indexed is skipped on load instead of failing the whole calendar
+        bad_path = os.path.join(tmp, "bad.json")
+        with open(bad_path, 'w') as f:
+            json.dump([{"id": "event_1", "summary": "Bad", "start_time": "soon", "end_time": "later"},
+                       {"id": "event_2", "summary": "Good", "start_time": standup.isoformat(), "end_time": standup.isoformat()}], f)
+        assert list(CalendarManager(events_file=bad_path)._by_id) == ["event_2"]
+        
+        # Escaped text survives export -> import
+        from backend.plugins.ics import _escape, _unescape
+        tricky = "C:\\new\\folder; a, b\nline two"
+        assert _unescape(_escape(tricky)) == tricky
+        ics_path = os.path.join(tmp, "export.ics")
+        print(f"  Exported: {scratch.export_ics(ics_path)['exported']} event(s)")
+        copy = CalendarManager(events_file=os.path.join(tmp, "copy.json"))
+        print(f"  Imported: {copy.import_ics(ics_path)['imported']}, re-import skipped: {copy.import_ics(ics_path)['skipped']}")
+        assert len(copy.get_events_between(standup, standup + timedelta(days=7))) == len(week) - 1
+        
+        # A series that has ended is not expanded when listing upcoming events
+        scratch.create_event("Old course", standup - timedelta(days=60), standup - timedelta(days=60, hours=-1), rrule="FREQ=DAILY;COUNT=5")
+        live = list(scratch._series_index.overlapping(datetime.now().timestamp(), float('inf')))
+        print(f"  Series live now: {len(live)} of {len(scratch._series)}")
+        assert len(live) == 1
+        
+        # A file that fails part-way adds nothing
+        broken_path = os.path.join(tmp, "broken.ics")
+        with open(broken_path, 'w') as f:
+            f.write("BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:ok-1\nSUMMARY:Fine\nDTSTART:20260301T090000\nDTEND:20260301T100000\nEND:VEVENT\n"
+                    "BEGIN:VEVENT\nUID:bad-1\nSUMMARY:Broken\nDTSTART:2026-13-45\nEND:VEVENT\nEND:VCALENDAR\n")
+        before = len(copy.events)
+        broken = copy.import_ics(broken_path)
+        print(f"  Broken import: {broken['status']}, events added: {len(copy.events) - before}")
+        assert broken['status'] == "error" and len(copy.events) == before and "ok-1" not in copy._by_uid
     print("✅ Calendar: PASSED\n")
 except Exception as e:
     print(f"❌ Calendar: FAILED - {e}\n")
@@ -122,6 +180,32 @@ try:
     # Read emails
     emails = email_manager.read_emails(max_count=5)
     print(f"  Emails in storage: {len(emails)}")
+    
+    # Cursor pagination and full-text search on a scratch store
+    from backend.plugins.email import EmailManager
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = EmailManager(db_path=os.path.join(tmp, "emails.db"))
+        for i in range(25):
+            scratch.send_email("team@example.com", f"Status report {i}", "Quarterly numbers attached" if i % 5 == 0 else "Nothing new")
+        first = scratch.list_emails(limit=10)
+        second = scratch.list_emails(limit=10, cursor=first['next_cursor'])
+        print(f"  Pages: {len(first['emails'])} + {len(second['emails'])}, newest: {first['emails'][0]['subject']}")
+        assert not {e['id'] for e in first['emails']} & {e['id'] for e in second['emails']}
+        found = scratch.search_emails("quarterly")
+        print(f"  Search 'quarterly': {len(found['emails'])} matches")
+        assert len(found['emails']) == 5
+        
+        # Streaming mbox import resumes from its checkpoint
+        mbox_path = os.path.join(tmp, "inbox.mbox")
+        with open(mbox_path, 'w') as f:
+            for i in range(3):
+                f.write(f"From sender@example.com Mon Oct 19 10:00:00 2026\nFrom: sender@example.com\n"
+                        f"Subject: Imported {i}\nDate: Mon, 19 Oct 2026 10:0{i}:00 +0000\n\nHello {i}\n\n")
+        first_import = scratch.import_mailbox(mbox_path)
+        second_import = scratch.import_mailbox(mbox_path)
+        print(f"  mbox import: {first_import['imported']} new, then {second_import['imported']} on re-import")
+        assert (first_import['imported'], second_import['imported']) == (3, 0)
+        scratch.store.conn.close()
     print("✅ Email: PASSED\n")
 except Exception as e:
     print(f"❌ Email: FAILED - {e}\n")
@@ -141,9 +225,68 @@ try:
     )
     print(f"  Add reminder result: {result.get('status')}")
     
+    # Recurring reminder; only its next occurrence is scheduled
+    result = reminder_manager.add_reminder(
+        "Stand-up meeting",
+        trigger_time,
+        rule="FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=6"
+    )
+    print(f"  Recurring reminder: {result['reminder']['rule']} (next: {result['reminder']['trigger_time']})")
+    print(f"  Next reminder due in: {reminder_manager.seconds_until_next():.0f}s")
+    
+    # Rule edge cases: ordinal BYDAY is refused, a date-only UNTIL covers its whole day
+    from backend.plugins.recurrence import RecurrenceRule
+    try:
+        RecurrenceRule.parse("FREQ=WEEKLY;BYDAY=-1FR")
+        raise AssertionError("Ordinal BYDAY should be rejected")
+    except ValueError:
+        pass
+    evening = datetime(2026, 3, 2, 18, 0)
+    until_rule = RecurrenceRule.parse("FREQ=DAILY;UNTIL=20260304")
+    occurrences = list(until_rule.occurrences(evening))
+    print(f"  Date-only UNTIL occurrences: {len(occurrences)} (last {occurrences[-1]:%a %H:%M})")
+    assert occurrences[-1] == datetime(2026, 3, 4, 18, 0)
+    
     # Get active reminders
     active = reminder_manager.get_active_reminders()
     print(f"  Active reminders: {len(active)}")
+    
+    # Heap scheduling on a scratch manager: only due entries fire, deleted ones never do
+    from backend.plugins.reminders import ReminderManager
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = ReminderManager()
+        scratch.reminders_file = os.path.join(tmp, "reminders.json")
+        scratch.reminders = []
+        scratch._rebuild_schedule()
+        past = datetime.now() - timedelta(minutes=1)
+        due = scratch.add_reminder("Due now", past)['reminder']
+        cancelled = scratch.add_reminder("Cancelled", past)['reminder']
+        daily = scratch.add_reminder("Daily", past, rule="FREQ=DAILY")['reminder']
+        scratch.add_reminder("Later", datetime.now() + timedelta(hours=1))
+        scratch.delete_reminder(cancelled['id'])
+        replacement = scratch.add_reminder("Replacement", datetime.now() + timedelta(hours=2))['reminder']
+        fired = scratch.check_due_reminders()
+        print(f"  Fired: {[r['message'] for r in fired]}, next due in {scratch.seconds_until_next():.0f}s")
+        assert {r['id'] for r in fired} == {due['id'], daily['id']}
+        assert replacement['id'] not in (due['id'], cancelled['id'], daily['id'])
+        assert datetime.fromisoformat(scratch._by_id[daily['id']]['trigger_time']) > datetime.now()
+        assert scratch.check_due_reminders() == []
+        
+        # Corrupt entries in the file are skipped instead of failing the load
+        import json
+        later = (datetime.now() + timedelta(hours=1)).isoformat()
+        with open(scratch.reminders_file, 'w') as f:
+            json.dump([
+                {"id": 1, "message": "Bad time", "trigger_time": "soon", "active": True},
+                {"id": 2, "message": "Bad rule", "trigger_time": later, "active": True, "recurring": True, "rule": "FREQ=FORTNIGHTLY"},
+                {"message": "No id", "trigger_time": later, "active": True},
+                {"id": 3, "message": "Good", "trigger_time": later, "active": True},
+            ], f)
+        scratch.load_reminders()
+        print(f"  Corrupt file loaded: {sorted(scratch._scheduled)} scheduled")
+        assert sorted(scratch._scheduled) == [2, 3]
+        assert not scratch._by_id[2]['recurring']
+        assert scratch.add_reminder("After load", datetime.now())['reminder']['id'] == 4
     print("✅ Reminders: PASSED\n")
 except Exception as e:
     print(f"❌ Reminders: FAILED - {e}\n")
@@ -157,6 +300,132 @@ try:
     if mqtt_bridge.connected:
         result = mqtt_bridge.control_light("test_light", "on")
         print(f"  MQTT publish result: {result.get('status')}")
+        
+        # Real protocol round-trip against the in-process broker stand-in
+        from backend.plugins.home_automation import SmartHomeBridge
+        from backend.plugins.mqtt_client import MQTTClient
+        from mqtt_test_broker import LocalBroker
+        
+        async def mqtt_round_trip():
+            broker = LocalBroker()
+            await broker.start()
+            bridge = SmartHomeBridge(host="127.0.0.1", port=broker.port)
+            await bridge.start()
+            lights = MQTTClient("127.0.0.1", broker.port, client_id="lights")
+            await lights.connect()
+            
+            async def echo_state(topic, payload):
+                await lights.publish(topic.replace("/command", "/state"), payload, qos=1)
+            
+            await lights.subscribe("home/lights/+/command", echo_state)
+            scene = bridge.set_scene({f"lamp{i}": "off" for i in range(12)})
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if len(bridge.devices) == 12:
+                    break
+            await lights.disconnect()
+            await bridge.stop()
+            await broker.stop()
+            return scene, bridge.devices
+        
+        scene, devices = asyncio.run(mqtt_round_trip())
+        print(f"  Scene batch: {scene['published']} commands, state reports received: {len(devices)}")
+        assert len(devices) == 12 and devices["lamp0"] == {"state": "off"}
+        
+        # A broker that accepts the connection but never answers: PUBACK timeouts must free
+        # their packet ids, and unanswered PINGREQs must force a reconnect
+        from backend.plugins.mqtt_client import read_packet, _packet, CONNACK
+        
+        async def silent_broker():
+            async def handle(reader, writer):
+                await read_packet(reader)
+                writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+                try:
+                    while await reader.read(4096):
+                        pass
+                except ConnectionError:
+                    pass
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            client = MQTTClient("127.0.0.1", server.sockets[0].getsockname()[1], keepalive=1, ack_timeout=0.3)
+            await client.connect()
+            try:
+                await client.publish_many([("home/x", "1")] * 5, qos=1)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            leaked = len(client._inflight)
+            for _ in range(40):
+                await asyncio.sleep(0.1)
+                if client.stats["reconnects"]:
+                    break
+            await client.disconnect()
+            server.close()
+            return timed_out, leaked, client.stats
+        
+        timed_out, leaked, silent_stats = asyncio.run(silent_broker())
+        print(f"  Silent broker: PUBACK timeout={timed_out}, leaked ids={leaked}, "
+              f"ping timeouts={silent_stats['ping_timeouts']}, reconnects={silent_stats['reconnects']}")
+        assert timed_out and leaked == 0 and silent_stats["ping_timeouts"] >= 1 and silent_stats["reconnects"] >= 1
+        
+        # A malformed packet from the broker goes through the reconnect path instead of killing the supervisor
+        async def garbled_broker():
+            async def handle(reader, writer):
+                await read_packet(reader)
+                writer.write(_packet(CONNACK, 0, b"\x00\x00") + _packet(3, 0, b"\x00\x02\xff\xfepayload"))
+                try:
+                    while await reader.read(4096):
+                        pass
+                except ConnectionError:
+                    pass
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            client = MQTTClient("127.0.0.1", server.sockets[0].getsockname()[1], keepalive=30, reconnect_delay=0.05)
+            await client.connect()
+            for _ in range(40):
+                await asyncio.sleep(0.05)
+                if client.stats["reconnects"] >= 2:
+                    break
+            await client.disconnect()
+            server.close()
+            return client.stats
+        
+        garbled_stats = asyncio.run(garbled_broker())
+        print(f"  Garbled broker: protocol errors={garbled_stats['protocol_errors']}, reconnects={garbled_stats['reconnects']}")
+        assert garbled_stats["protocol_errors"] >= 2 and garbled_stats["reconnects"] >= 2
+        
+        # Bounded message log, wildcard queries and change-only diffs
+        from backend.plugins.device_state import MessageLog
+        log = MessageLog(capacity=5)
+        for i in range(20):
+            log.append(f"home/sensors/s{i % 3}/state", str(i))
+        assert len(log) == 5 and log.tail(10)[-1]['payload'] == "19"
+        assert [m['payload'] for m in log.tail(10, "home/sensors/s1/#")] == ["16", "19"]
+        for i in range(1000):
+            log.append(f"home/unique/{i}", "x")  # Topics leave the intern tables with their last entry
+        assert log.topic_count == 5 and len(log._topics) <= 6 and log.tail(1, "home/sensors/#") == []
+        assert [m['topic'] for m in log.tail(2)] == ["home/unique/998", "home/unique/999"]
+        bridge = SmartHomeBridge()
+        diffs = []
+        bridge.state.subscribe(diffs.append)
+        bridge.control_light("kitchen", "on")
+        bridge.control_light("kitchen", "on")
+        bridge.control_thermostat(21)
+        print(f"  Device diffs: {len(diffs)} for 3 commands, kitchen lights: {bridge.find_devices('home/lights/kitchen/#')}")
+        assert len(diffs) == 2 and diffs[0]['changes'] == {"state": "on"}
+        assert len(bridge.get_message_log(10, "home/lights/#")) == 2
+        
+        # Telemetry history: rollups answer long ranges with few points
+        from backend.plugins.timeseries import TimeSeriesStore
+        telemetry = TimeSeriesStore(chunk_size=256)
+        base = 1_700_000_000
+        for i in range(7200):
+            telemetry.record("meter", {"power": 100 + i % 60, "mode": "eco"}, timestamp=base + i)
+        hourly = telemetry.query("meter.power", base, base + 7200, max_points=10)
+        minutes = telemetry.query("meter.power", base, base + 600)
+        raw = telemetry.query("meter.power", base + 7100, base + 7200, resolution="raw")
+        print(f"  Telemetry: {hourly['points']} x {hourly['resolution']}, {minutes['points']} x {minutes['resolution']}, {raw['points']} raw")
+        assert hourly['resolution'] == "1h" and hourly['avg'] == [129.5, 129.5]
+        assert minutes['resolution'] == "1m" and minutes['points'] == 10 and raw['points'] == 100
+        assert bridge.get_telemetry("thermostat.temperature")['value'] == [21.0]
         print("✅ MQTT: PASSED\n")
     else:
         print("  ⚠️  MQTT not connected (broker not configured)")
@@ -189,6 +458,35 @@ try:
         result = plugin_loader.execute_plugin("jokes", "tell_joke")
         print(f"  Jokes test: {result.get('message', 'N/A')[:60]}")
     
+    # Test command registry and batch dispatch
+    commands = plugin_loader.list_commands()
+    print(f"  Registered commands: {sum(len(c) for c in commands.values())}")
+    batch = plugin_loader.execute_batch([
+        {"plugin": "jokes", "command": "tell_joke"},
+        {"plugin": "weather", "command": "get_weather", "args": {"location": "Paris"}},
+        {"plugin": "weather", "command": "get_weather", "args": {"city": "Paris"}}
+    ])
+    print(f"  Batch results: {[r.get('status') for r in batch]}")
+    assert batch[2]["status"] == "error", "Unknown arguments should be rejected"
+    # Argument names that clash with dispatch parameters fail per call, not for the whole batch
+    clashing = plugin_loader.execute_batch([
+        {"plugin": "weather", "command": "get_weather", "args": {"command": "x", "plugin_name": "y"}},
+        {"plugin": ["weather"], "command": "get_weather"},
+        {"plugin": "jokes", "command": "tell_joke"}
+    ])
+    assert [r["status"] for r in clashing] == ["error", "error", "success"]
+    
+    # Support modules in the plugins directory (stores, caches, clients) are not loaded as plugins
+    assert {p["name"] for p in plugins} == {"weather", "jokes"}
+    
+    # Brain runs a plugin call found in the model's reply and passes plain answers through
+    import asyncio
+    from backend.kalpana_core.brain import brain
+    routed = asyncio.run(brain._route_to_plugin('<think>user wants weather</think>\n{"plugin": "weather", "command": "get_weather", "args": {"location": "Oslo"}}'))
+    print(f"  Brain routed reply: {routed[:60]}")
+    assert "Oslo" in routed and "weather.get_weather" in brain._plugin_prompt()
+    assert asyncio.run(brain._route_to_plugin("It is sunny today.")) is None
+    
     print("✅ Plugin System: PASSED\n")
 except Exception as e:
     print(f"❌ Plugin System: FAILED - {e}\n")
@@ -245,6 +543,586 @@ try:
 except Exception as e:
     print(f"❌ User Profile DB: FAILED - {e}\n")
 
+# Test 11: Plugin Result Cache
+print("🗄️  TEST 11: Plugin Result Cache (stub weather server)")
+print("-" * 80)
+try:
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+    from backend.plugins.weather_plugin import WeatherPlugin
+    from backend.plugins.cache import CommandCache
+    
+    upstream_calls = []
+    
+    class StubWeatherHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            city = parse_qs(urlparse(self.path).query)["q"][0]
+            upstream_calls.append(city)
+            if city == "Atlantis":
+                self.send_response(404)
+                body = {"message": "city not found"}
+            else:
+                self.send_response(200)
+                body = {"main": {"temp": 60 + len(upstream_calls)}, "weather": [{"description": "stub skies"}]}
+            payload = json.dumps(body).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    cache = CommandCache(max_entries=2)
+    weather = WeatherPlugin()
+    weather.api_key = "stub"
+    weather.api_url = f"http://127.0.0.1:{server.server_port}/weather"
+    
+    def lookup(location, ttl):
+        key = ("weather", location.casefold())
+        return cache.get_or_compute(key, lambda: weather.get_weather.__wrapped__(weather, location), ttl=ttl, stale_ttl=5, negative_ttl=5)
+    
+    first = lookup("Paris", ttl=0.2)
+    second = lookup("paris", ttl=0.2)
+    print(f"  Fresh hit served from cache: {first == second} (upstream calls: {len(upstream_calls)})")
+    assert len(upstream_calls) == 1
+    
+    time.sleep(0.3)
+    stale = lookup("Paris", ttl=0.2)
+    time.sleep(0.2)
+    print(f"  Stale value served while refreshing: {stale == first}, refreshes: {cache.get_stats()['refreshes']}")
+    assert stale == first and len(upstream_calls) == 2
+    
+    lookup("Atlantis", ttl=0.2)
+    lookup("Atlantis", ttl=0.2)
+    print(f"  Negative cache hits: {cache.get_stats()['negative_hits']}")
+    assert upstream_calls.count("Atlantis") == 1
+    
+    lookup("Rome", ttl=5)
+    before = len(upstream_calls)
+    weather.get_weather(location="Berlin")
+    weather.get_weather(location="  berlin ")
+    print(f"  Decorated command upstream calls for 2 lookups: {len(upstream_calls) - before}")
+    assert len(upstream_calls) - before == 1
+    print(f"  LRU evictions: {cache.get_stats()['evictions']}")
+    server.shutdown()
+    weather.shutdown()
+    
+    # Strings keep their case unless the command opts in to casefolding
+    from backend.plugins.cache import cached, normalize_arg
+    assert normalize_arg(" Key ") == "Key" and normalize_arg(" Key ", casefold=True) == "key"
+    
+    # A background refresh runs on the instance the registry serves now, not the one that was hot-reloaded away
+    from backend.plugins.loader import PluginInterface, plugin_loader
+    probe_cache = CommandCache()
+    
+    class CacheProbe(PluginInterface):
+        def __init__(self, generation):
+            super().__init__()
+            self.name = "cache_probe"
+            self.generation = generation
+        
+        @cached(ttl=0.1, stale_ttl=5, cache=probe_cache)
+        def value(self, key: str = "a"):
+            return {"status": "success", "generation": self.generation}
+    
+    old_probe = CacheProbe(1)
+    plugin_loader.plugins["cache_probe"] = old_probe
+    assert old_probe.value()["generation"] == 1
+    plugin_loader.plugins["cache_probe"] = CacheProbe(2)
+    time.sleep(0.15)
+    assert old_probe.value()["generation"] == 1  # Stale value, refresh scheduled
+    time.sleep(0.1)
+    refreshed = old_probe.value()["generation"]
+    plugin_loader.plugins.pop("cache_probe")
+    print(f"  Refresh after reload ran on generation: {refreshed}")
+    assert refreshed == 2
+    print("✅ Plugin Cache: PASSED\n")
+except Exception as e:
+    print(f"❌ Plugin Cache: FAILED - {e}\n")
+
+# Test 12: Outbound Mail Queue
+print("📤 TEST 12: Email Outbox (local SMTP sink)")
+print("-" * 80)
+try:
+    import socketserver
+    from backend.plugins.outbox import Outbox
+    
+    delivered = []
+    flaky_attempts = []
+    
+    class SMTPSinkHandler(socketserver.StreamRequestHandler):
+        """Just enough SMTP to accept mail; bounce@ is refused, flaky@ fails once with 451."""
+        def reply(self, line):
+            self.wfile.write(line.encode() + b"\r\n")
+        
+        def handle(self):
+            self.reply("220 sink ESMTP")
+            recipient = None
+            for raw in self.rfile:
+                command = raw.decode().strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    self.reply("250 sink")
+                elif verb == "RCPT":
+                    recipient = command.split(":", 1)[1].strip(" <>")
+                    if recipient.startswith("bounce@"):
+                        self.reply("550 no such user")
+                    elif recipient.startswith("flaky@") and not flaky_attempts:
+                        flaky_attempts.append(recipient)
+                        self.reply("451 try again later")
+                    else:
+                        self.reply("250 ok")
+                elif verb == "DATA":
+                    self.reply("354 go ahead")
+                    for line in self.rfile:
+                        if line in (b".\r\n", b".\n"):
+                            break
+                    delivered.append(recipient)
+                    self.reply("250 queued")
+                elif verb == "QUIT":
+                    self.reply("221 bye")
+                    return
+                else:  # MAIL, RSET, NOOP
+                    self.reply("250 ok")
+    
+    sink = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPSinkHandler)
+    sink.daemon_threads = True
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(os.path.join(tmp, "emails.db"), host="127.0.0.1", port=sink.server_address[1],
+                        username="", starttls=False, pool_size=2, batch_size=10, base_delay=0.05)
+        for i in range(10):
+            outbox.enqueue(f"user{i}@example.com", f"Report {i}", "Queued from Kalpana")
+        outbox.enqueue("bounce@example.com", "Bounce", "Nobody home")
+        outbox.enqueue("flaky@example.com", "Retry", "Second time lucky")
+        try:
+            outbox.enqueue("user0@example.com", "Hi\nBcc: everyone@example.com", "Injected")
+            raise AssertionError("Header line breaks should be rejected")
+        except ValueError:
+            pass
+        # A row that cannot be built (queued before the check existed) fails on its own
+        with outbox.conn:
+            outbox.conn.execute("INSERT INTO outbox (recipient, subject, body, next_attempt, created_at) VALUES (?, ?, ?, ?, ?)",
+                                ("legacy@example.com", "Old\nrow", "", 0, "2026-01-01T00:00:00"))
+        
+        statuses = []
+        
+        async def collect(status):
+            statuses.append(status)
+        
+        async def drain():
+            worker = asyncio.create_task(outbox.run(collect))
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                if sum(s['status'] in ('sent', 'failed') for s in statuses) == 13:
+                    break
+            outbox.stop()
+            await worker
+        
+        asyncio.run(drain())
+        final = {s['to']: s['status'] for s in statuses if s['status'] != 'retrying'}
+        stats = outbox.get_stats()
+        print(f"  Delivered: {len(delivered)}, bounced: {final.get('bounce@example.com')}, flaky after retry: {final.get('flaky@example.com')}")
+        print(f"  SMTP connections opened: {stats['connections_opened']}, reused: {stats['connections_reused']}")
+        assert len(delivered) == 11 and final['bounce@example.com'] == 'failed' and final['flaky@example.com'] == 'sent'
+        assert final['legacy@example.com'] == 'failed' and stats['queue'].get('sending', 0) == 0
+        assert stats['connections_opened'] <= 2
+        outbox.conn.close()
+    sink.shutdown()
+    print("✅ Email Outbox: PASSED\n")
+except Exception as e:
+    print(f"❌ Email Outbox: FAILED - {e}\n")
+
+# Test 13: System Monitor Sampler
+print("🖥️  TEST 13: System Monitor (background sampler)")
+print("-" * 80)
+try:
+    import time
+    from backend.modules.system_monitor import SystemMonitor
+    
+    monitor = SystemMonitor(sample_interval=0.05)
+    assert monitor.get_stats() == {} and monitor.get_probe_timings()['samples'] == 0  # Never samples on the caller
+    monitor.start_sampler()
+    time.sleep(0.5)
+    started = time.perf_counter()
+    stats = monitor.get_stats()
+    read_ms = (time.perf_counter() - started) * 1000
+    monitor.stop()
+    timings = monitor.get_probe_timings()
+    probes = timings['probes']
+    print(f"  Snapshot: cpu {stats['cpu']}%, ram {stats['ram']}%, read in {read_ms:.3f}ms after {timings['samples']} samples")
+    print("  Probe cost: " + ", ".join(f"{name} {p['avg_ms']:.2f}ms" for name, p in probes.items()))
+    assert timings['samples'] >= 5 and probes['cpu']['calls'] == timings['samples']
+    assert probes['battery']['calls'] == 1  # Slow probes keep their own, longer cadence
+    
+    # Ring-buffer history: constant memory, min/max/avg buckets
+    from backend.modules.metrics_history import MetricsHistory
+    history = MetricsHistory(["cpu", "core0", "core1"], capacity=600)
+    for i in range(1000):
+        history.append({"cpu": i % 60, "core0": 10, "core1": 30}, timestamp=1_700_000_000 + i)
+    minutes = history.query(["cpu"], window=120, resolution=60, end=1_700_001_000)
+    print(f"  History: {history.count} of 1000 samples kept ({history.nbytes} bytes), 2m window -> {minutes['points']} buckets")
+    assert history.count == 600 and minutes['series']['cpu']['max'] == [59.0, 59.0] and minutes['series']['cpu']['avg'] == [29.5, 29.5]
+    assert set(history.query(["cores"], window=10)['series']) == {"core0", "core1"}
+    assert monitor.get_history(["cpu", "cores"], window=60)['points'] == timings['samples']
+    
+    # Subscription rooms: deltas beyond thresholds only, sampling paused without subscribers
+    from backend.modules.stats_channels import StatsChannels
+    channels = StatsChannels()
+    room = channels.subscribe("client-1", ["cpu", "memory"], interval=2)[0]
+    channels.snapshot_for(room, {"cpu": 10.0, "cores": [10.0, 10.0]})
+    sent = channels.due({"cpu": 10.4, "cores": [10.0, 13.0], "ram": 50.0}, now=time.monotonic() + 3)
+    assert dict(sent)[room] == {"cores": [10.0, 13.0]}  # cpu moved less than its 1% threshold
+    assert channels.due({"cpu": 50.0}, now=time.monotonic() + 4) == []  # Not due yet at a 2s rate
+    idle = SystemMonitor(sample_interval=0.02, idle_interval=None)
+    idle.running = True
+    idle.start_sampler()
+    time.sleep(0.2)
+    paused_samples = idle.get_probe_timings()['samples']
+    idle.subscribe("client-1", ["network"], interval=1)
+    time.sleep(0.2)
+    resumed_samples = idle.get_probe_timings()['samples']
+    idle.stop()
+    rooms = channels.get_stats()['rooms']
+    print(f"  Channels: {len(rooms)} rooms, {rooms[0]['emits']} delta emit(s); idle sampler {paused_samples} -> {resumed_samples} samples after subscribe")
+    assert paused_samples == 1 and resumed_samples > 3
+    
+    # Process table: Process objects are cached across refreshes
+    import os
+    from backend.modules.process_table import ProcessTable
+    table = ProcessTable(top_n=5)
+    table.refresh()
+    created = table.stats['created']
+    sum(range(2_000_000))
+    summary = table.refresh()
+    mine = table.get_processes(limit=1000)['processes']
+    print(f"  Processes: {summary['count']} tracked, refresh {table.stats['last_ms']:.1f}ms, top cpu: {summary['top_cpu'][0]['name']}")
+    assert any(row['pid'] == os.getpid() and row['rss'] > 0 for row in mine)
+    assert table.stats['created'] - created <= 5 and len(summary['top_memory']) == 5
+    
+    # Anomaly detection: one warning and one recovery for a noisy spike, not one per sample
+    import numpy as np
+    from backend.modules.anomaly import AnomalyDetector
+    detector = AnomalyDetector(["cpu", "ram"])
+    rng = np.random.default_rng(7)
+    transitions = []
+    for i in range(600):
+        cpu = 90 + rng.normal(0, 5) if 300 <= i < 340 else 15 + rng.normal(0, 2)
+        transitions += detector.update(np.array([cpu, 40 + rng.normal(0, 0.3)]), timestamp=1_700_000_000 + i)
+    status = detector.get_status()
+    print(f"  Anomalies: {[t['message'] for t in transitions]}, {status['cpu_us_per_sample']}us CPU/sample")
+    assert [(t['metric'], t['state']) for t in transitions] == [("cpu", "start"), ("cpu", "end")]
+    assert status['active'] == []
+    print("✅ System Monitor: PASSED\n")
+except Exception as e:
+    print(f"❌ System Monitor: FAILED - {e}\n")
+
+# Test 14: OpenMetrics Exposition
+print("📊 TEST 14: OpenMetrics /metrics exposition")
+print("-" * 80)
+try:
+    import threading
+    from backend.modules.openmetrics import Registry, metrics
+    
+    registry = Registry(max_age=60)
+    events = registry.counter("kalpana_test_events", "Events by kind", ["kind"])
+    latency = registry.histogram("kalpana_test_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("kalpana_test_queue", "Queue depth", callback=lambda: 3)
+    
+    def record():
+        for _ in range(10_000):
+            events.inc("tick")
+            latency.observe(0.5)
+    
+    workers = [threading.Thread(target=record) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    text = registry.render()
+    assert registry.render() is text and registry.stats['cache_hits'] == 1  # Cached between scrapes
+    print(f"  Rendered {len(text.splitlines())} lines in {registry.stats['render_ms']:.3f}ms")
+    assert 'kalpana_test_events_total{kind="tick"} 40000' in text
+    assert 'kalpana_test_seconds_bucket{le="0.1"} 0' in text and 'kalpana_test_seconds_bucket{le="1"} 40000' in text
+    assert "kalpana_test_queue 3" in text and text.endswith("# EOF\n")
+    # Plugin commands run in Test 8 were timed by the loader
+    assert 'kalpana_plugin_command_seconds_count{plugin="weather"' in metrics.render()
+    print("✅ OpenMetrics: PASSED\n")
+except Exception as e:
+    print(f"❌ OpenMetrics: FAILED - {e}\n")
+
+# Test 15: Network Connection Tracking
+print("🌐 TEST 15: Network connection tracker")
+print("-" * 80)
+try:
+    import socket
+    from backend.modules.connection_tracker import ConnectionTracker
+    
+    tracker = ConnectionTracker()
+    deltas = []
+    tracker.subscribe(deltas.append)
+    tracker.refresh()  # Baseline: existing connections are not reported as opened
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    port = server.getsockname()[1]
+    client = socket.create_connection(("127.0.0.1", port))
+    accepted, _ = server.accept()
+    ours = lambda rows: [row for row in rows if row['local'].endswith(f":{port}") or row['remote'].endswith(f":{port}")]
+    opened = ours(tracker.refresh()['opened'])
+    page = tracker.query(port=port, status="ESTABLISHED", limit=1)
+    by_process = tracker.summarize("process", process="python")
+    client.close()
+    accepted.close()
+    server.close()
+    closed = ours(tracker.refresh()['closed'])
+    print(f"  Opened: {len(opened)}, closed: {len(closed)}, page 1 of {page['total']} established on :{port}")
+    assert len(opened) == 3 and len(closed) == 3 and len(deltas) >= 2  # Listener + both ends
+    assert page['total'] == 2 and len(page['connections']) == 1
+    assert by_process['groups'] and by_process['groups'][0]['connections'] >= 3
+    print("✅ Connection Tracker: PASSED\n")
+except Exception as e:
+    print(f"❌ Connection Tracker: FAILED - {e}\n")
+
+# Test 16: LAN Port Scanner
+print("📡 TEST 16: Port scanner")
+print("-" * 80)
+try:
+    import asyncio
+    import socket
+    from backend.modules.port_scanner import PortScanner, parse_ports, parse_targets
+    
+    assert parse_ports("22,80,8000-8002") == [22, 80, 8000, 8001, 8002]
+    assert len(parse_targets("127.0.0.0/30")) == 2
+    try:
+        parse_targets("10.0.0.0/8", max_hosts=4096)  # Rejected by size, without expanding 16M addresses
+        raise AssertionError("oversized range accepted")
+    except ValueError:
+        pass
+    try:
+        parse_targets("8.8.8.8")
+        raise AssertionError("public target accepted")
+    except ValueError:
+        pass
+    for bad_range in ("1-1000000000", "100-20", "0-10"):
+        try:
+            parse_ports(bad_range)  # Rejected before the range is expanded
+            raise AssertionError(f"port range {bad_range} accepted")
+        except ValueError:
+            pass
+    
+    async def scan_local():
+        async def greet(reader, writer):
+            writer.write(b"SSH-2.0-KalpanaTest\r\n")
+            await writer.drain()
+            writer.close()
+        banner_server = await asyncio.start_server(greet, "127.0.0.1", 0)
+        quiet_server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        open_ports = sorted(s.sockets[0].getsockname()[1] for s in (banner_server, quiet_server))
+        # A bound but unused port is refused: a "closed" probe
+        spare = socket.socket()
+        spare.bind(("127.0.0.1", 0))
+        closed_port = spare.getsockname()[1]
+        spare.close()
+        scanner = PortScanner(concurrency=8, banner_timeout=0.3)
+        ports = open_ports + [closed_port]
+        streamed, stats = [], {}
+        async for result in scanner.scan_iter(["127.0.0.1"], ports, resolve_names=False, stats=stats):
+            streamed.append(result)
+        again = await scanner.scan("127.0.0.1", ports)
+        banner_server.close()
+        quiet_server.close()
+        return open_ports, streamed, stats, again, scanner
+    
+    open_ports, streamed, stats, again, scanner = asyncio.run(scan_local())
+    banners = {result["port"]: result["banner"] for result in again["results"]}
+    print(f"  Open: {sorted(r['port'] for r in streamed)}, stats: {stats['open']} open / {stats['closed']} closed")
+    print(f"  Banners: {banners}, cache hits: {scanner.banner_cache.hits}")
+    assert sorted(result["port"] for result in streamed) == open_ports
+    assert stats["open"] == 2 and stats["closed"] == 1 and stats["done"] == 3
+    assert again["status"] == "success" and "SSH-2.0-KalpanaTest" in banners.values()
+    assert scanner.banner_cache.hits == 2  # Second scan reused both cached banners
+    print("✅ Port Scanner: PASSED\n")
+except Exception as e:
+    print(f"❌ Port Scanner: FAILED - {e}\n")
+
+# Test 17: Per-Process Bandwidth Estimate
+print("📶 TEST 17: Per-process bandwidth")
+print("-" * 80)
+try:
+    import os
+    import socket
+    import time
+    from backend.modules.bandwidth import BandwidthAccountant
+    
+    # A connected UDP socket needs no route or peer and has a non-loopback remote address
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.connect(("192.0.2.1", 9))
+    accountants = [BandwidthAccountant(use_proc=False)]
+    if os.path.exists("/proc/net/udp"):
+        accountants.append(BandwidthAccountant(use_proc=True))
+    for accountant in accountants:
+        owners = accountant._sockets_by_pid()
+        print(f"  {accountant.stats['source']}: this process owns {owners.get(os.getpid(), [0])[0]} active socket(s)")
+        assert owners.get(os.getpid(), [0])[0] >= 1
+    if accountant.use_proc:
+        accountant._sockets_by_pid()
+        assert accountant.stats["owner_scans"] == 1  # Known inodes are not looked up again
+        assert "010200C0" in accountant._loopback  # Cached per remote host, not per host:port
+    udp.close()
+    
+    # Shares of a known uplink rate follow the processes' queued bytes
+    accountant = BandwidthAccountant(history=3)
+    for _ in range(5):
+        accountant.samples.append({"time": time.time(), "interval": 2.0, "sent_rate": 1000.0, "recv_rate": 200.0,
+                                   "interfaces": {}, "processes": {101: (750.0, 100.0, 1), 202: (250.0, 100.0, 3)}})
+    top = accountant.top(window=10, sort="sent")
+    print(f"  Top uploader: pid {top['processes'][0]['pid']} at {top['processes'][0]['uplink_share']}% of {top['sent_rate']} B/s")
+    assert len(accountant.samples) == 3 and top["window"] == 6.0 and top["estimate"]
+    assert [row["pid"] for row in top["processes"]] == [101, 202] and top["processes"][0]["uplink_share"] == 75.0
+    print("✅ Bandwidth Accounting: PASSED\n")
+except Exception as e:
+    print(f"❌ Bandwidth Accounting: FAILED - {e}\n")
+
+# Test 18: File Entropy Scoring
+print("🔐 TEST 18: Ransomware entropy scoring")
+print("-" * 80)
+try:
+    import os
+    import tempfile
+    from pathlib import Path
+    from backend.security.security_core import SecurityMetrics
+    
+    scoring = SecurityMetrics()
+    assert scoring.calculate_entropy(b"") == 0.0 and scoring.calculate_entropy(b"aaaa") == 0.0
+    assert abs(scoring.calculate_entropy(bytes(range(256)) * 4) - 8.0) < 1e-9
+    batch = scoring.calculate_entropy_batch([b"ab" * 100, bytes(range(256)), b"zzz"])
+    assert [round(float(value), 6) for value in batch] == [1.0, 8.0, 0.0]
+    
+    with tempfile.TemporaryDirectory() as folder:
+        plain = Path(folder) / "notes.txt"
+        plain.write_bytes(b"meeting notes, nothing to see here\n" * 2000)
+        # First 4 KB left intact, the rest encrypted: only the middle/tail samples see it
+        sneaky = Path(folder) / "report.txt"
+        sneaky.write_bytes(b"%PDF-1.4 header text " * 200 + os.urandom(64 * 1024))
+        scores = scoring.entropy_scores([plain, sneaky, Path(folder) / "missing.txt"])
+        print(f"  Entropy: plain {scores[str(plain)]:.2f}, head-preserving encryption {scores[str(sneaky)]:.2f}")
+        assert scores[str(plain)] < 5 and scores[str(sneaky)] > 7.5 and len(scores) == 2
+        assert scoring.calculate_entropy(sneaky.read_bytes()[:4096]) < 7.5  # What the old head-only check saw
+        assert scoring.is_high_entropy(sneaky) and not scoring.is_high_entropy(plain)
+    print("✅ Entropy Scoring: PASSED\n")
+except Exception as e:
+    print(f"❌ Entropy Scoring: FAILED - {e}\n")
+
+# Test 19: Security Event Queue
+print("🧵 TEST 19: Security event queue")
+print("-" * 80)
+try:
+    import logging
+    import os
+    import tempfile
+    from pathlib import Path
+    from watchdog.events import FileModifiedEvent
+    from backend.security.event_queue import CoalescingDispatcher
+    from backend.security.security_core import SecurityMetrics, SecurityEventHandler
+    
+    # Repeated events for one key inside the debounce window are processed once
+    seen = []
+    dispatcher = CoalescingDispatcher(lambda items: seen.extend(items), workers=2, debounce=0.05)
+    dispatcher.start()
+    for i in range(50):
+        dispatcher.submit(f"key{i % 5}", i)
+    assert dispatcher.flush()
+    stats = dispatcher.get_stats()
+    dispatcher.stop()
+    assert sorted(item["key"] for item in seen) == [f"key{i}" for i in range(5)]
+    assert all(item["events"] == 10 for item in seen) and {item["payload"] for item in seen} == {45, 46, 47, 48, 49}
+    assert stats["coalesced"] == 45 and stats["depth"] == 0 and stats["lag_ms"] >= 50
+    
+    # The watchdog callback only enqueues; scoring happens on the workers
+    logging.getLogger("Kalpana.SecurityCore").setLevel(logging.CRITICAL)
+    scoring = SecurityMetrics()
+    handler = SecurityEventHandler(scoring, workers=4, debounce=0.05)
+    handler.queue.start()
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(20):
+            path = Path(folder) / f"doc{i}.txt"
+            path.write_bytes(os.urandom(8192) if i % 2 else b"plain text " * 800)
+            for _ in range(3):
+                handler.on_modified(FileModifiedEvent(str(path)))
+        assert handler.queue.flush()
+    queue_stats = handler.queue.get_stats()
+    handler.queue.stop()
+    print(f"  {queue_stats['submitted']} events -> {queue_stats['processed']} files in {queue_stats['batches']} batches, "
+          f"lag {queue_stats['avg_lag_ms']}ms; flagged {len(scoring.high_entropy_files)}")
+    assert queue_stats["processed"] == 20 and len(scoring.high_entropy_files) == 10
+    assert scoring.modifications.count() == 20
+    
+    # Events dropped by a full queue still count toward the rate and the score
+    flooded = SecurityMetrics()
+    handler = SecurityEventHandler(flooded, workers=1, debounce=60)
+    handler.queue.max_pending = 5
+    for i in range(30):
+        handler.on_modified(FileModifiedEvent(f"/tmp/flood/file{i}.locked"))
+    print(f"  Flood: {handler.queue.stats['dropped']} dropped, {flooded.modifications.count()} counted, score {flooded.threat_score}")
+    assert handler.queue.stats["dropped"] == 25 and flooded.modifications.count() == 25
+    assert flooded.suspicious_modifications.count() == 25 and flooded.threat_score >= 50
+    print("✅ Security Event Queue: PASSED\n")
+except Exception as e:
+    print(f"❌ Security Event Queue: FAILED - {e}\n")
+
+# Test 20: Sliding-Window Rate Counters
+print("⏲️  TEST 20: Sliding-window rate counters")
+print("-" * 80)
+try:
+    from pathlib import Path
+    from backend.security.rate_window import SlidingWindowCounter, KeyedWindowCounters
+    from backend.security.security_core import SecurityMetrics
+    
+    counter = SlidingWindowCounter(60)
+    for second in range(100):
+        counter.add(2, now=1000 + second)
+    assert counter.count(now=1099) == 120 and counter.count(5, now=1099) == 10
+    assert counter.count(5, now=1102) == 4 and counter.rate(60, now=1102) == 114 / 60
+    counter.add(now=1050)  # Late but inside the window
+    counter.add(now=1000)  # Too old: ignored
+    assert counter.count(now=1102) == 115 and counter.count(now=1200) == 0
+    
+    by_folder = KeyedWindowCounters(60, max_keys=2)
+    by_folder.add("/a", 5, now=10)
+    by_folder.add("/b", 1, now=10)
+    by_folder.add("/c", 1, now=20)  # Full and nothing idle: not tracked
+    assert by_folder.top(now=20) == [("/a", 5), ("/b", 1)]
+    by_folder.add("/c", 1, now=80)  # /a and /b have gone idle and are pruned
+    assert by_folder.top(now=80) == [("/c", 1)]
+    
+    # A quiet system scores 0 now that the suspicious-extension points need an actual suspicious file
+    quiet = SecurityMetrics()
+    assert quiet.update_threat_score() == 0
+    for i in range(12):
+        quiet.record_modification(Path(f"/home/user/docs/file{i}.locked"))
+    print(f"  12 .locked files in a burst: threat score {quiet.update_threat_score()}, "
+          f"busiest extension {quiet.modifications_by_extension.top(1)}")
+    assert quiet.threat_score == 70 and quiet.modifications_by_directory.top(1) == [("/home/user/docs", 12)]
+    
+    # Filling the extension map with junk keys cannot hide a later (upper-case) .LOCKED write
+    flooded = SecurityMetrics()
+    for i in range(1000):
+        flooded.record_modification(Path(f"/tmp/noise/file.x{i}"))
+    flooded.record_modification(Path("/home/user/docs/report.LOCKED"))
+    assert flooded.suspicious_modifications.count() == 1 and flooded.update_threat_score() >= 30
+    print("✅ Rate Counters: PASSED\n")
+except Exception as e:
+    print(f"❌ Rate Counters: FAILED - {e}\n")
+
 # Summary
 print("=" * 80)
 print("TEST SUMMARY")